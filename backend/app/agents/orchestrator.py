@@ -3,12 +3,18 @@
 Orchestrator agent - coordinates all other agents and manages workflow.
 """
 
+import asyncio
 from typing import Dict, Any, List, Optional
 from .base_agent import BaseAgent
 import logging
 from app.services.mongo_conversation_service import MongoConversationService
 from app.services.mongo_message_service import MongoMessageService
+from app.services.mongo_user_service import MongoUserService
+from .stage_graph import StageGraph
+from app.core.request_context import memoize, request_scope
+from app.services.conversation_summary import conversation_summarizer, context_messages
 from bson import ObjectId
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -49,132 +55,44 @@ class OrchestratorAgent(BaseAgent):
     
     # ADD MISSING METHOD: process_chat_request
     async def process_chat_request(self, message: str, user_id: str, conversation_id: Optional[str] = None) -> dict:
-        """Process a chat request using MCP architecture with persistent conversation memory"""
-        try:
-            self.logger.info(f"Starting chat request processing for user: {user_id}")
-            
-            # --- STEP 1: Robust User ID Resolution ---
-            mongo_user_id = None
-            user = None
-            # Try to interpret user_id as ObjectId
-            try:
-                mongo_user_id = str(ObjectId(user_id))
-                # Fetch user by ObjectId
-                self.logger.info(f"Trying to get user by ObjectId: {mongo_user_id}")
-                user = await self.crm_agent.user_service.get_user_by_id(mongo_user_id)
-                if not user:
-                    # If not found, treat as email
-                    raise Exception("User not found by ObjectId, fallback to email")
-            except Exception as e:
-                self.logger.info(f"ObjectId lookup failed: {e}, trying email approach")
-                # Not a valid ObjectId or not found, treat as email
-                # Extract user info from message if possible
-                self.logger.info("Extracting user info from message")
-                extracted_info = self.crm_agent.extract_user_info(message)
-                self.logger.info(f"Extracted info: {extracted_info}")
-                email = user_id if "@" in user_id else (extracted_info.get("email") if extracted_info else None)
-                user_info = {"email": email}
-                if extracted_info:
-                    user_info.update(extracted_info)
-                self.logger.info(f"User info for get_or_create_user: {user_info}")
-                user = await self.crm_agent.get_or_create_user(user_info)
-                mongo_user_id = str(user["_id"])
-            if user is None:
-                raise ValueError("User not found or could not be created.")
-            # --- END STEP 1 ---
-            # CRM actions: log user creation/update (placeholder logic)
-            crm_actions = []
-            if user.get('created', False):
-                crm_actions.append({"action": "user_created", "user_id": mongo_user_id})
-            else:
-                crm_actions.append({"action": "user_found", "user_id": mongo_user_id})
-            # CRM context: user info
-            crm_context = {k: v for k, v in user.items() if k != '_id'}
-            crm_context['user_id'] = mongo_user_id
-            # If there are any ObjectIds in crm_context, convert them to strings
-            for k, v in crm_context.items():
-                if hasattr(v, 'binary') and hasattr(v, '__str__'):
-                    crm_context[k] = str(v)
-            # Step 1: Ensure conversation exists
-            if not conversation_id:
-                conversation = await MongoConversationService.create_conversation(mongo_user_id)
-                conversation_id = str(conversation["_id"])
-            else:
-                conversation = await MongoConversationService.get_conversation(conversation_id)
-                if not conversation:
-                    conversation = await MongoConversationService.create_conversation(mongo_user_id)
-                    conversation_id = str(conversation["_id"])
-
-            # Step 2: Store user message
-            await MongoMessageService.add_message(conversation_id, "user", message)
+        """Process a chat request using MCP architecture with persistent conversation memory.
 
-            # Step 3: Retrieve conversation history (last 10 messages)
-            history = await MongoMessageService.get_messages_for_conversation(conversation_id)
-            # Optionally, use history for LLM context in the future
+        The turn runs as a graph of async stages: retrieval and extraction run
+        alongside user and conversation setup, and only the response stage
+        waits for all of them.
+        """
+        with request_scope():
+            return await self._process_chat_request(message, user_id, conversation_id)
 
-            # Step 4: Get RAG context
-            rag_context = await self.rag_agent.retrieve_context(message)
-
-            # Step 5: Extract user info (pass only message)
-            extracted_info = self.crm_agent.extract_user_info(message)
-            # If new info is found, update user record
-            if extracted_info:
-                update_data = {k: v for k, v in extracted_info.items() if v and (not user.get(k) or user.get(k) != v)}
-                if update_data:
-                    await self.crm_agent.user_service.update_user(str(user["_id"]), update_data)
-                    user.update(update_data)
-                    crm_context.update(update_data)
+    async def _process_chat_request(self, message: str, user_id: str, conversation_id: Optional[str]) -> dict:
+        try:
+            self.logger.info(f"Starting chat request processing for user: {user_id}")
 
-            # Step 6: Generate response (simplified for now)
-            if self.chat_agent:
-                chat_result = self.chat_agent.process(message)
-                response = chat_result["response"] if isinstance(chat_result, dict) and "response" in chat_result else str(chat_result)
-            else:
-                try:
-                    # Build context-aware prompt
-                    context_parts = []
-                    
-                    # Add CRM context if available
-                    if crm_context:
-                        if crm_context.get("name"):
-                            context_parts.append(f"User name: {crm_context['name']}")
-                        if crm_context.get("company"):
-                            context_parts.append(f"User company: {crm_context['company']}")
-                        if crm_context.get("email"):
-                            context_parts.append(f"User email: {crm_context['email']}")
-                        if crm_context.get("phone"):
-                            context_parts.append(f"User phone: {crm_context['phone']}")
-                        if crm_context.get("budget"):
-                            context_parts.append(f"User budget: {crm_context['budget']}")
-                        if crm_context.get("property_type"):
-                            context_parts.append(f"User property preference: {crm_context['property_type']}")
-                        if crm_context.get("lease_terms"):
-                            context_parts.append(f"User lease terms: {', '.join(crm_context['lease_terms'])}")
-                        if crm_context.get("collaboration_status"):
-                            context_parts.append(f"User collaboration status: {', '.join(crm_context['collaboration_status'])}")
-                    
-                    # Add extracted info from current message
-                    if extracted_info:
-                        if extracted_info.get("lease_terms"):
-                            context_parts.append(f"Current lease discussion: {', '.join(extracted_info['lease_terms'])}")
-                        if extracted_info.get("collaboration_status"):
-                            context_parts.append(f"Current collaboration request: {', '.join(extracted_info['collaboration_status'])}")
-                    
-                    # Generate context-aware response
-                    if context_parts:
-                        # Use context for personalized response
-                        response = self._generate_meaningful_response(message, rag_context, extracted_info, crm_context)
-                    else:
-                        response = self._generate_meaningful_response(message, rag_context, extracted_info)
-                    
-                    if not response:
-                        response = "I understand you're interested in real estate. How can I help you today?"
-                except Exception as e:
-                    self.logger.error(f"Error generating response: {e}")
-                    response = "I understand you're interested in real estate. How can I help you today?"
+            graph = StageGraph()
+            graph.add_stage("user", lambda r: memoize(("user", user_id), lambda: self._resolve_user(message, user_id)))
+            graph.add_stage("retrieval", lambda r: memoize(("retrieval", message), lambda: self.rag_agent.retrieve_context(message)))
+            graph.add_stage("extraction", lambda r: self._extract_user_info(message))
+            graph.add_stage("conversation", lambda r: self._ensure_conversation(conversation_id, r["user"]["user_id"]), ["user"])
+            graph.add_stage("store_user_message", lambda r: MongoMessageService.add_message(r["conversation"], "user", message, deferred=True), ["conversation"])
+            # Step 3: Retrieve conversation history (last HISTORY_WINDOW messages)
+            graph.add_stage("history", lambda r: MongoMessageService.get_recent_messages(r["conversation"]), ["store_user_message"])
+            # Rolling summary and facts of the turns older than the history window
+            graph.add_stage("memory", lambda r: conversation_summarizer.load(r["conversation"]), ["conversation"])
+            graph.add_stage("update_user", lambda r: self._update_user_from_extraction(r["user"], r["extraction"]), ["user", "extraction"])
+            graph.add_stage("response", lambda r: self._respond(message, r["retrieval"], r["extraction"], r["user"]["crm_context"], r["memory"], r["history"]), ["retrieval", "extraction", "update_user", "memory", "history"])
+            # Stored after the user message so history keeps turn order
+            graph.add_stage("store_assistant_message", lambda r: MongoMessageService.add_message(r["conversation"], "assistant", r["response"], deferred=True), ["response", "store_user_message"])
+            graph.add_stage("record_turn", lambda r: conversation_summarizer.record_turn(r["conversation"], r["extraction"]), ["store_assistant_message"])
+            results = await graph.run()
 
-            # Step 7: Store assistant response
-            await MongoMessageService.add_message(conversation_id, "assistant", response)
+            mongo_user_id = results["user"]["user_id"]
+            conversation_id = results["conversation"]
+            crm_actions = results["user"]["crm_actions"]
+            crm_context = results["user"]["crm_context"]
+            rag_context = results["retrieval"]
+            extracted_info = results["extraction"]
+            history = results["history"]
+            response = results["response"]
 
             logger.info(f"Processed chat for user {mongo_user_id}: {message[:50]}...")
 
@@ -202,8 +120,11 @@ class OrchestratorAgent(BaseAgent):
                             # Include non-property documents as well
                             properties.append(item)
             conversation_history = history if history else []
-            from datetime import datetime
-            metadata = {"timestamp": datetime.utcnow().isoformat(), "model": "gpt-4-0613"}
+            metadata = {
+                "timestamp": datetime.utcnow().isoformat(),
+                "model": "gpt-4-0613",
+                "stage_timings": graph.timing_report(),
+            }
 
             result = {
                 "response": response,
@@ -234,6 +155,138 @@ class OrchestratorAgent(BaseAgent):
             import traceback
             self.logger.error(f"Full traceback: {traceback.format_exc()}")
             return {"response": "I apologize, but I encountered an error processing your request. Please try again.", "extracted_info": None}
+
+    async def _extract_user_info(self, message: str) -> Dict:
+        """Stage wrapper around the (synchronous) CRM extractor, run once per request."""
+        async def extract():
+            # Off the event loop, so the other stages (and other requests) keep running meanwhile
+            return await asyncio.to_thread(self.crm_agent.extract_user_info, message)
+        return await memoize(("crm_agent.extraction", message), extract)
+
+    async def _resolve_user(self, message: str, user_id: str) -> Dict[str, Any]:
+        """Robust user ID resolution: ObjectId lookup first, then get-or-create by email."""
+        mongo_user_id = None
+        user = None
+        # Try to interpret user_id as ObjectId
+        try:
+            mongo_user_id = str(ObjectId(user_id))
+            # Fetch user by ObjectId
+            self.logger.info(f"Trying to get user by ObjectId: {mongo_user_id}")
+            user = await self.crm_agent.user_service.get_user_by_id(mongo_user_id)
+            if not user:
+                # If not found, treat as email
+                raise Exception("User not found by ObjectId, fallback to email")
+        except Exception as e:
+            self.logger.info(f"ObjectId lookup failed: {e}, trying email approach")
+            # Not a valid ObjectId or not found, treat as email
+            # Extract user info from message if possible
+            self.logger.info("Extracting user info from message")
+            # Shared with the extraction stage, so the extractor runs only once
+            extracted_info = await self._extract_user_info(message)
+            self.logger.info(f"Extracted info: {extracted_info}")
+            email = user_id if "@" in user_id else (extracted_info.get("email") if extracted_info else None)
+            user_info = {"email": email}
+            if extracted_info:
+                user_info.update(extracted_info)
+            # Known users come from the profile cache; the update stage applies new extracted info
+            user = await self.crm_agent.user_service.get_user_by_email(email) if email else None
+            if user is None:
+                self.logger.info(f"User info for get_or_create_user: {user_info}")
+                user = await self.crm_agent.get_or_create_user(user_info)
+                # Clears the cached "not found" for this email
+                MongoUserService.invalidate(str(user["_id"]), email)
+            mongo_user_id = str(user["_id"])
+        if user is None:
+            raise ValueError("User not found or could not be created.")
+        # CRM actions: log user creation/update (placeholder logic)
+        crm_actions = []
+        if user.get('created', False):
+            crm_actions.append({"action": "user_created", "user_id": mongo_user_id})
+        else:
+            crm_actions.append({"action": "user_found", "user_id": mongo_user_id})
+        # CRM context: user info
+        crm_context = {k: v for k, v in user.items() if k != '_id'}
+        crm_context['user_id'] = mongo_user_id
+        # If there are any ObjectIds in crm_context, convert them to strings
+        for k, v in crm_context.items():
+            if hasattr(v, 'binary') and hasattr(v, '__str__'):
+                crm_context[k] = str(v)
+        return {"user": user, "user_id": mongo_user_id, "crm_actions": crm_actions, "crm_context": crm_context}
+
+    async def _ensure_conversation(self, conversation_id: Optional[str], mongo_user_id: str) -> str:
+        """Return the id of the existing conversation, creating one if needed."""
+        if conversation_id:
+            conversation = await MongoConversationService.get_conversation(conversation_id)
+            if conversation:
+                return conversation_id
+        conversation = await MongoConversationService.create_conversation(mongo_user_id, deferred=True)
+        return str(conversation["_id"])
+
+    async def _update_user_from_extraction(self, resolved: Dict[str, Any], extracted_info: Dict) -> None:
+        """If new info is found, update the user record and CRM context."""
+        if not extracted_info:
+            return
+        user = resolved["user"]
+        update_data = {k: v for k, v in extracted_info.items() if v and (not user.get(k) or user.get(k) != v)}
+        if update_data:
+            await self.crm_agent.user_service.update_user(str(user["_id"]), update_data)
+            user.update(update_data)
+            resolved["crm_context"].update(update_data)
+
+    async def _respond(self, message: str, rag_context: List[Dict], extracted_info: Dict, crm_context: Dict,
+                       memory: Optional[Dict] = None, recent: Optional[List[Dict]] = None) -> str:
+        """Generate the assistant reply from the rolling summary, facts and recent window (simplified for now)."""
+        # Same bounded prompt context as the LLM paths: summary + facts, then the last HISTORY_WINDOW messages
+        context = context_messages(memory, recent)
+        # Facts remembered from earlier turns fill gaps in the CRM record
+        if memory and memory.get("facts"):
+            crm_context = {**{k: v for k, v in memory["facts"].items() if v}, **{k: v for k, v in crm_context.items() if v}}
+        if self.chat_agent:
+            chat_result = self.chat_agent.process(message)
+            return chat_result["response"] if isinstance(chat_result, dict) and "response" in chat_result else str(chat_result)
+        try:
+            # Build context-aware prompt
+            context_parts = []
+
+            # Add CRM context if available
+            if crm_context:
+                if crm_context.get("name"):
+                    context_parts.append(f"User name: {crm_context['name']}")
+                if crm_context.get("company"):
+                    context_parts.append(f"User company: {crm_context['company']}")
+                if crm_context.get("email"):
+                    context_parts.append(f"User email: {crm_context['email']}")
+                if crm_context.get("phone"):
+                    context_parts.append(f"User phone: {crm_context['phone']}")
+                if crm_context.get("budget"):
+                    context_parts.append(f"User budget: {crm_context['budget']}")
+                if crm_context.get("property_type"):
+                    context_parts.append(f"User property preference: {crm_context['property_type']}")
+                if crm_context.get("lease_terms"):
+                    context_parts.append(f"User lease terms: {', '.join(crm_context['lease_terms'])}")
+                if crm_context.get("collaboration_status"):
+                    context_parts.append(f"User collaboration status: {', '.join(crm_context['collaboration_status'])}")
+
+            # Add extracted info from current message
+            if extracted_info:
+                if extracted_info.get("lease_terms"):
+                    context_parts.append(f"Current lease discussion: {', '.join(extracted_info['lease_terms'])}")
+                if extracted_info.get("collaboration_status"):
+                    context_parts.append(f"Current collaboration request: {', '.join(extracted_info['collaboration_status'])}")
+
+            # Generate context-aware response
+            if context_parts:
+                # Use context for personalized response
+                response = self._generate_meaningful_response(message, rag_context, extracted_info, crm_context, context)
+            else:
+                response = self._generate_meaningful_response(message, rag_context, extracted_info, context=context)
+
+            if not response:
+                response = "I understand you're interested in real estate. How can I help you today?"
+            return response
+        except Exception as e:
+            self.logger.error(f"Error generating response: {e}")
+            return "I understand you're interested in real estate. How can I help you today?"
         
     def register_agent(self, agent: BaseAgent) -> None:
         """Register an agent with the orchestrator."""
@@ -317,14 +370,20 @@ class OrchestratorAgent(BaseAgent):
             capabilities.extend(agent.get_capabilities())
         return list(set(capabilities))  # Remove duplicates
 
-    def _generate_meaningful_response(self, message: str, rag_context: List[Dict], extracted_info: Dict, crm_context: Optional[Dict] = None) -> str:
-        """Generate a response based on RAG context and extracted user info. Now detects greetings and responds conversationally."""
+    def _generate_meaningful_response(self, message: str, rag_context: List[Dict], extracted_info: Dict, crm_context: Optional[Dict] = None,
+                                      context: Optional[List[Dict]] = None) -> str:
+        """Generate a response based on RAG context, extracted user info and conversation context. Now detects greetings and responds conversationally."""
         # Simple greeting detection
         greetings = ["hello", "hi", "hey", "good morning", "good afternoon", "good evening", "greetings"]
         msg_lower = message.strip().lower()
         
+        # Earlier turns of this conversation: the summary/facts message, or messages before the current one
+        context = context or []
+        summary = next((m["content"] for m in context if m["role"] == "system"), None)
+        earlier_turns = [m for m in context if m["role"] != "system"][:-1]
+
         # Check if this is a return conversation (user has history)
-        has_history = len(rag_context) > 0 or extracted_info or crm_context
+        has_history = len(rag_context) > 0 or extracted_info or crm_context or summary or earlier_turns
         
         if any(greet in msg_lower for greet in greetings):
             if has_history:
@@ -409,6 +468,9 @@ class OrchestratorAgent(BaseAgent):
                 return "Here's what I found related to your search:\n\n" + "\n".join(summaries)
         else:
             # No RAG results, provide helpful guidance
+            recap = next((line for line in (summary or "").splitlines() if line.startswith("Conversation so far:")), None)
+            if recap:
+                return f"Picking up where we left off. {recap}\n\nI can help you with property searches, schedule viewings, or answer questions about the market. What would you like to explore next?"
             if has_history:
                 return "I understand you're interested in real estate. Based on your previous interactions, I can help you with property searches, schedule viewings, or answer questions about the market. What would you like to explore?"
             else:
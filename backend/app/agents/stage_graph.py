@@ -0,0 +1,87 @@
+# app/agents/stage_graph.py
+"""
+Small dependency graph of async stages.
+
+Each stage starts as soon as the stages it depends on have finished, so
+independent branches run concurrently and end-to-end latency approaches
+the critical path. Per-stage timings are kept for response metadata.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+StageFn = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class StageGraph:
+    """Runs async stages in dependency order, concurrently where possible."""
+
+    def __init__(self):
+        self.stages: Dict[str, Tuple[StageFn, Tuple[str, ...]]] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self.total_ms = 0.0
+
+    def add_stage(self, name: str, fn: StageFn, depends_on: Iterable[str] = ()) -> None:
+        """Add a stage; dependencies must already be registered (keeps the graph acyclic)."""
+        depends_on = tuple(depends_on)
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' already defined")
+        missing = [dep for dep in depends_on if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stages: {missing}")
+        self.stages[name] = (fn, depends_on)
+
+    async def run(self) -> Dict[str, Any]:
+        """Execute all stages and return their results keyed by stage name."""
+        origin = time.perf_counter()
+        tasks: Dict[str, asyncio.Future] = {}
+
+        async def run_stage(name: str):
+            fn, depends_on = self.stages[name]
+            if depends_on:
+                await asyncio.gather(*(tasks[dep] for dep in depends_on))
+            started = time.perf_counter()
+            result = await fn(self.results)
+            finished = time.perf_counter()
+            self.results[name] = result
+            self.timings[name] = {
+                "start_ms": round((started - origin) * 1000, 2),
+                "duration_ms": round((finished - started) * 1000, 2),
+            }
+            return result
+
+        for name in self.stages:
+            tasks[name] = asyncio.ensure_future(run_stage(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+            self.total_ms = round((time.perf_counter() - origin) * 1000, 2)
+        return self.results
+
+    def critical_path(self) -> List[str]:
+        """Chain of stages that determined the finish time."""
+        if not self.timings:
+            return []
+        end = lambda n: self.timings[n]["start_ms"] + self.timings[n]["duration_ms"]
+        path = [max(self.timings, key=end)]
+        while True:
+            depends_on = [dep for dep in self.stages[path[-1]][1] if dep in self.timings]
+            if not depends_on:
+                break
+            path.append(max(depends_on, key=end))
+        return path[::-1]
+
+    def timing_report(self) -> Dict[str, Any]:
+        """Per-stage timings, total wall time and the critical path."""
+        path = self.critical_path()
+        return {
+            "stages": self.timings,
+            "total_ms": self.total_ms,
+            "critical_path": path,
+            "critical_path_ms": round(sum(self.timings[n]["duration_ms"] for n in path), 2),
+        }
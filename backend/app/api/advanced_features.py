@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Depends
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 from app.services.rag_service import RAGService
@@ -6,16 +6,17 @@ from app.services.crm_service import CRMService
 from app.services.analytics_service import AnalyticsService
 from app.services.mongo_message_service import MongoMessageService
 from app.services.mongo_conversation_service import MongoConversationService
+from app.services.write_behind import write_behind
+from app.services.conversation_summary import conversation_summarizer, context_messages
+from app.core.container import get_rag_service, get_crm_service, get_analytics_service
 from datetime import datetime
-from app.core.mongo import db
+from app.core.ids import normalize_ref
+from app.services.conversation_cache import conversation_cache
+from app.services.search_trends import search_trends
 
 router = APIRouter(prefix="/advanced", tags=["advanced_features"])
 
-# Initialize services
-rag_service = RAGService()
-crm_service = CRMService()
-analytics_service = AnalyticsService()
-
+# Services are per-worker singletons injected from the app container
 # Utility function to fix MongoDB ObjectId serialization
 def fix_mongo_id(doc):
     if not doc:
@@ -34,13 +35,14 @@ def fix_mongo_ids(docs):
 
 # RAG Endpoints
 @router.get("/properties/search")
-async def search_properties(query: str, limit: int = 5):
+async def search_properties(query: str, limit: int = 5, rag_service: RAGService = Depends(get_rag_service)):
     """Search for properties based on user query"""
     properties = await rag_service.search_properties(query, limit)
+    search_trends.record("properties_search", query, results=properties)
     return {"query": query, "properties": fix_mongo_ids(properties)}
 
 @router.get("/properties/{property_id}")
-async def get_property_details(property_id: str):
+async def get_property_details(property_id: str, rag_service: RAGService = Depends(get_rag_service)):
     """Get detailed information about a specific property"""
     property_details = await rag_service.get_property_details(property_id)
     if not property_details:
@@ -48,7 +50,7 @@ async def get_property_details(property_id: str):
     return fix_mongo_id(property_details)
 
 @router.post("/properties/generate-response")
-async def generate_property_response(query: str):
+async def generate_property_response(query: str, rag_service: RAGService = Depends(get_rag_service)):
     """Generate AI response about properties"""
     properties = await rag_service.search_properties(query)
     response = await rag_service.generate_property_response(query, properties)
@@ -56,80 +58,80 @@ async def generate_property_response(query: str):
 
 # CRM Endpoints
 @router.post("/leads/extract-info")
-async def extract_user_info(message: str, user_id: str):
+async def extract_user_info(message: str, user_id: str, crm_service: CRMService = Depends(get_crm_service)):
     """Extract user information from message"""
     extracted_info = await crm_service.extract_user_info(message, user_id)
     return {"user_id": user_id, "extracted_info": extracted_info}
 
 @router.post("/leads/create")
-async def create_lead(user_id: str, extracted_info: dict):
+async def create_lead(user_id: str, extracted_info: dict, crm_service: CRMService = Depends(get_crm_service)):
     """Create a new lead"""
     lead = await crm_service.create_lead(user_id, extracted_info)
     return fix_mongo_id(lead)
 
 @router.get("/leads/user/{user_id}")
-async def get_leads_by_user(user_id: str):
+async def get_leads_by_user(user_id: str, crm_service: CRMService = Depends(get_crm_service)):
     """Get all leads for a user"""
     leads = await crm_service.get_leads_by_user(user_id)
     return fix_mongo_ids(leads)
 
 @router.get("/leads/followup")
-async def get_leads_needing_followup():
+async def get_leads_needing_followup(crm_service: CRMService = Depends(get_crm_service)):
     """Get leads that need follow-up"""
     leads = await crm_service.get_leads_needing_followup()
     return fix_mongo_ids(leads)
 
 @router.put("/leads/{lead_id}")
-async def update_lead(lead_id: str, updates: dict):
+async def update_lead(lead_id: str, updates: dict, crm_service: CRMService = Depends(get_crm_service)):
     """Update lead information"""
     result = await crm_service.update_lead(lead_id, updates)
     return result
 
 @router.post("/leads/{lead_id}/notes")
-async def add_note_to_lead(lead_id: str, note: str):
+async def add_note_to_lead(lead_id: str, note: str, crm_service: CRMService = Depends(get_crm_service)):
     """Add a note to a lead"""
     result = await crm_service.add_note_to_lead(lead_id, note)
     return result
 
 @router.post("/leads/{lead_id}/schedule-followup")
-async def schedule_followup(lead_id: str, days_from_now: int = 1):
+async def schedule_followup(lead_id: str, days_from_now: int = 1, crm_service: CRMService = Depends(get_crm_service)):
     """Schedule a follow-up for a lead"""
     result = await crm_service.schedule_followup(lead_id, days_from_now)
     return result
 
 # Analytics Endpoints
 @router.get("/analytics/conversation-stats")
-async def get_conversation_stats(user_id: Optional[str] = None):
+async def get_conversation_stats(user_id: Optional[str] = None, analytics_service: AnalyticsService = Depends(get_analytics_service)):
     """Get conversation statistics"""
     stats = await analytics_service.get_conversation_stats(user_id)
     return stats
 
 @router.get("/analytics/user-engagement")
-async def get_user_engagement(days: int = 30):
+async def get_user_engagement(days: int = 30, analytics_service: AnalyticsService = Depends(get_analytics_service)):
     """Get user engagement metrics"""
     engagement = await analytics_service.get_user_engagement(days)
     return engagement
 
 @router.get("/analytics/lead-conversion")
-async def get_lead_conversion_stats():
+async def get_lead_conversion_stats(analytics_service: AnalyticsService = Depends(get_analytics_service)):
     """Get lead conversion statistics"""
     stats = await analytics_service.get_lead_conversion_stats()
     return stats
 
 @router.get("/analytics/property-trends")
-async def get_property_search_trends():
+async def get_property_search_trends(days: int = 30, limit: int = 10, analytics_service: AnalyticsService = Depends(get_analytics_service)):
     """Get property search trends"""
-    trends = await analytics_service.get_property_search_trends()
+    trends = await analytics_service.get_property_search_trends(days, limit)
     return trends
 
 @router.get("/analytics/user-journey/{user_id}")
-async def get_user_journey_insights(user_id: str):
+async def get_user_journey_insights(user_id: str, analytics_service: AnalyticsService = Depends(get_analytics_service)):
     """Get insights about a specific user's journey"""
     insights = await analytics_service.get_user_journey_insights(user_id)
     return insights
 
 @router.get("/analytics/daily-activity")
-async def get_daily_activity(days: int = 7):
+async def get_daily_activity(days: int = 7, analytics_service: AnalyticsService = Depends(get_analytics_service)):
     """Get daily activity for the last N days"""
     activity = await analytics_service.get_daily_activity(days)
     return activity
@@ -151,7 +153,7 @@ class SmartChatResponse(BaseModel):
 
 # Combined Chat with RAG and CRM
 @router.post("/smart-chat", response_model=SmartChatResponse)
-async def smart_chat_endpoint(request: SmartChatRequest):
+async def smart_chat_endpoint(request: SmartChatRequest, rag_service: RAGService = Depends(get_rag_service), crm_service: CRMService = Depends(get_crm_service)):
     import time
     start = time.time()
     
@@ -166,7 +168,9 @@ async def smart_chat_endpoint(request: SmartChatRequest):
     else:
         user_id = request.user_id
     
-    conversation_id = request.conversation_id
+    # Unknown or malformed ids start a new conversation
+    conversation = await MongoConversationService.get_conversation(request.conversation_id) if request.conversation_id else None
+    conversation_id = str(conversation["_id"]) if conversation else None
 
     # 2. Extract CRM info
     extracted_info = await crm_service.extract_user_info(request.message, user_id)
@@ -174,41 +178,34 @@ async def smart_chat_endpoint(request: SmartChatRequest):
     # 3. RAG property search
     properties = await rag_service.search_properties(request.message)
     sources = [p.get("id", p.get("property_id", "")) for p in properties] if properties else []
-
-    # 4. Generate AI response
-    ai_response = await rag_service.generate_property_response(request.message, properties)
-
-    # 5. Conversation management - use string IDs instead of ObjectId
+    search_trends.record("smart_chat", request.message, extracted_info, properties, user_id)
+
+    # 4. Generate AI response from the rolling summary + recent window
+    context = []
+    if conversation_id:
+        memory = await conversation_summarizer.load(conversation_id)
+        recent = await MongoMessageService.get_recent_messages(conversation_id)
+        context = context_messages(memory, recent)
+    ai_response = await rag_service.generate_property_response(request.message, properties, context)
+
+    # 5. Conversation management - ids are stored in canonical form (app/core/ids.py)
+    # Writes below go through the write-behind queue and land after we respond
     if not conversation_id:
-        # Create conversation with string user_id
         conv = {
-            "user_id": user_id,  # Use string, not ObjectId
+            "user_id": normalize_ref(user_id),  # opaque session ids stay strings
             "started_at": datetime.utcnow(),
         }
-        result = await db.conversations.insert_one(conv)
-        conversation_id = str(result.inserted_id)
-
-    # 6. Save messages - use string conversation_id
-    user_msg = {
-        "conversation_id": conversation_id,  # Use string, not ObjectId
-        "role": "user",
-        "content": request.message,
-        "created_at": datetime.utcnow(),
-    }
-    await db.messages.insert_one(user_msg)
-    
-    assistant_msg = {
-        "conversation_id": conversation_id,  # Use string, not ObjectId
-        "role": "assistant", 
-        "content": ai_response,
-        "created_at": datetime.utcnow(),
-    }
-    await db.messages.insert_one(assistant_msg)
-
-    # 7. CRM lead management
-    leads = await crm_service.get_leads_by_user(user_id)
-    if not leads:
-        await crm_service.create_lead(user_id, extracted_info)
+        conv = await write_behind.insert("conversations", conv)
+        conversation_cache.put_conversation(conv, new=True)
+        conversation_id = str(conv["_id"])
+
+    # 6. Save messages (conversation_id stored as ObjectId)
+    await MongoMessageService.add_message(conversation_id, "user", request.message, deferred=True)
+    await MongoMessageService.add_message(conversation_id, "assistant", ai_response, deferred=True)
+
+    # 7. CRM lead management (created only if the user has none)
+    await crm_service.queue_lead_upsert(user_id, extracted_info)
+    await conversation_summarizer.record_turn(conversation_id, extracted_info)
 
     # 8. Compose CRM data for response
     crm_data_captured = extracted_info or {}
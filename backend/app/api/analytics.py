@@ -1,26 +1,103 @@
-from fastapi import APIRouter, Query
-from app.services.analytics_service import AnalyticsService
-from typing import Optional
+from fastapi import APIRouter, Query, Depends, HTTPException, Response
+from app.services.analytics_cache import AnalyticsCache
+from app.core.container import AppContainer, get_container, get_analytics_cache
+from app.services.mongo_user_service import user_cache
+from typing import Any, Optional
+from datetime import datetime
 
 router = APIRouter(prefix="/analytics", tags=["analytics"])
-analytics_service = AnalyticsService()
+
+async def _cached(response: Response, cache: AnalyticsCache, method: str, *args: Any) -> Any:
+    """Serve an AnalyticsService result from the cache, with Age/X-Cache headers."""
+    value, age, status = await cache.call(method, *args)
+    response.headers.update(cache.headers(method, age, status))
+    return value
 
 @router.get("/rag-metrics")
-async def rag_metrics():
-    return await analytics_service.get_rag_metrics()
+async def rag_metrics(response: Response, cache: AnalyticsCache = Depends(get_analytics_cache)):
+    return await _cached(response, cache, "get_rag_metrics")
 
 @router.get("/crm-insights")
-async def crm_insights():
-    return await analytics_service.get_crm_insights()
+async def crm_insights(response: Response, cache: AnalyticsCache = Depends(get_analytics_cache)):
+    return await _cached(response, cache, "get_crm_insights")
 
 @router.get("/lead-scores")
-async def lead_scores():
-    return await analytics_service.get_lead_scores()
+async def lead_scores(response: Response, limit: int = Query(100, ge=1, le=1000), cache: AnalyticsCache = Depends(get_analytics_cache)):
+    return await _cached(response, cache, "get_lead_scores", limit)
+
+@router.get("/search-trends")
+async def search_trends(
+    response: Response,
+    days: int = Query(30, ge=1, le=366),
+    limit: int = Query(10, ge=1, le=100),
+    cache: AnalyticsCache = Depends(get_analytics_cache),
+):
+    """Popular locations, property types, price bands, bedrooms, queries and results."""
+    return await _cached(response, cache, "get_property_search_trends", days, limit)
 
 @router.get("/conversation-stats")
-async def conversation_stats(user_id: Optional[str] = Query(None)):
-    return await analytics_service.get_conversation_stats(user_id)
+async def conversation_stats(response: Response, user_id: Optional[str] = Query(None), cache: AnalyticsCache = Depends(get_analytics_cache)):
+    return await _cached(response, cache, "get_conversation_stats", user_id)
 
 @router.get("/user-engagement")
-async def user_engagement(days: int = Query(30)):
-    return await analytics_service.get_user_engagement(days) 
\ No newline at end of file
+async def user_engagement(response: Response, days: int = Query(30), cache: AnalyticsCache = Depends(get_analytics_cache)):
+    return await _cached(response, cache, "get_user_engagement", days)
+
+@router.get("/activity")
+async def activity(
+    response: Response,
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    granularity: str = Query("day", pattern="^(hour|day|week)$"),
+    cache: AnalyticsCache = Depends(get_analytics_cache),
+):
+    """Conversations, messages and leads per bucket in [start, end); defaults to the last 30 days."""
+    try:
+        return await _cached(response, cache, "get_activity", start, end, granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Dashboard section -> AnalyticsService method
+DASHBOARD_SECTIONS = {
+    "user_engagement": "get_user_engagement",
+    "conversation_stats": "get_conversation_stats",
+    "rag_metrics": "get_rag_metrics",
+    "crm_insights": "get_crm_insights",
+    "lead_conversion": "get_lead_conversion_stats",
+    "daily_activity": "get_daily_activity",
+    "search_trends": "get_property_search_trends",
+}
+DEFAULT_DASHBOARD_FIELDS = "user_engagement,conversation_stats,rag_metrics,crm_insights"
+
+@router.get("/dashboard")
+async def dashboard(
+    response: Response,
+    fields: str = Query(DEFAULT_DASHBOARD_FIELDS, description=f"Comma-separated sections: {', '.join(DASHBOARD_SECTIONS)}"),
+    days: int = Query(30, description="Period for user_engagement"),
+    cache: AnalyticsCache = Depends(get_analytics_cache),
+):
+    """All dashboard sections in one response, computed concurrently (each through the analytics cache)."""
+    sections = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in sections if name not in DASHBOARD_SECTIONS]
+    if unknown or not sections:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(unknown)}" if unknown else "No sections requested")
+    args = {"user_engagement": (days,)}
+    values, errors, headers = await cache.call_many({name: (DASHBOARD_SECTIONS[name], args.get(name, ())) for name in sections})
+    response.headers.update(headers)
+    if errors:
+        values["errors"] = errors
+    return values
+
+@router.get("/model-latency")
+async def model_latency(container: AppContainer = Depends(get_container)):
+    """Per-model latency histograms, routing table, rate limiter and hedging stats."""
+    return container.llm.snapshot()
+
+@router.get("/caches")
+async def cache_stats(container: AppContainer = Depends(get_container)):
+    """Size, memory and hit rates of the in-process caches."""
+    return {
+        "conversations": container.conversation_cache.snapshot(),
+        "users": user_cache.snapshot(),
+        "analytics": container.analytics_cache.snapshot(),
+    }
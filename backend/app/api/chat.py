@@ -1,11 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional
 import logging
 
-# MCP Integration - FIXED import path
-from app.agents.orchestrator import AgentOrchestrator 
+# MCP Integration - orchestrator is a per-worker singleton from the app container
+from app.core.container import AppContainer, get_container
+from app.services.search_trends import search_trends
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -34,7 +35,7 @@ class ChatResponse(BaseModel):
     metadata: Optional[dict] = None
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, container: AppContainer = Depends(get_container)):
     """
     Chat endpoint using MCP orchestrator - handles RAG + CRM + AI response
     """
@@ -43,8 +44,10 @@ async def chat_endpoint(request: ChatRequest):
     try:
         logger.info(f"Processing chat request: {request.message[:50]}...")
         
-        # Initialize MCP orchestrator
-        orchestrator = AgentOrchestrator()
+        # Shared MCP orchestrator (built once at startup)
+        orchestrator = container.orchestrator
+        if orchestrator is None:
+            raise RuntimeError("Chat orchestrator is not available")
         
         # Generate user_id if not provided
         user_id = request.user_id or f"user_{int(datetime.utcnow().timestamp())}"
@@ -71,6 +74,7 @@ async def chat_endpoint(request: ChatRequest):
         if extracted_info:
             crm_data_captured.update(extracted_info)
         properties = result.get("properties", [])
+        search_trends.record("chat", request.message, extracted_info, rag_sources, user_id)
         conversation_history = result.get("conversation_history", [])
         metadata = result.get("metadata")
         
@@ -114,10 +118,12 @@ async def chat_endpoint(request: ChatRequest):
 
 # Health check endpoint for MCP system
 @router.get("/chat/health")
-async def chat_health_check():
+async def chat_health_check(container: AppContainer = Depends(get_container)):
     """Health check for MCP chat system"""
     try:
-        orchestrator = AgentOrchestrator()
+        orchestrator = container.orchestrator
+        if orchestrator is None:
+            raise RuntimeError("Chat orchestrator is not available")
         
         agent_status = {
             "rag_agent": "available" if orchestrator.rag_agent else "unavailable",
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from datetime import datetime
+from app.services.exports import EXPORTS, FORMATS, build_query, export_chunks
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+@router.get("/{kind}")
+async def export_collection(
+    kind: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    start: Optional[datetime] = Query(None, description="Inclusive lower bound of the export's date field"),
+    end: Optional[datetime] = Query(None, description="Exclusive upper bound of the export's date field"),
+    user_id: Optional[str] = Query(None, description="conversations and leads only"),
+    conversation_id: Optional[str] = Query(None, description="messages only"),
+    status: Optional[str] = Query(None, description="leads only"),
+    gzip: bool = Query(False, description="Send a .gz file"),
+):
+    """
+    Stream users, conversations, messages or leads as NDJSON or CSV, oldest first.
+    Rows are read and sent in batches, so large exports start immediately.
+    """
+    if kind not in EXPORTS:
+        raise HTTPException(404, f"Unknown export {kind!r}; expected one of: {', '.join(EXPORTS)}")
+    filters = {"user_id": user_id, "conversation_id": conversation_id, "status": status}
+    try:
+        query = build_query(kind, start, end, **filters)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    filename = f"{kind}-{datetime.utcnow():%Y%m%dT%H%M%S}.{format}"
+    media_type = FORMATS[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export_chunks(kind, format, query, compress=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
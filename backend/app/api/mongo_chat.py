@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from typing import Optional
 from app.services.mongo_user_service import MongoUserService
 from app.services.mongo_conversation_service import MongoConversationService
@@ -71,5 +71,17 @@ async def add_message(conversation_id: str, role: str, content: str):
     return fix_mongo_id(msg)
 
 @router.get("/messages/{conversation_id}")
-async def get_messages_for_conversation(conversation_id: str):
-    return fix_mongo_ids(await MongoMessageService.get_messages_for_conversation(conversation_id)) 
\ No newline at end of file
+async def get_messages_for_conversation(conversation_id: str, limit: Optional[int] = Query(None, ge=1, le=200),
+                                        cursor: Optional[str] = None):
+    """
+    Without `limit`/`cursor`: every message as a list, oldest first (the original response).
+    With either: `{"messages", "next_cursor"}`, the newest page of at most `limit` (default 50);
+    pass `next_cursor` back as `cursor` for older messages.
+    """
+    if limit is None and cursor is None:
+        return fix_mongo_ids(await MongoMessageService.get_messages_for_conversation(conversation_id))
+    try:
+        page = await MongoMessageService.get_messages_page(conversation_id, limit=limit or 50, cursor=cursor)
+    except ValueError:
+        raise HTTPException(400, "Invalid conversation id or cursor")
+    return {"messages": fix_mongo_ids(page["messages"]), "next_cursor": page["next_cursor"]}
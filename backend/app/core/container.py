@@ -0,0 +1,132 @@
+# app/core/container.py
+"""
+Per-worker application container.
+
+Holds the long-lived resources (Mongo client, OpenAI client, orchestrator,
+services, write-behind queue, analytics and lead scoring jobs) so they are
+built once per worker, warmed up at startup and closed at shutdown. Routers
+get them through the `get_*` dependencies below instead of constructing
+their own.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+from fastapi import Request
+
+from app.core import mongo
+from app.core.openai_client import get_openai_client, close_openai_client
+from app.services.llm_gateway import llm_gateway
+from app.services.rag_service import RAGService
+from app.services.crm_service import CRMService
+from app.services.analytics_service import AnalyticsService
+from app.services.analytics_cache import AnalyticsCache
+from app.services.write_behind import write_behind, WRITE_BEHIND_ENABLED
+from app.core.indexes import ensure_indexes_at_startup
+from app.services.conversation_summary import conversation_summarizer
+from app.services.conversation_cache import conversation_cache
+from app.services.analytics_rollups import analytics_rollups
+from app.services.lead_scoring import lead_scorer
+from app.services.rag_telemetry import rag_telemetry
+from app.services.search_trends import search_trends
+
+logger = logging.getLogger(__name__)
+
+
+class AppContainer:
+    """Singletons shared by all requests handled by this worker."""
+
+    def __init__(self):
+        self.db = mongo.db
+        self.llm = llm_gateway
+        self.write_behind = write_behind
+        self.summarizer = conversation_summarizer
+        self.conversation_cache = conversation_cache
+        self.analytics_rollups = analytics_rollups
+        self.lead_scorer = lead_scorer
+        self.rag_telemetry = rag_telemetry
+        self.search_trends = search_trends
+        self.rag_service = RAGService()
+        self.crm_service = CRMService()
+        self.analytics_service = AnalyticsService()
+        self.analytics_cache = AnalyticsCache(self.analytics_service)
+        self.orchestrator = self._build_orchestrator()
+        # Extra async warm-up steps (index checks, cache preloads) run at startup
+        self.warmups: List[Callable[[], Awaitable[None]]] = [ensure_indexes_at_startup]
+
+    @staticmethod
+    def _build_orchestrator():
+        # Imported here: the agents package pulls in every agent module
+        from app.agents.orchestrator import AgentOrchestrator
+        try:
+            return AgentOrchestrator()
+        except Exception as e:
+            logger.error(f"Chat orchestrator unavailable: {e}")
+            return None
+
+    async def startup(self) -> None:
+        """Open connections and warm them up before the first request."""
+        # Synchronous LLM callers in worker threads submit their calls to this loop
+        self.llm.loop = asyncio.get_running_loop()
+        try:
+            get_openai_client()
+        except Exception as e:
+            # Keep serving non-LLM endpoints; LLM calls raise until configured
+            logger.error(f"OpenAI client unavailable: {e}")
+        if self.db is not None:
+            mongo.get_client()
+            try:
+                # Establishes the first pooled connection
+                await self.db.command("ping")
+            except Exception as e:
+                logger.error(f"MongoDB ping failed at startup: {e}")
+            if WRITE_BEHIND_ENABLED:
+                await self.write_behind.start()
+            await self.analytics_rollups.start()
+            await self.lead_scorer.start()
+            await self.rag_telemetry.start()
+            await self.search_trends.start()
+        for warmup in self.warmups:
+            try:
+                await warmup()
+            except Exception as e:
+                logger.error(f"Warm-up step {getattr(warmup, '__name__', warmup)} failed: {e}")
+        logger.info("Application container started")
+
+    async def shutdown(self) -> None:
+        """Flush pending writes and close clients."""
+        await self.summarizer.stop()
+        await self.analytics_rollups.stop()
+        await self.lead_scorer.stop()
+        # Write buffered retrieval/LLM telemetry
+        await self.rag_telemetry.stop()
+        await self.search_trends.stop()
+        # Flush queued chat writes before the worker exits
+        await self.write_behind.stop()
+        await close_openai_client()
+        mongo.close_client()
+        logger.info("Application container stopped")
+
+
+def get_container(request: Request) -> AppContainer:
+    container: Optional[AppContainer] = getattr(request.app.state, "container", None)
+    if container is None:
+        # Only reached when the app runs without its lifespan (e.g. bare TestClient)
+        container = request.app.state.container = AppContainer()
+    return container
+
+
+def get_rag_service(request: Request) -> RAGService:
+    return get_container(request).rag_service
+
+
+def get_crm_service(request: Request) -> CRMService:
+    return get_container(request).crm_service
+
+
+def get_analytics_service(request: Request) -> AnalyticsService:
+    return get_container(request).analytics_service
+
+
+def get_analytics_cache(request: Request) -> AnalyticsCache:
+    return get_container(request).analytics_cache
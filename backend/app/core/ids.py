@@ -0,0 +1,111 @@
+# app/core/ids.py
+"""
+Canonical ID representation.
+
+Document ids and references to them are stored as ObjectId:
+`messages.conversation_id`, `conversations.user_id` and `leads.user_id`.
+Services convert incoming ids with the helpers below, so every lookup is a
+single equality match on one BSON type and can use its index.
+
+Some clients send opaque user ids (e.g. "user_1712345678" from smart-chat
+sessions). `normalize_ref` keeps those as strings; everything that looks
+like an ObjectId becomes one.
+
+`migrate_ids` rewrites legacy string references in batches (online, resumable).
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# (collection, field) pairs holding references that must be ObjectIds
+REFERENCE_FIELDS: List[Tuple[str, str]] = [
+    ("messages", "conversation_id"),
+    ("conversations", "user_id"),
+    ("leads", "user_id"),
+]
+
+
+def as_object_id(value: Any) -> Optional[ObjectId]:
+    """ObjectId for `value`, or None when it isn't one (or a 24-hex string)."""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+
+def to_object_id(value: Any) -> ObjectId:
+    """Like `as_object_id` but raises ValueError for invalid ids."""
+    oid = as_object_id(value)
+    if oid is None:
+        raise ValueError(f"Invalid id: {value!r}")
+    return oid
+
+
+def normalize_ref(value: Any) -> Any:
+    """Canonical form of a reference: ObjectId when possible, otherwise unchanged."""
+    oid = as_object_id(value)
+    return oid if oid is not None else value
+
+
+def ref_variants(value: Any) -> List[Any]:
+    """Every stored form of a reference: the canonical one plus its legacy string, if any."""
+    ref = normalize_ref(value)
+    return [ref, str(ref)] if isinstance(ref, ObjectId) else [ref]
+
+
+async def count_legacy_refs(database) -> Dict[str, Dict[str, int]]:
+    """Per reference field: documents still holding a string that converts to an ObjectId."""
+    report = {}
+    for collection, field in REFERENCE_FIELDS:
+        query = {field: {"$type": "string", "$regex": "^[0-9a-fA-F]{24}$"}}
+        report[f"{collection}.{field}"] = {"legacy": await database[collection].count_documents(query)}
+    return report
+
+
+async def migrate_ids(database, batch_size: int = 500, pause_s: float = 0.05,
+                      dry_run: bool = False, max_batches: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Rewrite string references to ObjectId, `batch_size` documents per bulk_write.
+
+    Online-safe: documents are walked by `_id` (keyset), each update matches the
+    old value so concurrent writes are never overwritten, and `pause_s` between
+    batches limits the load. Re-running resumes where the last run stopped.
+    """
+    report = {}
+    for collection, field in REFERENCE_FIELDS:
+        stats = {"scanned": 0, "converted": 0, "skipped": 0, "batches": 0}
+        last_id = None
+        while max_batches is None or stats["batches"] < max_batches:
+            query: Dict[str, Any] = {field: {"$type": "string"}}
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            batch = await database[collection].find(query, {field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+            if not batch:
+                break
+            last_id = batch[-1]["_id"]
+            stats["scanned"] += len(batch)
+            stats["batches"] += 1
+            requests = []
+            for doc in batch:
+                oid = as_object_id(doc[field])
+                if oid is None:
+                    # Opaque external id; stays a string by design
+                    stats["skipped"] += 1
+                    continue
+                requests.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: oid}}))
+            if requests and not dry_run:
+                result = await database[collection].bulk_write(requests, ordered=False)
+                stats["converted"] += result.modified_count
+            elif requests:
+                stats["converted"] += len(requests)
+            if pause_s:
+                await asyncio.sleep(pause_s)
+        logger.info(f"ID migration {collection}.{field}: {stats}")
+        report[f"{collection}.{field}"] = stats
+    return report
@@ -0,0 +1,234 @@
+# app/core/indexes.py
+"""
+Declarative MongoDB index registry.
+
+`INDEXES` lists every index the app relies on, per collection. It is applied
+at startup (MONGO_ENSURE_INDEXES) and by `python manage.py indexes ...`:
+
+- ensure_indexes: create missing indexes, report drift (same name, different
+  definition) and indexes that are not in the registry
+- explain_hot_queries: explain plan of each query in `HOT_QUERIES`, flagging
+  any that would fall back to a COLLSCAN
+
+Keep `HOT_QUERIES` in sync when adding queries on large collections.
+"""
+
+import os
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() == "true"
+# TTL of search_logs documents (written by app/services/search_trends.py)
+SEARCH_LOG_TTL_DAYS = int(os.getenv("SEARCH_LOG_TTL_DAYS", "90"))
+
+# Index options compared for drift detection
+COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+class IndexSpec:
+    """One index: name, key pattern and creation options."""
+
+    def __init__(self, name: str, keys: List[Tuple[str, Any]], **options):
+        self.name = name
+        self.keys = keys
+        self.options = options
+
+    def matches(self, existing: Dict) -> bool:
+        """True when an index returned by list_indexes has this definition."""
+        if list(existing["key"].items()) != [(k, v) for k, v in self.keys]:
+            return False
+        return all(existing.get(opt) == self.options.get(opt) for opt in COMPARED_OPTIONS
+                   if existing.get(opt) is not None or self.options.get(opt) is not None)
+
+    def describe(self) -> Dict:
+        return {"name": self.name, "keys": dict(self.keys), **self.options}
+
+
+INDEXES: Dict[str, List[IndexSpec]] = {
+    "users": [
+        # Users without an email (anonymous sessions) are allowed, duplicates are not
+        IndexSpec("email_unique", [("email", ASCENDING)], unique=True,
+                  partialFilterExpression={"email": {"$type": "string"}}),
+        IndexSpec("created_at", [("created_at", ASCENDING)]),
+    ],
+    "conversations": [
+        IndexSpec("user_started_at", [("user_id", ASCENDING), ("started_at", DESCENDING)]),
+        IndexSpec("started_at", [("started_at", ASCENDING)]),
+    ],
+    "messages": [
+        # History windows and keyset pagination (mongo_message_service.py)
+        IndexSpec("conversation_created_at", [("conversation_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)]),
+        IndexSpec("created_at", [("created_at", ASCENDING)]),
+    ],
+    "leads": [
+        IndexSpec("user_id", [("user_id", ASCENDING)]),
+        # One primary lead per user; makes the create-if-none lead upsert race-free
+        IndexSpec("user_primary_unique", [("user_id", ASCENDING), ("primary", ASCENDING)], unique=True,
+                  partialFilterExpression={"primary": True}),
+        IndexSpec("follow_up_status", [("follow_up_date", ASCENDING), ("status", ASCENDING)]),
+        IndexSpec("created_at", [("created_at", ASCENDING)]),
+        # Top-N lead scores (app/services/lead_scoring.py)
+        IndexSpec("score", [("score", DESCENDING)], partialFilterExpression={"score": {"$exists": True}}),
+    ],
+    "rag_chunks": [
+        IndexSpec("chunk_id", [("chunk_id", ASCENDING)]),
+        IndexSpec("file", [("file", ASCENDING)]),
+    ],
+    "rag_logs": [
+        IndexSpec("timestamp", [("timestamp", ASCENDING)]),
+    ],
+    # Per-window latency sketches (app/services/rag_telemetry.py)
+    "rag_metrics": [
+        IndexSpec("window", [("window", ASCENDING)]),
+    ],
+    # Search logs and per-worker daily trend documents (app/services/search_trends.py)
+    "search_logs": [
+        IndexSpec("ts_ttl", [("ts", ASCENDING)], expireAfterSeconds=SEARCH_LOG_TTL_DAYS * 86400),
+    ],
+    "search_trends": [
+        IndexSpec("day", [("day", ASCENDING)]),
+    ],
+    "analytics_rollups": [
+        IndexSpec("unit_bucket", [("unit", ASCENDING), ("bucket", ASCENDING)]),
+    ],
+}
+
+# Queries served on every request or dashboard load. Sample values only need the right type.
+HOT_QUERIES: List[Dict[str, Any]] = [
+    {"name": "user_by_email", "collection": "users", "filter": {"email": "someone@example.com"}},
+    {"name": "new_users_since", "collection": "users", "filter": {"created_at": {"$gte": datetime(2024, 1, 1)}}},
+    {"name": "conversations_by_user", "collection": "conversations", "filter": {"user_id": ObjectId()}},
+    {"name": "conversations_started_since", "collection": "conversations", "filter": {"started_at": {"$gte": datetime(2024, 1, 1)}}},
+    {"name": "history_window", "collection": "messages", "filter": {"conversation_id": ObjectId()},
+     "sort": [("created_at", DESCENDING), ("_id", DESCENDING)], "limit": 11},
+    {"name": "messages_since", "collection": "messages", "filter": {"created_at": {"$gte": datetime(2024, 1, 1)}}},
+    {"name": "leads_by_user", "collection": "leads", "filter": {"user_id": "someone@example.com"}},
+    {"name": "top_lead_scores", "collection": "leads", "filter": {"score": {"$exists": True}},
+     "sort": [("score", DESCENDING)], "limit": 100},
+    {"name": "leads_needing_followup", "collection": "leads",
+     "filter": {"follow_up_date": {"$lte": datetime(2024, 1, 1)}, "status": {"$ne": "closed"}}},
+    {"name": "chunk_by_id", "collection": "rag_chunks", "filter": {"chunk_id": "1"}},
+    {"name": "chunks_by_file", "collection": "rag_chunks", "filter": {"file": "listings.csv"}},
+    {"name": "rag_logs_since", "collection": "rag_logs", "filter": {"timestamp": {"$gte": datetime(2024, 1, 1)}}},
+    {"name": "search_trend_days", "collection": "search_trends", "filter": {"day": {"$gte": datetime(2024, 1, 1)}}},
+]
+
+
+def diff_indexes(specs: List[IndexSpec], existing: List[Dict]) -> Dict[str, List]:
+    """Compare registry specs with list_indexes output for one collection."""
+    by_name = {idx["name"]: idx for idx in existing}
+    wanted = {spec.name for spec in specs}
+    result: Dict[str, List] = {"ok": [], "missing": [], "drifted": [], "unknown": []}
+    for spec in specs:
+        current = by_name.get(spec.name)
+        if current is None:
+            result["missing"].append(spec)
+        elif spec.matches(current):
+            result["ok"].append(spec.name)
+        else:
+            result["drifted"].append(spec)
+    # Atlas Search / vector indexes are not listed here, only regular ones
+    result["unknown"] = [name for name in by_name if name != "_id_" and name not in wanted]
+    return result
+
+
+async def ensure_indexes(database, fix_drift: bool = False, drop_unknown: bool = False,
+                         dry_run: bool = False) -> Dict[str, Dict]:
+    """Create missing indexes and report (optionally repair) drift. Returns a per-collection report."""
+    report: Dict[str, Dict] = {}
+    for collection, specs in INDEXES.items():
+        existing = [idx async for idx in database[collection].list_indexes()]
+        diff = diff_indexes(specs, existing)
+        entry = {
+            "ok": diff["ok"],
+            "missing": [spec.name for spec in diff["missing"]],
+            "created": [],
+            "drifted": [spec.name for spec in diff["drifted"]],
+            "unknown": diff["unknown"],
+            "dropped": [],
+            "errors": [],
+        }
+        to_create = list(diff["missing"])
+        if fix_drift:
+            to_create += diff["drifted"]
+        for spec in to_create:
+            if dry_run:
+                continue
+            try:
+                if spec in diff["drifted"]:
+                    await database[collection].drop_index(spec.name)
+                await database[collection].create_index(spec.keys, name=spec.name, **spec.options)
+                entry["created"].append(spec.name)
+            except OperationFailure as e:
+                # e.g. duplicate emails blocking the unique index
+                entry["errors"].append({"index": spec.name, "error": str(e)})
+                logger.error(f"Could not create index {collection}.{spec.name}: {e}")
+        if drop_unknown:
+            for name in diff["unknown"]:
+                if not dry_run:
+                    await database[collection].drop_index(name)
+                entry["dropped"].append(name)
+        for name in entry["drifted"]:
+            logger.warning(f"Index drift on {collection}.{name}: definition differs from registry")
+        report[collection] = entry
+    return report
+
+
+def _plan_stages(plan: Dict) -> List[Dict]:
+    """Flatten a (winning) plan tree into its stages, root first."""
+    stages = [plan]
+    for child_key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(child_key), dict):
+            stages += _plan_stages(plan[child_key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+def summarize_plan(explain: Dict) -> Dict[str, Any]:
+    """Stages, indexes used and whether the winning plan scans the whole collection."""
+    planner = explain.get("queryPlanner", {})
+    stages = _plan_stages(planner.get("winningPlan", {}))
+    names = [s.get("stage") for s in stages if s.get("stage")]
+    return {
+        "stages": names,
+        "indexes": [s["indexName"] for s in stages if s.get("indexName")],
+        "collscan": "COLLSCAN" in names,
+    }
+
+
+async def explain_hot_queries(database) -> List[Dict[str, Any]]:
+    """Explain every query in HOT_QUERIES (queryPlanner verbosity)."""
+    results = []
+    for query in HOT_QUERIES:
+        command = {"find": query["collection"], "filter": query["filter"]}
+        if query.get("sort"):
+            command["sort"] = dict(query["sort"])
+        if query.get("limit"):
+            command["limit"] = query["limit"]
+        try:
+            explain = await database.command({"explain": command, "verbosity": "queryPlanner"})
+            results.append({"name": query["name"], "collection": query["collection"], **summarize_plan(explain)})
+        except OperationFailure as e:
+            results.append({"name": query["name"], "collection": query["collection"], "error": str(e)})
+    return results
+
+
+async def ensure_indexes_at_startup() -> None:
+    """Container warm-up step: apply the registry without dropping anything."""
+    from app.core.mongo import db
+    if db is None or not MONGO_ENSURE_INDEXES:
+        return
+    report = await ensure_indexes(db)
+    created = {c: r["created"] for c, r in report.items() if r["created"]}
+    if created:
+        logger.info(f"Created indexes: {created}")
@@ -0,0 +1,95 @@
+# app/core/leases.py
+"""
+Leases for background jobs that must run in one worker at a time.
+
+Every worker starts the same jobs; a job does its work only while it holds the
+job's lease, one document in `job_leases`:
+
+    {"_id": "analytics_rollups", "owner": "<host>:<pid>:<token>",
+     "expires_at": <datetime>, ...job state}
+
+`acquire` takes a free or expired lease and renews one this process already
+holds, so the holder keeps it by acquiring on every run and another worker
+takes over at most `ttl` seconds after the holder stops or dies. Jobs can keep
+small state on the same document (`state` / `save`), e.g. when they last did
+a full run, so it survives restarts and is shared by all workers.
+"""
+
+import os
+import socket
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from dotenv import load_dotenv
+
+from app.core.mongo import db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Longest a dead holder blocks a job; holders renew on every run
+JOB_LEASE_TTL_S = float(os.getenv("JOB_LEASE_TTL_S", "300"))
+
+JOB_LEASES = "job_leases"
+
+# One owner id per process
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Lease:
+    """A named, expiring lock document in `job_leases`."""
+
+    def __init__(self, name: str, ttl: float = JOB_LEASE_TTL_S, owner: str = OWNER, database=None):
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner
+        self.database = database
+
+    @property
+    def db(self):
+        return self.database if self.database is not None else db
+
+    @property
+    def collection(self):
+        return self.db[JOB_LEASES]
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease; False while another live owner holds it."""
+        now = datetime.utcnow()
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The document exists and is held by someone else, so the upsert tried to insert it
+            return False
+        return doc is not None and doc.get("owner") == self.owner
+
+    async def release(self) -> None:
+        """Let another worker take over right away."""
+        try:
+            await self.collection.update_one(
+                {"_id": self.name, "owner": self.owner}, {"$set": {"expires_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            logger.warning(f"Failed to release lease {self.name}: {e}")
+
+    async def state(self) -> Dict:
+        """The lease document (job state included), or {} before the first run."""
+        return await self.collection.find_one({"_id": self.name}) or {}
+
+    async def save(self, **fields) -> None:
+        """Store job state on the lease document, if this process still holds it."""
+        await self.collection.update_one({"_id": self.name, "owner": self.owner}, {"$set": fields})
+
+
+def job_lease(name: str, interval: float, database=None) -> Lease:
+    """Lease for a job that runs every `interval` seconds; outlives at least two missed runs."""
+    return Lease(name, ttl=max(JOB_LEASE_TTL_S, 2 * interval), database=database)
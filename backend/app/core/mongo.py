@@ -1,33 +1,89 @@
 # backend/app/core/mongo.py
 
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Dict, Optional, Tuple
 import os
+import logging
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "real_estate_ai")
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+
+_client = None
+
+
+def get_client():
+    """Shared Motor client, created on first use (normally at app startup)."""
+    global _client
+    if _client is None and MONGO_URI:
+        options = {"minPoolSize": MONGO_MIN_POOL_SIZE, "maxPoolSize": MONGO_MAX_POOL_SIZE}
+        # Add SSL configuration to handle certificate issues
+        if "mongodb+srv://" in MONGO_URI:
+            # For MongoDB Atlas, add SSL configuration
+            options.update(
+                tls=True,
+                tlsAllowInvalidCertificates=True,  # Only for development
+                serverSelectionTimeoutMS=5000
+            )
+        _client = AsyncIOMotorClient(MONGO_URI, **options)
+    return _client
+
+
+def get_database():
+    client = get_client()
+    return client[MONGO_DB_NAME] if client is not None else None
+
+
+def close_client() -> None:
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+async def get_or_create(collection, filter: Dict, defaults: Optional[Dict] = None) -> Tuple[Dict, bool]:
+    """
+    Atomic get-or-create in one round trip. Returns (document, created).
+
+    The upsert assigns a fresh `_id` only on insert, which tells us whether we
+    created the document. `filter` must be backed by a unique index: two racing
+    upserts then yield one insert and one DuplicateKeyError, retried as a read.
+    """
+    marker = ObjectId()
+    update = {"$setOnInsert": {**(defaults or {}), "_id": marker}}
+    for attempt in range(2):
+        try:
+            doc = await collection.find_one_and_update(filter, update, upsert=True,
+                                                       return_document=ReturnDocument.AFTER)
+            return doc, doc["_id"] == marker
+        except DuplicateKeyError:
+            if attempt:
+                raise
+    raise RuntimeError("unreachable")
+
+
+class _LazyDatabase:
+    """Module-level `db` that resolves to the shared client's database on access."""
+
+    def __getattr__(self, name):
+        return getattr(get_database(), name)
+
+    def __getitem__(self, name):
+        return get_database()[name]
 
-print("[DEBUG] MONGO_URI:", MONGO_URI)
 
-# Configure MongoDB client with SSL settings
 if MONGO_URI:
-    # Add SSL configuration to handle certificate issues
-    if "mongodb+srv://" in MONGO_URI:
-        # For MongoDB Atlas, add SSL configuration
-        client = AsyncIOMotorClient(
-            MONGO_URI,
-            tls=True,
-            tlsAllowInvalidCertificates=True,  # Only for development
-            serverSelectionTimeoutMS=5000
-        )
-    else:
-        client = AsyncIOMotorClient(MONGO_URI)
-    
-    db = client[MONGO_DB_NAME]
+    db = _LazyDatabase()
 else:
-    print("[WARNING] MONGO_URI not found in environment variables")
-    client = None
-    db = None
\ No newline at end of file
+    logger.warning("MONGO_URI not found in environment variables")
+    db = None
@@ -0,0 +1,36 @@
+# backend/app/core/openai_client.py
+
+from openai import AsyncOpenAI
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Point at fake_openai_server.py (e.g. http://127.0.0.1:8100/v1) for offline load tests
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+
+_client = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Shared async OpenAI client, created on first use."""
+    global _client
+    if _client is None:
+        # max_retries=0: retries are paced by the shared rate limiter instead
+        _client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            base_url=OPENAI_BASE_URL,
+            timeout=OPENAI_TIMEOUT,
+            max_retries=0,
+        )
+    return _client
+
+
+async def close_openai_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,114 @@
+# app/core/request_context.py
+"""
+Request-scoped memoization.
+
+A `RequestContext` lives for one HTTP request (set by `RequestContextMiddleware`)
+and caches derived values such as the user record, the extraction result,
+query embeddings and retrieval results. Keys are tuples namespaced by what
+produced the value, e.g. ("embedding", model, text).
+
+Concurrent callers asking for the same key share one in-flight computation,
+so parallel orchestrator stages never repeat work. Outside a request,
+`memoize` just calls the factory.
+"""
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, Optional
+
+_current: ContextVar[Optional["RequestContext"]] = ContextVar("request_context", default=None)
+
+
+class RequestContext:
+    """Per-request cache of derived values."""
+
+    def __init__(self):
+        self._values: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def memo(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the value for `key`, computing it with `factory` on first use."""
+        future = self._values.get(key)
+        if future is not None:
+            self.hits += 1
+            # shield: one waiter being cancelled must not cancel the shared computation
+            return await asyncio.shield(future)
+        self.misses += 1
+        future = asyncio.ensure_future(factory())
+        self._values[key] = future
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            # Failures are not memoized; a later caller may retry
+            if self._values.get(key) is future:
+                del self._values[key]
+            raise
+
+    def peek(self, key: Hashable) -> Any:
+        """Already-computed value for `key`, or None."""
+        future = self._values.get(key)
+        if future is not None and future.done() and not future.cancelled() and future.exception() is None:
+            return future.result()
+        return None
+
+    def has(self, key: Hashable) -> bool:
+        """Whether `key` is computed or being computed."""
+        return key in self._values
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Seed a value computed elsewhere."""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        self._values[key] = future
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"keys": len(self._values), "hits": self.hits, "misses": self.misses}
+
+
+def current_request_context() -> Optional[RequestContext]:
+    return _current.get()
+
+
+@contextmanager
+def request_scope() -> Iterator[RequestContext]:
+    """Enter a request context, reusing the active one if there is one."""
+    ctx = _current.get()
+    if ctx is not None:
+        yield ctx
+        return
+    ctx = RequestContext()
+    token = _current.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _current.reset(token)
+
+
+async def memoize(key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """Memoize `factory()` under `key` for the current request (no-op outside one)."""
+    ctx = _current.get()
+    if ctx is None:
+        return await factory()
+    return await ctx.memo(key, factory)
+
+
+def is_memoized(key: Hashable) -> bool:
+    """Whether the current request already has (or is computing) `key`."""
+    ctx = _current.get()
+    return ctx is not None and ctx.has(key)
+
+
+class RequestContextMiddleware:
+    """ASGI middleware giving every HTTP request its own RequestContext."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with request_scope():
+            await self.app(scope, receive, send)
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.models import conversation, message, user
@@ -6,8 +7,22 @@ from app.api import crm, files, chat
 from app.api.analytics import router as analytics_router
 from app.api.advanced_features import router as advanced_router
 from app.api.mongo_chat import router as mongo_chat_router
+from app.api.exports import router as exports_router
+from app.core.container import AppContainer
+from app.core.request_context import RequestContextMiddleware
 
-app = FastAPI(title="Multi-Agent Chat API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One container per worker: built and warmed before serving, closed after
+    container = AppContainer()
+    app.state.container = container
+    await container.startup()
+    try:
+        yield
+    finally:
+        await container.shutdown()
+
+app = FastAPI(title="Multi-Agent Chat API", lifespan=lifespan)
 
 # Enable CORS for all origins (for development)
 app.add_middleware(
@@ -18,6 +33,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request memoization of derived values (user, extraction, embeddings, retrieval)
+app.add_middleware(RequestContextMiddleware)
+
 Base.metadata.create_all(bind=engine)
 
 @app.get("/health")
@@ -30,3 +48,4 @@ app.include_router(chat.router)
 app.include_router(analytics_router)
 app.include_router(advanced_router)
 app.include_router(mongo_chat_router)
+app.include_router(exports_router)
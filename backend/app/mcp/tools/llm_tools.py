@@ -5,27 +5,23 @@ Moved from utils/llm.py
 """
 
 from __future__ import annotations
-import os, openai, logging
-from tenacity import retry, wait_exponential, stop_after_attempt, retry_if_exception_type
+import os, logging
 from dotenv import load_dotenv
-load_dotenv()                       # <-- add this line
+load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-import openai
-openai.api_key = os.getenv("OPENAI_API_KEY")
-MODEL = "gpt-4o-mini"
+from app.services.llm_gateway import llm_gateway
+from app.services.model_router import model_router
+from app.services.rate_limiter import Priority
+MODEL = model_router.models["small"]   # default; chat() routes per request
 REQUEST_TIMEOUT = 30          # seconds
 
-retry_policy = retry(
-    wait=wait_exponential(multiplier=1, min=1, max=10),
-    stop=stop_after_attempt(3),
-    retry=retry_if_exception_type(openai.APIError) |
-          retry_if_exception_type(openai.RateLimitError)
-)
+# MCP tool calls are not the user-facing chat turn; they yield to it under load
+MCP_PRIORITY = Priority.BACKGROUND
 
-@retry_policy
-def chat(messages: list[dict]) -> str:
+
+def chat(messages: list[dict], task: str = "chat", priority: Priority = MCP_PRIORITY) -> str:
     """
     Send a list of OpenAI-style messages and return assistant text.
     messages = [
@@ -34,13 +30,11 @@ def chat(messages: list[dict]) -> str:
         {'role':'assistant', 'content': "..."},
         ...
     ]
+    Goes through the shared gateway (routing, rate limiter, retries). Blocks,
+    so call it from a worker thread, never from the event loop.
     """
-    logger.debug("Calling OpenAI ChatCompletion with %d messages", len(messages))
-    resp = openai.chat.completions.create(
-        model=MODEL,
-        messages=messages,
-    )
-    return resp.choices[0].message.content.strip()
+    logger.debug("Calling LLM gateway (%s) with %d messages", task, len(messages))
+    return llm_gateway.chat_sync(task, messages, priority=priority)
 
 
 class LLMTools:
@@ -71,6 +65,7 @@ class LLMTools:
         """Get information about the current model."""
         return {
             "model": self.model,
+            "routing": model_router.snapshot()["models"],
             "timeout": self.timeout,
-            "api_key_configured": bool(openai.api_key)
+            "api_key_configured": bool(os.getenv("OPENAI_API_KEY"))
         } 
\ No newline at end of file
@@ -0,0 +1,117 @@
+# app/services/analytics_cache.py
+"""
+Per-worker cache of `AnalyticsService` results.
+
+Entries are keyed by method name and arguments. Each method has its own
+freshness window and a stale window during which the cached value is still
+served while one background task recomputes it, so dashboard loads are
+answered from memory no matter how many viewers refresh at once.
+"""
+
+import asyncio
+import os
+import logging
+from typing import Any, Dict, Tuple
+from dotenv import load_dotenv
+
+from app.services.analytics_service import AnalyticsService
+from app.utils.cache import SWRCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_CACHE_ENABLED = os.getenv("ANALYTICS_CACHE_ENABLED", "true").lower() == "true"
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "1000"))
+
+# method -> (seconds fresh, further seconds served stale while recomputing)
+ANALYTICS_CACHE_TTLS: Dict[str, Tuple[float, float]] = {
+    "get_user_engagement": (60, 600),
+    "get_conversation_stats": (120, 600),
+    "get_rag_metrics": (30, 300),
+    "get_crm_insights": (60, 600),
+    "get_lead_conversion_stats": (60, 600),
+    "get_lead_scores": (30, 300),
+    "get_property_search_trends": (60, 600),
+    "get_activity": (60, 600),
+    "get_daily_activity": (60, 600),
+}
+
+
+def _freshness_headers(age: float, status: str, max_age: float, stale_ttl: float) -> Dict[str, str]:
+    return {
+        "Age": str(int(age)),
+        "X-Cache": status.upper(),
+        "Cache-Control": f"private, max-age={max(0, int(max_age))}, stale-while-revalidate={int(stale_ttl)}",
+    }
+
+
+class AnalyticsCache:
+    """Stale-while-revalidate front for `AnalyticsService`."""
+
+    def __init__(self, service: AnalyticsService, enabled: bool = ANALYTICS_CACHE_ENABLED,
+                 max_entries: int = ANALYTICS_CACHE_SIZE):
+        self.service = service
+        self.enabled = enabled
+        self.cache = SWRCache(max_entries=max_entries)
+
+    async def call(self, method: str, *args: Any) -> Tuple[Any, float, str]:
+        """
+        Result of `service.<method>(*args)` as (value, age in seconds, status).
+        Status is "hit", "stale", "miss", or "bypass" for uncached methods.
+        """
+        compute = lambda: getattr(self.service, method)(*args)
+        ttls = ANALYTICS_CACHE_TTLS.get(method)
+        if not self.enabled or ttls is None:
+            return await compute(), 0.0, "bypass"
+        return await self.cache.get((method, args), compute, *ttls)
+
+    @staticmethod
+    def headers(method: str, age: float, status: str) -> Dict[str, str]:
+        """HTTP headers describing how fresh a cached result is."""
+        if status == "bypass":
+            return {"Cache-Control": "no-store", "X-Cache": "BYPASS"}
+        ttl, stale_ttl = ANALYTICS_CACHE_TTLS.get(method, (0, 0))
+        return _freshness_headers(age, status, ttl - age, stale_ttl)
+
+    async def call_many(self, calls: Dict[str, Tuple[str, Tuple]]) -> Tuple[Dict[str, Any], Dict[str, str], Dict[str, str]]:
+        """
+        Run `{name: (method, args)}` concurrently through the cache.
+
+        Returns (values, errors, headers): a failed call gets value None and an
+        entry in errors; headers describe the stalest result.
+        """
+        names = list(calls)
+        results = await asyncio.gather(*(self.call(method, *args) for method, args in calls.values()),
+                                       return_exceptions=True)
+        values: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        served = []
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Analytics section {name} failed: {result}")
+                values[name] = None
+                errors[name] = str(result)
+                continue
+            values[name] = result[0]
+            served.append((calls[name][0], result[1], result[2]))
+        return values, errors, self._combined_headers(served)
+
+    @classmethod
+    def _combined_headers(cls, served) -> Dict[str, str]:
+        if not served:
+            return {"Cache-Control": "no-store"}
+        if any(status == "bypass" for _, _, status in served):
+            return cls.headers("", 0.0, "bypass")
+        # The response is as old as its oldest part and expires with its first part
+        ttls = [ANALYTICS_CACHE_TTLS[method] for method, _, _ in served]
+        statuses = {status for _, _, status in served}
+        return _freshness_headers(
+            age=max(age for _, age, _ in served),
+            status=next(s for s in ("miss", "stale", "hit") if s in statuses),
+            max_age=min(ttl - age for (ttl, _), (_, age, _) in zip(ttls, served)),
+            stale_ttl=min(stale_ttl for _, stale_ttl in ttls),
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, **self.cache.snapshot()}
@@ -0,0 +1,340 @@
+# app/services/analytics_rollups.py
+"""
+Pre-aggregated counters for the analytics endpoints.
+
+`analytics_rollups` holds one document per hour:
+
+    {"_id": "hour:2026-10-19T09", "unit": "hour", "bucket": <datetime>,
+     "conversations": 3, "messages": 20, "user_messages": 10,
+     "assistant_messages": 10, "leads": 1, "users": 2}
+
+and a "watermark" document: every hour before `until` is complete.
+
+A periodic job (`refresh`) recomputes the closed hours between the watermark
+and `now - ROLLUP_LAG_S` from raw data and `$set`s them, so reruns and crashes
+never double count. Writes can land in hours that are already closed (a slow
+write-behind flush, a journal replayed after a restart), so every refresh also
+re-rolls the trailing ROLLUP_REROLL_S; `check` finds anything later than that
+and `rebuild` repairs it. Readers combine the rollups before the watermark
+with a raw aggregation of the short tail after it (and of partial first and
+last hours).
+
+Every worker starts the job, but only the holder of the "analytics_rollups"
+lease (app/core/leases.py) refreshes, first backfill included.
+
+Lead statuses change after creation, so they can't be bucketed by time. Every
+lead starts as "new" (counted by the `leads` counter); status changes are
+`$inc`remented on write into the "lead_status" document's `deltas`. Legacy
+leads without `created_at` are outside the counters until `rebuild` dates them.
+
+`rebuild` recomputes everything; `check` compares the rollups with raw counts.
+"""
+
+import asyncio
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+from app.core.mongo import db
+from app.core.leases import job_lease
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_ROLLUPS_ENABLED = os.getenv("ANALYTICS_ROLLUPS_ENABLED", "true").lower() == "true"
+ROLLUP_INTERVAL_S = float(os.getenv("ROLLUP_INTERVAL_S", "60"))
+# Writes can land after their timestamp (write-behind); hours close only after this delay
+ROLLUP_LAG_S = float(os.getenv("ROLLUP_LAG_S", "120"))
+# Closed hours recomputed on every refresh, for writes that land late
+ROLLUP_REROLL_S = float(os.getenv("ROLLUP_REROLL_S", "21600"))
+
+ROLLUPS = "analytics_rollups"
+WATERMARK_ID = "watermark"
+LEAD_STATUS_ID = "lead_status"
+# Leads the `leads` counter sees; undated legacy leads get a date from `rebuild`
+DATED_LEADS = {"created_at": {"$ne": None}}
+LEAD_BACKFILL_BATCH = 500
+
+# counter -> (collection, timestamp field, field whose values get "<value>_<counter>" counters)
+ROLLUP_SOURCES = {
+    "conversations": ("conversations", "started_at", None),
+    "messages": ("messages", "created_at", "role"),
+    "leads": ("leads", "created_at", None),
+    "users": ("users", "created_at", None),
+}
+COUNTERS = ["conversations", "messages", "user_messages", "assistant_messages", "leads", "users"]
+
+HOUR = timedelta(hours=1)
+
+
+def hour_of(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def split_range(start: Optional[datetime], end: datetime,
+                since: datetime) -> Tuple[Optional[Tuple[Optional[datetime], datetime]], List[Tuple[datetime, datetime]]]:
+    """
+    Split [start, end) into whole rolled-up hours (`rolled`, or None) and raw
+    ranges: a partial first hour, a partial last hour and the tail after `since`.
+    """
+    raw = []
+    lo = start
+    if lo is not None and lo != hour_of(lo):
+        raw.append((lo, min(hour_of(lo) + HOUR, end)))
+        lo = raw[-1][1]
+    if end > since:
+        hi = since
+        tail = since if lo is None else max(lo, since)
+    else:
+        hi = hour_of(end)
+        tail = hi if lo is None else max(lo, hi)
+    if tail < end:
+        raw.append((tail, end))
+    rolled = (lo, hi) if lo is None or lo < hi else None
+    return rolled, raw
+
+
+def _hours_in(lo: Optional[datetime], hi: datetime) -> Dict:
+    query: Dict = {"unit": "hour", "bucket": {"$lt": hi}}
+    if lo is not None:
+        query["bucket"]["$gte"] = lo
+    return query
+
+
+def _add(total: Dict[str, int], counts: Dict[str, int]) -> Dict[str, int]:
+    for counter, count in counts.items():
+        total[counter] = total.get(counter, 0) + count
+    return total
+
+
+async def hourly_from_raw(database, start: Optional[datetime], end: datetime) -> Dict[datetime, Dict[str, int]]:
+    """Counters per hour in [start, end) straight from the source collections, one query each."""
+    async def count(counter, collection, field, split):
+        match = {field: {"$lt": end}}
+        if start is not None:
+            match[field]["$gte"] = start
+        group_id = {"bucket": {"$dateTrunc": {"date": f"${field}", "unit": "hour"}}}
+        if split:
+            group_id["split"] = f"${split}"
+        pipeline = [{"$match": match}, {"$group": {"_id": group_id, "count": {"$sum": 1}}}]
+        return counter, await database[collection].aggregate(pipeline).to_list(None)
+
+    results = await asyncio.gather(*(count(counter, *source) for counter, source in ROLLUP_SOURCES.items()))
+    hours: Dict[datetime, Dict[str, int]] = {}
+    for counter, rows in results:
+        for row in rows:
+            counts = hours.setdefault(row["_id"]["bucket"], {})
+            _add(counts, {counter: row["count"]})
+            if row["_id"].get("split"):
+                _add(counts, {f"{row['_id']['split']}_{counter}": row["count"]})
+    return hours
+
+
+class AnalyticsRollups:
+    """Maintains and reads the hourly rollups; `start` runs `refresh` periodically."""
+
+    def __init__(self, interval: float = ROLLUP_INTERVAL_S, lag: float = ROLLUP_LAG_S, reroll: float = ROLLUP_REROLL_S,
+                 enabled: bool = ANALYTICS_ROLLUPS_ENABLED, database=None):
+        self.interval = interval
+        self.lag = lag
+        self.reroll = reroll
+        self.enabled = enabled
+        self.database = database
+        self.lease = job_lease(ROLLUPS, interval, database)
+        self._leader = False
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"refreshes": 0, "hours_written": 0, "failures": 0, "last_refresh": None}
+
+    @property
+    def db(self):
+        return self.database if self.database is not None else db
+
+    @property
+    def collection(self):
+        return self.db[ROLLUPS]
+
+    # ---------- maintenance ----------
+    async def watermark(self) -> Optional[datetime]:
+        """End of the rolled-up range, or None when rollups are disabled or not built yet."""
+        if not self.enabled or self.db is None:
+            return None
+        doc = await self.collection.find_one({"_id": WATERMARK_ID})
+        return doc["until"] if doc else None
+
+    async def refresh(self) -> Dict:
+        """Roll up the hours closed since the watermark and re-roll the trailing window. Idempotent."""
+        since = await self.watermark() if self.enabled else None
+        until = hour_of(datetime.utcnow() - timedelta(seconds=self.lag))
+        if since is None:
+            # First run backfills everything, lead statuses included
+            await self._rebuild_lead_status()
+            start = None
+        else:
+            until = max(until, since)
+            start = min(since, hour_of(until - timedelta(seconds=self.reroll)))
+        hours = await hourly_from_raw(self.db, start, until)
+        requests = [
+            UpdateOne(
+                {"_id": f"hour:{bucket:%Y-%m-%dT%H}"},
+                {"$set": {"unit": "hour", "bucket": bucket, **{c: counts.get(c, 0) for c in COUNTERS}}},
+                upsert=True,
+            )
+            for bucket, counts in sorted(hours.items())
+        ]
+        if requests:
+            await self.collection.bulk_write(requests, ordered=False)
+        # Only after the hours are written: a crash in between just recomputes them
+        await self.collection.update_one(
+            {"_id": WATERMARK_ID}, {"$set": {"until": until, "updated_at": datetime.utcnow()}}, upsert=True
+        )
+        self.stats["refreshes"] += 1
+        self.stats["hours_written"] += len(requests)
+        self.stats["last_refresh"] = datetime.utcnow()
+        return {"since": since, "until": until, "hours": len(requests)}
+
+    async def rebuild(self) -> Dict:
+        """Drop all rollups and recompute them from raw data."""
+        await self._backfill_lead_dates()
+        await self.collection.delete_many({"_id": {"$in": [WATERMARK_ID, LEAD_STATUS_ID]}})
+        await self.collection.delete_many({"unit": "hour"})
+        return await self.refresh()
+
+    async def _backfill_lead_dates(self) -> int:
+        """Give leads without `created_at` the creation time of their ObjectId (or now)."""
+        requests = []
+        async for lead in self.db.leads.find({"created_at": None}, {"_id": 1}):
+            created = lead["_id"].generation_time.replace(tzinfo=None) if isinstance(lead["_id"], ObjectId) \
+                else datetime.utcnow()
+            requests.append(UpdateOne({"_id": lead["_id"], "created_at": None}, {"$set": {"created_at": created}}))
+        for i in range(0, len(requests), LEAD_BACKFILL_BATCH):
+            await self.db.leads.bulk_write(requests[i:i + LEAD_BACKFILL_BATCH], ordered=False)
+        if requests:
+            logger.info(f"Backfilled created_at on {len(requests)} leads")
+        return len(requests)
+
+    async def _lead_status_rows(self):
+        pipeline = [{"$match": DATED_LEADS}, {"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+        return await self.db.leads.aggregate(pipeline).to_list(None)
+
+    async def _rebuild_lead_status(self) -> None:
+        rows = await self._lead_status_rows()
+        deltas = {str(row["_id"]): row["count"] for row in rows}
+        deltas["new"] = deltas.get("new", 0) - sum(row["count"] for row in rows)
+        await self.collection.update_one({"_id": LEAD_STATUS_ID}, {"$set": {"deltas": deltas}}, upsert=True)
+
+    async def record_lead_status(self, old: Optional[str], new: Optional[str]) -> None:
+        """Count a lead status change of a lead with `created_at`. Call after the lead itself was updated."""
+        if not self.enabled or old == new or not isinstance(old, str) or not isinstance(new, str):
+            return
+        try:
+            await self.collection.update_one(
+                {"_id": LEAD_STATUS_ID}, {"$inc": {f"deltas.{old}": -1, f"deltas.{new}": 1}}, upsert=True
+            )
+        except Exception as e:
+            # `check` reports the drift and `rebuild` repairs it
+            logger.error(f"Failed to record lead status change {old} -> {new}: {e}")
+
+    # ---------- reads ----------
+    async def hourly(self, start: Optional[datetime], end: datetime) -> Optional[Dict[datetime, Dict[str, int]]]:
+        """Counters per hour in [start, end), or None when the rollups can't answer."""
+        since = await self.watermark()
+        if since is None:
+            return None
+        hours: Dict[datetime, Dict[str, int]] = {}
+        rolled, raw_ranges = split_range(start, end, since)
+        if rolled is not None:
+            async for doc in self.collection.find(_hours_in(*rolled)):
+                hours[doc["bucket"]] = {c: doc.get(c, 0) for c in COUNTERS}
+        for raw_start, raw_end in raw_ranges:
+            for bucket, counts in (await hourly_from_raw(self.db, raw_start, raw_end)).items():
+                _add(hours.setdefault(bucket, {}), counts)
+        return hours
+
+    async def totals(self, start: Optional[datetime], end: datetime) -> Optional[Dict[str, int]]:
+        """Counters summed over [start, end), or None when the rollups can't answer."""
+        since = await self.watermark()
+        if since is None:
+            return None
+        total = {c: 0 for c in COUNTERS}
+        rolled, raw_ranges = split_range(start, end, since)
+        if rolled is not None:
+            pipeline = [
+                {"$match": _hours_in(*rolled)},
+                {"$group": {"_id": None, **{c: {"$sum": f"${c}"} for c in COUNTERS}}},
+            ]
+            for row in await self.collection.aggregate(pipeline).to_list(None):
+                _add(total, {c: row.get(c, 0) for c in COUNTERS})
+        for raw_start, raw_end in raw_ranges:
+            for counts in (await hourly_from_raw(self.db, raw_start, raw_end)).values():
+                _add(total, counts)
+        return total
+
+    async def lead_status_counts(self) -> Optional[Dict[str, int]]:
+        """Leads per status, or None when the rollups can't answer."""
+        if await self.watermark() is None:
+            return None
+        doc = await self.collection.find_one({"_id": LEAD_STATUS_ID})
+        totals = await self.totals(None, datetime.utcnow())
+        if doc is None or totals is None:
+            return None
+        counts = _add({"new": totals["leads"]}, doc.get("deltas", {}))
+        return {status: count for status, count in counts.items() if count}
+
+    async def check(self) -> Dict:
+        """Compare rolled-up counters with raw counts over the rolled-up range."""
+        since = await self.watermark()
+        if since is None:
+            return {"built": False, "ok": False}
+        rolled = await self.totals(None, since) or {}
+        counters = {}
+        for counter, (collection, field, _) in ROLLUP_SOURCES.items():
+            raw = await self.db[collection].count_documents({field: {"$lt": since}})
+            counters[counter] = {"rollup": rolled.get(counter, 0), "raw": raw, "ok": rolled.get(counter, 0) == raw}
+        rows = await self._lead_status_rows()
+        raw_status = {str(row["_id"]): row["count"] for row in rows if row["count"]}
+        rolled_status = await self.lead_status_counts() or {}
+        lead_status = {"rollup": rolled_status, "raw": raw_status, "ok": rolled_status == raw_status}
+        ok = lead_status["ok"] and all(c["ok"] for c in counters.values())
+        return {"built": True, "watermark": since, "counters": counters, "lead_status": lead_status, "ok": ok}
+
+    # ---------- lifecycle ----------
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # Renewed every run; the other workers only read
+                self._leader = await self.lease.acquire()
+                if self._leader:
+                    await self.refresh()
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.error(f"Analytics rollup refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._leader:
+            await self.lease.release()
+            self._leader = False
+
+    def snapshot(self) -> Dict:
+        return {"enabled": self.enabled, "running": self._task is not None, "leader": self._leader, **self.stats}
+
+
+# Shared instance used by the analytics service and the container
+analytics_rollups = AnalyticsRollups()
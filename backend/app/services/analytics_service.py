@@ -1,90 +1,231 @@
+import asyncio
+import math
+import logging
 from app.core.mongo import db
+from pymongo.errors import OperationFailure
 from typing import Dict, List, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from collections import Counter
+from app.core.ids import normalize_ref, ref_variants
+from app.utils.topic_matcher import get_topic_matcher
+from app.services.analytics_rollups import analytics_rollups
+from app.services.lead_scoring import lead_scorer
+from app.services.rag_telemetry import rag_telemetry
+from app.services.search_trends import search_trends
+
+# Series in activity charts: name -> (collection, timestamp field)
+ACTIVITY_SOURCES = {
+    "conversations": ("conversations", "started_at"),
+    "messages": ("messages", "created_at"),
+    "leads": ("leads", "created_at"),
+}
+ACTIVITY_STEPS = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}
+MAX_ACTIVITY_BUCKETS = 5000
+# Conversation ids per messages query in get_user_journey_insights
+JOURNEY_BATCH = 500
+# "unknown group operator" (MongoDB < 7.0) and InvalidPipelineOperator
+UNSUPPORTED_OPERATOR_CODES = {15952, 168}
+
+logger = logging.getLogger(__name__)
+
+
+def percentiles_from_counts(rows: List[Dict], ps: List[float]) -> List[float]:
+    """Nearest-rank percentiles from (value, count) rows sorted by value ascending."""
+    total = sum(row["count"] for row in rows)
+    results = []
+    for p in ps:
+        rank = max(1, math.ceil(p * total))
+        seen = 0
+        for row in rows:
+            seen += row["count"]
+            if seen >= rank:
+                results.append(row["_id"])
+                break
+    return results
+
 
 class AnalyticsService:
-    
+    def __init__(self):
+        # $percentile needs MongoDB 7.0+; cleared once the server rejects the operator
+        self.percentile_supported = True
+
     async def get_conversation_stats(self, user_id: Optional[str] = None) -> Dict:
-        # Get all conversation IDs (optionally filtered by user)
+        """
+        Conversation count and messages-per-conversation distribution, optionally for one user.
+
+        One server-side pipeline: each conversation counts its messages through
+        the messages.conversation_created_at index, then a single group computes
+        totals, mean and percentiles. $percentile needs MongoDB 7.0+; older
+        servers group conversations by message count instead, and the
+        percentiles are picked from those sorted (count, conversations) rows.
+        """
         query = {}
         if user_id:
-            query["user_id"] = user_id
-        conversation_ids = [c["_id"] for c in await db.conversations.find(query, {"_id": 1}).to_list(1000)]  # type: ignore[attr-defined]
-        if not conversation_ids:
-            return {"total_conversations": 0, "avg_messages_per_conversation": 0}
-        # Count messages per conversation
+            query["user_id"] = normalize_ref(user_id)
         pipeline = [
-            {"$match": {"conversation_id": {"$in": [str(cid) for cid in conversation_ids]}}},
-            {"$group": {"_id": "$conversation_id", "count": {"$sum": 1}}}
+            {"$match": query},
+            {"$lookup": {
+                "from": "messages",
+                "localField": "_id",
+                "foreignField": "conversation_id",
+                "pipeline": [{"$count": "n"}],
+                "as": "counted"
+            }},
+            {"$project": {"messages": {"$ifNull": [{"$first": "$counted.n"}, 0]}}},
         ]
-        msg_counts = await db.messages.aggregate(pipeline).to_list(1000)  # type: ignore[attr-defined]
-        total_conversations = len(conversation_ids)
-        avg_messages = sum(m["count"] for m in msg_counts) / total_conversations if total_conversations else 0
-        return {"total_conversations": total_conversations, "avg_messages_per_conversation": avg_messages}
+        stats = None
+        if self.percentile_supported:
+            try:
+                rows = await db.conversations.aggregate(pipeline + [{"$group": {  # type: ignore[attr-defined]
+                    "_id": None,
+                    "conversations": {"$sum": 1},
+                    "messages": {"$sum": "$messages"},
+                    "avg": {"$avg": "$messages"},
+                    "percentiles": {"$percentile": {"input": "$messages", "p": [0.5, 0.9], "method": "approximate"}}
+                }}]).to_list(1)
+                stats = rows[0] if rows else {}
+            except OperationFailure as e:
+                if e.code not in UNSUPPORTED_OPERATOR_CODES:
+                    raise
+                logger.warning(f"$percentile unavailable (MongoDB < 7.0?), using the count histogram: {e}")
+                self.percentile_supported = False
+        if stats is None:
+            stats = await self._conversation_stats_from_histogram(pipeline)
+        if not stats:
+            return {"total_conversations": 0, "total_messages": 0, "avg_messages_per_conversation": 0,
+                    "median_messages_per_conversation": 0, "p90_messages_per_conversation": 0}
+        median, p90 = stats["percentiles"]
+        return {
+            "total_conversations": stats["conversations"],
+            "total_messages": stats["messages"],
+            "avg_messages_per_conversation": stats["avg"],
+            "median_messages_per_conversation": median,
+            "p90_messages_per_conversation": p90
+        }
     
+    @staticmethod
+    async def _conversation_stats_from_histogram(pipeline: List[Dict]) -> Dict:
+        """Same stats as the $percentile group, from one row per distinct message count."""
+        rows = await db.conversations.aggregate(pipeline + [  # type: ignore[attr-defined]
+            {"$group": {"_id": "$messages", "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ]).to_list(None)
+        if not rows:
+            return {}
+        conversations = sum(row["count"] for row in rows)
+        messages = sum(row["_id"] * row["count"] for row in rows)
+        return {
+            "conversations": conversations,
+            "messages": messages,
+            "avg": messages / conversations,
+            "percentiles": percentiles_from_counts(rows, [0.5, 0.9]),
+        }
+
     async def get_user_engagement(self, days: int = 30) -> Dict:
         """
         Get user engagement metrics
         """
-        start_date = datetime.utcnow() - timedelta(days=days)
-        
-        # Active users
-        active_users = await db.conversations.distinct("user_id", {
-            "started_at": {"$gte": start_date}
-        })  # type: ignore[attr-defined]
+        now = datetime.utcnow()
+        start_date = now - timedelta(days=days)
         
-        # Total messages
-        total_messages = await db.messages.count_documents({
-            "created_at": {"$gte": start_date}
-        })  # type: ignore[attr-defined]
-        
-        # New users
-        new_users = await db.users.count_documents({
-            "created_at": {"$gte": start_date}
-        })  # type: ignore[attr-defined]
+        # Active users are counted from conversations: distinct counts don't add up across rollup buckets
+        active_users, totals = await asyncio.gather(
+            self._count_active_users(start_date),
+            analytics_rollups.totals(start_date, now)
+        )
+        if totals is not None:
+            total_messages, new_users = totals["messages"], totals["users"]
+        else:
+            since = {"created_at": {"$gte": start_date}}
+            total_messages, new_users = await asyncio.gather(
+                db.messages.count_documents(since),  # type: ignore[attr-defined]
+                db.users.count_documents(since)  # type: ignore[attr-defined]
+            )
         
         return {
-            "active_users": len(active_users),
+            "active_users": active_users,
             "total_messages": total_messages,
             "new_users": new_users,
             "period_days": days
         }
+
+    async def _count_active_users(self, since: datetime) -> int:
+        pipeline = [
+            {"$match": {"started_at": {"$gte": since}}},
+            {"$group": {"_id": "$user_id"}},
+            {"$count": "users"}
+        ]
+        rows = await db.conversations.aggregate(pipeline).to_list(1)  # type: ignore[attr-defined]
+        return rows[0]["users"] if rows else 0
     
-    async def get_rag_metrics(self) -> Dict:
-        # Demo: count of RAG retrievals and average latency (mocked)
-        rag_logs = await db.rag_logs.find({"timestamp": {"$gte": datetime.utcnow() - timedelta(days=7)}}).to_list(1000)  # type: ignore[attr-defined]
-        retrieval_count = len(rag_logs)
-        avg_latency = sum(log.get("latency", 0) for log in rag_logs) / retrieval_count if retrieval_count else 0
-        return {"retrieval_count": retrieval_count, "avg_latency": avg_latency}
+    async def get_rag_metrics(self, days: int = 7) -> Dict:
+        """
+        Retrieval and LLM latency over the last `days`, from the per-window
+        sketches written by app/services/rag_telemetry.py (no rag_logs scan).
+        """
+        metrics = await rag_telemetry.load_metrics(datetime.utcnow() - timedelta(days=days))
+        counters, sketches = metrics["counters"], metrics["sketches"]
+
+        def stages(kind: str) -> Dict:
+            prefix = f"{kind}."
+            return {name[len(prefix):]: sketch.summary() for name, sketch in sketches.items() if name.startswith(prefix)}
+
+        def hit_rate(name: str) -> float:
+            events = counters.get("retrieval.events", 0)
+            return round(counters.get(f"retrieval.cache_hits.{name}", 0) / events, 3) if events else 0.0
+
+        retrieval = stages("retrieval")
+        total = retrieval.get("retrieval_ms", {})
+        return {
+            "retrieval_count": counters.get("retrieval.events", 0),
+            "retrieval_errors": counters.get("retrieval.errors", 0),
+            "avg_latency": total.get("mean_ms") or 0,
+            "p50_ms": total.get("p50_ms"),
+            "p95_ms": total.get("p95_ms"),
+            "p99_ms": total.get("p99_ms"),
+            "stages": retrieval,
+            "cache_hit_rate": {"embedding": hit_rate("embedding"), "search": hit_rate("search")},
+            "llm": {
+                "calls": counters.get("llm.events", 0),
+                "errors": counters.get("llm.errors", 0),
+                **stages("llm").get("llm_ms", {}),
+            },
+            "embedding_calls": counters.get("embedding.events", 0),
+        }
 
     async def get_crm_insights(self) -> Dict:
-        user_count = await db.users.count_documents({})  # type: ignore[attr-defined]
-        lead_count = await db.leads.count_documents({})  # type: ignore[attr-defined]
+        # Collection metadata counts: no scan, fine for dashboard totals
+        user_count, lead_count = await asyncio.gather(
+            db.users.estimated_document_count(),  # type: ignore[attr-defined]
+            db.leads.estimated_document_count()  # type: ignore[attr-defined]
+        )
         return {"user_count": user_count, "lead_count": lead_count}
 
-    async def get_lead_scores(self) -> List[Dict]:
-        # WARNING: This is a mock/stub implementation. Replace with real lead scoring logic.
-        # TODO: Implement real lead scoring analytics.
-        leads = await db.leads.find({}).to_list(100)  # type: ignore[attr-defined]
+    async def get_lead_scores(self, limit: int = 100) -> List[Dict]:
+        """
+        Highest-scored leads first (scores are computed by app/services/lead_scoring.py)
+        """
+        leads = await lead_scorer.top(limit)
         for lead in leads:
-            lead["score"] = 80  # Placeholder
+            lead["_id"] = str(lead["_id"])
+            if lead.get("user_id") is not None:
+                lead["user_id"] = str(lead["user_id"])
         return leads
     
     async def get_lead_conversion_stats(self) -> Dict:
         """
         Get lead conversion statistics
         """
-        pipeline = [
-            {"$group": {
-                "_id": "$status",
-                "count": {"$sum": 1}
-            }}
-        ]
-        
-        results = await db.leads.aggregate(pipeline).to_list(None)  # type: ignore[attr-defined]
-        
-        status_counts = {result["_id"]: result["count"] for result in results}
+        status_counts = await analytics_rollups.lead_status_counts()
+        if status_counts is None:
+            pipeline = [
+                {"$group": {
+                    "_id": "$status",
+                    "count": {"$sum": 1}
+                }}
+            ]
+            results = await db.leads.aggregate(pipeline).to_list(None)  # type: ignore[attr-defined]
+            status_counts = {result["_id"]: result["count"] for result in results}
         
         total_leads = sum(status_counts.values())
         conversion_rate = (status_counts.get("closed", 0) / total_leads * 100) if total_leads > 0 else 0
@@ -95,104 +236,154 @@ class AnalyticsService:
             "conversion_rate": round(conversion_rate, 2)
         }
     
-    async def get_property_search_trends(self) -> Dict:
-        """
-        Get property search trends and popular criteria
-        WARNING: This is a mock/stub implementation. Replace with real analytics.
-        TODO: Implement real property search trends analytics.
-        """
-        # Mock data for demo - in production, this would analyze actual search queries
-        trends = {
-            "popular_locations": ["Downtown", "Suburban", "Waterfront"],
-            "popular_property_types": ["Single Family", "Condo", "Townhouse"],
-            "price_ranges": {
-                "300k-500k": 45,
-                "500k-750k": 30,
-                "750k+": 25
-            },
-            "bedroom_preferences": {
-                "2": 20,
-                "3": 50,
-                "4+": 30
-            }
-        }
-        return trends
+    async def get_property_search_trends(self, days: int = 30, limit: int = 10) -> Dict:
+        """
+        Popular search criteria over the last `days` days, from the per-day
+        counters and top-k sketches of app/services/search_trends.py
+        """
+        return await search_trends.trends(days, limit)
     
     async def get_user_journey_insights(self, user_id: str) -> Dict:
         """
-        Get insights about a specific user's journey
+        Conversation, message, lead and topic counts for one user.
+
+        Conversation ids are read in batches and their messages streamed with a
+        projection, so memory stays flat however long the history is. Each user
+        message is scanned once by the topic matcher compiled from
+        config/topic_taxonomy.json; a topic counts once per message mentioning it.
         """
-        # Get user's conversations
-        conversations = await db.conversations.find({"user_id": user_id}).to_list(None)  # type: ignore[attr-defined]
-        
-        # Get user's messages
-        conversation_ids = [conv["_id"] for conv in conversations]
-        messages = await db.messages.find({
-            "conversation_id": {"$in": conversation_ids}
-        }).to_list(None)  # type: ignore[attr-defined]
-        
-        # Get user's leads
-        leads = await db.leads.find({"user_id": user_id}).to_list(None)  # type: ignore[attr-defined]
-        
-        # Analyze message patterns
-        user_messages = [msg for msg in messages if msg["role"] == "user"]
-        assistant_messages = [msg for msg in messages if msg["role"] == "assistant"]
-        
-        # Extract common topics (simple keyword analysis)
-        user_text = " ".join([msg["content"].lower() for msg in user_messages])
-        topics = []
-        
-        if "house" in user_text or "home" in user_text:
-            topics.append("Property Search")
-        if "price" in user_text or "budget" in user_text:
-            topics.append("Pricing")
-        if "location" in user_text or "area" in user_text:
-            topics.append("Location")
-        if "schedule" in user_text or "viewing" in user_text:
-            topics.append("Viewings")
-        
+        # Match both ObjectId and legacy string references (app/core/ids.py)
+        user_refs = ref_variants(user_id)
+        matcher = get_topic_matcher()
+        counts = Counter()
+        topics: Counter = Counter()
+
+        async def scan_messages(conversation_ids: List) -> None:
+            refs = [ref for conversation_id in conversation_ids for ref in ref_variants(conversation_id)]
+            cursor = db.messages.find({"conversation_id": {"$in": refs}}, {"_id": 0, "role": 1, "content": 1})  # type: ignore[attr-defined]
+            async for msg in cursor:
+                counts["messages"] += 1
+                counts[msg.get("role")] += 1
+                if msg.get("role") == "user" and msg.get("content"):
+                    topics.update(matcher.topics_in(msg["content"]))
+
+        async def scan_conversations() -> None:
+            batch: List = []
+            async for conv in db.conversations.find({"user_id": {"$in": user_refs}}, {"_id": 1}):  # type: ignore[attr-defined]
+                counts["conversations"] += 1
+                batch.append(conv["_id"])
+                if len(batch) >= JOURNEY_BATCH:
+                    await scan_messages(batch)
+                    batch = []
+            if batch:
+                await scan_messages(batch)
+
+        lead_query = {"user_id": {"$in": user_refs}}
+        _, total_leads, active_leads = await asyncio.gather(
+            scan_conversations(),
+            db.leads.count_documents(lead_query),  # type: ignore[attr-defined]
+            db.leads.count_documents({**lead_query, "status": {"$ne": "closed"}}),  # type: ignore[attr-defined]
+        )
+        # Most mentioned first, ties in taxonomy order
+        ranked = sorted(topics.items(), key=lambda kv: (-kv[1], matcher.topics.index(kv[0])))
         return {
-            "total_conversations": len(conversations),
-            "total_messages": len(messages),
-            "user_messages": len(user_messages),
-            "assistant_messages": len(assistant_messages),
-            "total_leads": len(leads),
-            "active_leads": len([lead for lead in leads if lead.get("status") != "closed"]),
-            "common_topics": topics,
-            "engagement_score": min(100, len(messages) * 10)  # Simple scoring
+            "total_conversations": counts["conversations"],
+            "total_messages": counts["messages"],
+            "user_messages": counts["user"],
+            "assistant_messages": counts["assistant"],
+            "total_leads": total_leads,
+            "active_leads": active_leads,
+            "common_topics": [topic for topic, _ in ranked],
+            "topic_counts": dict(ranked),
+            "engagement_score": min(100, counts["messages"] * 10)  # Simple scoring
         }
-    
+
     async def get_daily_activity(self, days: int = 7) -> List[Dict]:
         """
-        Get daily activity for the last N days
+        Get daily activity for the last N days (today included)
         """
-        activities = []
-        
-        for i in range(days):
-            date = datetime.utcnow() - timedelta(days=i)
-            start_of_day = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_of_day = start_of_day + timedelta(days=1)
-            
-            # Count conversations started
-            conversations = await db.conversations.count_documents({
-                "started_at": {"$gte": start_of_day, "$lt": end_of_day}
-            })  # type: ignore[attr-defined]
-            
-            # Count messages sent
-            messages = await db.messages.count_documents({
-                "created_at": {"$gte": start_of_day, "$lt": end_of_day}
-            })  # type: ignore[attr-defined]
-            
-            # Count new leads
-            leads = await db.leads.count_documents({
-                "created_at": {"$gte": start_of_day, "$lt": end_of_day}
-            })  # type: ignore[attr-defined]
-            
-            activities.append({
-                "date": start_of_day.strftime("%Y-%m-%d"),
-                "conversations": conversations,
-                "messages": messages,
-                "leads": leads
-            })
-        
-        return activities[::-1]  # Reverse to show oldest first 
\ No newline at end of file
+        tomorrow = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        return await self.get_activity(tomorrow - timedelta(days=days), tomorrow, "day")
+
+    async def get_activity(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                           granularity: str = "day") -> List[Dict]:
+        """
+        Conversations, messages and leads per hour/day/week in [start, end), oldest first.
+        Defaults to the 30 days up to now.
+
+        Served from the hourly rollups when they are built, otherwise from one
+        `$dateTrunc` group per collection. Empty buckets are filled in memory,
+        so latency barely depends on the range length.
+        """
+        if granularity not in ACTIVITY_STEPS:
+            raise ValueError(f"granularity must be one of {sorted(ACTIVITY_STEPS)}")
+        end = _naive_utc(end) if end else datetime.utcnow()
+        start = _naive_utc(start) if start else end - timedelta(days=30)
+        if start >= end:
+            raise ValueError("start must be before end")
+        # Stored timestamps are naive UTC; compare like with like. Buckets are whole periods.
+        start = _truncate(start, granularity)
+        buckets = _activity_buckets(start, end, granularity)
+        if len(buckets) > MAX_ACTIVITY_BUCKETS:
+            raise ValueError(f"Range too large: {len(buckets)} buckets (max {MAX_ACTIVITY_BUCKETS})")
+
+        hourly = await analytics_rollups.hourly(start, end)
+        if hourly is not None:
+            regrouped: Dict[datetime, Dict[str, int]] = {}
+            for hour, hour_counts in hourly.items():
+                row = regrouped.setdefault(_truncate(hour, granularity), {})
+                for name in ACTIVITY_SOURCES:
+                    row[name] = row.get(name, 0) + hour_counts.get(name, 0)
+            counts = [{bucket: row[name] for bucket, row in regrouped.items()} for name in ACTIVITY_SOURCES]
+        else:
+            counts = await self._activity_from_raw(start, end, granularity)
+        label_format = "%Y-%m-%dT%H:00" if granularity == "hour" else "%Y-%m-%d"
+        return [
+            {
+                "date": bucket.strftime(label_format),
+                **{name: by_bucket.get(bucket, 0) for name, by_bucket in zip(ACTIVITY_SOURCES, counts)},
+            }
+            for bucket in buckets
+        ]
+
+    async def _activity_from_raw(self, start: datetime, end: datetime, granularity: str) -> List[Dict[datetime, int]]:
+        """Per source, counts by bucket start: one `$dateTrunc` group per collection, run concurrently."""
+        async def count_by_bucket(collection: str, field: str) -> Dict[datetime, int]:
+            trunc = {"date": f"${field}", "unit": granularity}
+            if granularity == "week":
+                trunc["startOfWeek"] = "monday"
+            pipeline = [
+                {"$match": {field: {"$gte": start, "$lt": end}}},
+                {"$group": {"_id": {"$dateTrunc": trunc}, "count": {"$sum": 1}}},
+            ]
+            rows = await db[collection].aggregate(pipeline).to_list(None)  # type: ignore[index]
+            return {row["_id"]: row["count"] for row in rows}
+
+        return list(await asyncio.gather(*(count_by_bucket(c, f) for c, f in ACTIVITY_SOURCES.values())))
+
+
+def _naive_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _truncate(moment: datetime, granularity: str) -> datetime:
+    """Python equivalent of $dateTrunc (UTC, weeks start on Monday)."""
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def _activity_buckets(start: datetime, end: datetime, granularity: str) -> List[datetime]:
+    """Every bucket start between `start` and `end`, so empty periods show up as zeros."""
+    step = ACTIVITY_STEPS[granularity]
+    bucket = _truncate(start, granularity)
+    buckets = []
+    while bucket < end:
+        buckets.append(bucket)
+        bucket += step
+    return buckets
@@ -0,0 +1,233 @@
+# app/services/conversation_cache.py
+"""
+In-process cache of hot conversations.
+
+Keeps, per recently active conversation, the conversation document and a
+ring buffer with its last CONVERSATION_CACHE_WINDOW messages. New messages
+are written through (`append_message`) so a follow-up turn is served
+without reading history from Mongo.
+
+Bounded by entry count and approximate bytes (LRU eviction). The cache is
+per worker, so it can miss writes made by other workers: the conversation
+document and the message buffer are each served for at most
+CONVERSATION_CACHE_TTL_S after they were loaded from Mongo, however often they
+are read or written through in between. With several workers, sticky sessions
+keep the hit rate up.
+"""
+
+import copy
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CONVERSATION_CACHE_ENABLED = os.getenv("CONVERSATION_CACHE_ENABLED", "true").lower() == "true"
+CONVERSATION_CACHE_SIZE = int(os.getenv("CONVERSATION_CACHE_SIZE", "2000"))
+CONVERSATION_CACHE_MAX_MB = float(os.getenv("CONVERSATION_CACHE_MAX_MB", "64"))
+CONVERSATION_CACHE_TTL_S = float(os.getenv("CONVERSATION_CACHE_TTL_S", "600"))
+# Defaults to the orchestrator's history window so every history read can be served
+CONVERSATION_CACHE_WINDOW = int(os.getenv("CONVERSATION_CACHE_WINDOW", os.getenv("HISTORY_WINDOW", "10")))
+
+# Only these message fields are kept in the ring buffer
+MESSAGE_FIELDS = ("_id", "conversation_id", "role", "content", "created_at")
+# Rough per-object overhead used for memory accounting
+ENTRY_OVERHEAD_BYTES = 600
+MESSAGE_OVERHEAD_BYTES = 350
+
+
+def _message_size(message: Dict) -> int:
+    return MESSAGE_OVERHEAD_BYTES + sys.getsizeof(message.get("content") or "")
+
+
+def _doc_size(doc: Optional[Dict]) -> int:
+    if not doc:
+        return 0
+    return ENTRY_OVERHEAD_BYTES + sum(sys.getsizeof(v) for v in doc.values() if isinstance(v, (str, bytes)))
+
+
+class _Entry:
+    __slots__ = ("conversation", "conversation_loaded", "messages", "complete", "messages_loaded", "last_access", "bytes")
+
+    def __init__(self, window: int):
+        self.conversation: Optional[Dict] = None
+        self.messages: Deque[Dict] = deque(maxlen=window)
+        # True when `messages` holds the conversation's latest messages (no gaps)
+        self.complete = False
+        # When each part was last read from (or created in) Mongo; bounds staleness
+        self.conversation_loaded = self.messages_loaded = time.monotonic()
+        self.last_access = time.monotonic()
+        self.bytes = ENTRY_OVERHEAD_BYTES
+
+    def recompute_bytes(self) -> None:
+        self.bytes = ENTRY_OVERHEAD_BYTES + _doc_size(self.conversation) + sum(_message_size(m) for m in self.messages)
+
+
+class ConversationCache:
+    """LRU cache of conversation documents and recent-message ring buffers, expiring by load time."""
+
+    def __init__(self, max_conversations: int = CONVERSATION_CACHE_SIZE,
+                 max_bytes: int = int(CONVERSATION_CACHE_MAX_MB * 1024 * 1024),
+                 ttl: float = CONVERSATION_CACHE_TTL_S,
+                 window: int = CONVERSATION_CACHE_WINDOW,
+                 enabled: bool = CONVERSATION_CACHE_ENABLED):
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.window = window
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    # ---------- conversation documents ----------
+    def get_conversation(self, conversation_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._touch(str(conversation_id))
+            if entry is not None and entry.conversation is not None and self._stale(entry.conversation_loaded):
+                entry.conversation = None
+                self.stats["expirations"] += 1
+            if entry is None or entry.conversation is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            return copy.deepcopy(entry.conversation)
+
+    def put_conversation(self, conversation: Dict, new: bool = False) -> None:
+        """Cache a conversation document; `new` marks a just-created (empty) conversation."""
+        if not self.enabled or not conversation or "_id" not in conversation:
+            return
+        with self._lock:
+            entry = self._entry(str(conversation["_id"]))
+            entry.conversation = copy.deepcopy(conversation)
+            entry.conversation_loaded = time.monotonic()
+            if new:
+                entry.messages.clear()
+                entry.complete = True
+                entry.messages_loaded = entry.conversation_loaded
+            self._resize(entry)
+
+    # ---------- messages ----------
+    def recent_messages(self, conversation_id: str, limit: int) -> Optional[List[Dict]]:
+        """Last `limit` messages oldest first, or None when the cache can't answer."""
+        with self._lock:
+            entry = self._touch(str(conversation_id))
+            if entry is not None and entry.complete and self._stale(entry.messages_loaded):
+                # Other workers may have added messages since the buffer was read
+                entry.complete = False
+                self.stats["expirations"] += 1
+            if entry is None or not entry.complete or limit > self.window:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            return [dict(m) for m in list(entry.messages)[-limit:]] if limit else []
+
+    def put_messages(self, conversation_id: str, messages: List[Dict]) -> None:
+        """Seed the ring buffer from a read of the latest `window` messages (oldest first)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._entry(str(conversation_id))
+            entry.messages.clear()
+            entry.messages.extend(self._compact(m) for m in messages[-self.window:])
+            entry.complete = True
+            entry.messages_loaded = time.monotonic()
+            self._resize(entry)
+
+    def append_message(self, conversation_id: str, message: Dict) -> None:
+        """Write-through for a newly stored message."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._entries.get(str(conversation_id))
+            # Appending to a buffer with gaps would hand out wrong history
+            if entry is None or not entry.complete:
+                return
+            # Keeps messages_loaded: this worker's own writes say nothing about other workers'
+            entry.messages.append(self._compact(message))
+            entry.last_access = time.monotonic()
+            self._entries.move_to_end(str(conversation_id))
+            self._resize(entry)
+
+    def invalidate(self, conversation_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(str(conversation_id), None)
+            if entry:
+                self._bytes -= entry.bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # ---------- internals (call with the lock held) ----------
+    @staticmethod
+    def _compact(message: Dict) -> Dict:
+        return {k: message[k] for k in MESSAGE_FIELDS if k in message}
+
+    def _stale(self, loaded: float) -> bool:
+        return time.monotonic() - loaded > self.ttl
+
+    def _touch(self, key: str) -> Optional[_Entry]:
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.last_access = time.monotonic()
+            self._entries.move_to_end(key)
+        return entry
+
+    def _entry(self, key: str) -> _Entry:
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(self.window)
+            self._bytes += entry.bytes
+        entry.last_access = time.monotonic()
+        self._entries.move_to_end(key)
+        return entry
+
+    def _resize(self, entry: _Entry) -> None:
+        self._bytes -= entry.bytes
+        entry.recompute_bytes()
+        self._bytes += entry.bytes
+        # Evict least recently used until within both bounds (never the entry just written)
+        while len(self._entries) > 1 and (len(self._entries) > self.max_conversations or self._bytes > self.max_bytes):
+            key, evicted = next(iter(self._entries.items()))
+            if evicted is entry:
+                break
+            del self._entries[key]
+            self._bytes -= evicted.bytes
+            self.stats["evictions"] += 1
+
+    def _expire(self) -> None:
+        # Frees entries idle for a whole TTL (their parts were loaded even earlier, so are stale too).
+        # LRU order is access order, so idle entries sit at the front
+        cutoff = time.monotonic() - self.ttl
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.last_access >= cutoff:
+                break
+            del self._entries[key]
+            self._bytes -= entry.bytes
+            self.stats["expirations"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire()
+            return {
+                "enabled": self.enabled,
+                "conversations": len(self._entries),
+                "messages": sum(len(e.messages) for e in self._entries.values()),
+                "approx_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                **self.stats,
+            }
+
+
+# Shared per-worker cache
+conversation_cache = ConversationCache()
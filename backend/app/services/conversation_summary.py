@@ -0,0 +1,242 @@
+# app/services/conversation_summary.py
+"""
+Rolling conversation summaries.
+
+Each `conversations` document keeps:
+- `message_count` / `last_message_at`: updated every turn
+- `facts`: latest non-empty extracted values (budget, property type, ...)
+- `summary`: running summary of everything older than the recent window
+- `summary_until` / `summary_message_count`: how far the summary reaches
+
+Every SUMMARY_EVERY_N_TURNS turns a background task folds the messages that
+have slid out of the recent window into the summary using the small model.
+Prompts are then built from summary + facts + the last HISTORY_WINDOW
+messages, so their size stays flat however long the conversation runs.
+"""
+
+import asyncio
+import json
+import os
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+
+from app.core.mongo import db
+from app.core.request_context import memoize
+from app.services.llm_gateway import llm_gateway
+from app.services.rate_limiter import Priority
+from app.services.mongo_message_service import MongoMessageService, HISTORY_WINDOW, MAX_PAGE_SIZE
+from app.services.write_behind import write_behind
+from app.services.conversation_cache import conversation_cache
+from app.services.lead_scoring import lead_scorer
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_EVERY_N_TURNS = int(os.getenv("SUMMARY_EVERY_N_TURNS", "5"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+# Characters of each message shown to the summarizer
+SUMMARY_MESSAGE_CHARS = 600
+
+SUMMARY_PROMPT = """You maintain the memory of a real estate assistant's conversation with a client.
+
+Current summary:
+{summary}
+
+Known facts (JSON):
+{facts}
+
+New messages:
+{transcript}
+
+Update the summary (at most 120 words) so it keeps every detail a real estate
+agent would need later: requirements, properties discussed, decisions, next steps.
+Reply with JSON only: {{"summary": "...", "facts": {{"field": "value"}}}}"""
+
+
+def _facts_update(extracted_info: Optional[Dict]) -> Dict[str, Any]:
+    """Non-empty extracted values, as `$set` paths under `facts`."""
+    if not extracted_info or "error" in extracted_info:
+        return {}
+    return {f"facts.{k}": v for k, v in extracted_info.items() if v not in (None, "", [], {}) and "." not in k and not k.startswith("$")}
+
+
+def context_messages(memory: Optional[Dict], recent: Optional[List[Dict]] = None) -> List[Dict]:
+    """Chat messages for a prompt: one system message with summary and facts, then the recent window."""
+    messages = []
+    memory = memory or {}
+    parts = []
+    if memory.get("summary"):
+        parts.append(f"Conversation so far: {memory['summary']}")
+    if memory.get("facts"):
+        parts.append("Known client details: " + ", ".join(f"{k}: {v}" for k, v in memory["facts"].items()))
+    if parts:
+        messages.append({"role": "system", "content": "\n".join(parts)})
+    for msg in (recent or [])[-HISTORY_WINDOW:]:
+        if msg.get("role") in ("user", "assistant") and msg.get("content"):
+            messages.append({"role": msg["role"], "content": msg["content"]})
+    return messages
+
+
+class ConversationSummarizer:
+    """Keeps per-conversation counters, facts and a rolling summary up to date."""
+
+    def __init__(self, every_n_turns: int = SUMMARY_EVERY_N_TURNS, window: int = HISTORY_WINDOW, database=None):
+        self.every_n_turns = every_n_turns
+        self.window = window
+        self.database = database
+        self._tasks: Set[asyncio.Task] = set()
+        self._refreshing: Set[str] = set()
+        self.stats = {"refreshes": 0, "failures": 0}
+
+    @property
+    def db(self):
+        return self.database if self.database is not None else db
+
+    async def load(self, conversation_id: str) -> Dict:
+        """Summary and facts for prompt building (memoized per request)."""
+        async def fetch():
+            try:
+                conv = await self._get_conversation(conversation_id)
+            except InvalidId:
+                return {}
+            if not conv:
+                return {}
+            return {"summary": conv.get("summary"), "facts": conv.get("facts") or {}}
+        return await memoize(("conversation_memory", conversation_id), fetch)
+
+    async def record_turn(self, conversation_id: str, extracted_info: Optional[Dict] = None, messages: int = 2) -> None:
+        """Count a finished turn, merge extracted facts and schedule a refresh when due."""
+        try:
+            await self._record_turn(conversation_id, extracted_info, messages)
+        except Exception as e:
+            # Bookkeeping only; never fail the chat turn over it
+            logger.error(f"Could not record turn for conversation {conversation_id}: {e}")
+
+    async def _record_turn(self, conversation_id: str, extracted_info: Optional[Dict], messages: int) -> None:
+        now = datetime.utcnow()
+        facts = _facts_update(extracted_info)
+        conv_obj_id = ObjectId(conversation_id)
+        update = {"$inc": {"message_count": messages}, "$set": {"last_message_at": now, **facts}}
+        pending = write_behind.pending_document("conversations", conv_obj_id)
+        if pending is not None:
+            # Conversation insert is still queued: journal the update behind it
+            await write_behind.update("conversations", {"_id": conv_obj_id}, update)
+            conv = pending
+        else:
+            conv = await self.db.conversations.find_one_and_update(
+                {"_id": conv_obj_id}, update, return_document=ReturnDocument.AFTER
+            )
+            if not conv:
+                return
+        # Write-through so the next turn reads counters and facts from memory
+        conversation_cache.put_conversation(conv)
+        lead_scorer.touch_user(conv.get("user_id"))
+        unsummarized = conv.get("message_count", 0) - conv.get("summary_message_count", 0)
+        # Refresh once N more turns have slid past the recent window
+        if unsummarized >= self.window + 2 * self.every_n_turns:
+            self.schedule_refresh(conversation_id)
+
+    def schedule_refresh(self, conversation_id: str) -> None:
+        """Run `refresh` in the background, at most once at a time per conversation."""
+        if conversation_id in self._refreshing:
+            return
+        self._refreshing.add(conversation_id)
+        task = asyncio.create_task(self._refresh_in_background(conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh_in_background(self, conversation_id: str) -> None:
+        try:
+            await self.refresh(conversation_id)
+        except Exception as e:
+            self.stats["failures"] += 1
+            logger.error(f"Summary refresh failed for conversation {conversation_id}: {e}")
+        finally:
+            self._refreshing.discard(conversation_id)
+
+    async def refresh(self, conversation_id: str) -> Optional[str]:
+        """Fold messages older than the recent window into the rolling summary."""
+        conv = await self._get_conversation(conversation_id)
+        if not conv:
+            return None
+        page = await MongoMessageService.get_messages_page(
+            conversation_id, limit=min(MAX_PAGE_SIZE, max(1, conv.get("message_count", 0) - conv.get("summary_message_count", 0)))
+        )
+        messages = page["messages"][:-self.window] if self.window else page["messages"]
+        summary_until = conv.get("summary_until")
+        if summary_until:
+            messages = [m for m in messages if m["created_at"] > summary_until]
+        if not messages:
+            return conv.get("summary")
+
+        transcript = "\n".join(f"{m['role']}: {str(m.get('content', ''))[:SUMMARY_MESSAGE_CHARS]}" for m in messages)
+        prompt = SUMMARY_PROMPT.format(
+            summary=conv.get("summary") or "(none yet)",
+            facts=json.dumps(conv.get("facts") or {}, default=str),
+            transcript=transcript,
+        )
+        reply = await llm_gateway.chat(
+            "conversation_summary",
+            [{"role": "user", "content": prompt}],
+            max_tokens=SUMMARY_MAX_TOKENS,
+            priority=Priority.BACKGROUND,
+        )
+        summary, facts = self._parse(reply)
+        update = {
+            "summary": summary,
+            "summary_until": messages[-1]["created_at"],
+            "summary_message_count": conv.get("message_count", 0) - self.window,
+            "summary_updated_at": datetime.utcnow(),
+        }
+        # Facts captured per turn are authoritative; the model only fills gaps
+        for key, value in facts.items():
+            if key not in (conv.get("facts") or {}):
+                update.update(_facts_update({key: value}))
+        conv = await self.db.conversations.find_one_and_update(
+            {"_id": conv["_id"]}, {"$set": update}, return_document=ReturnDocument.AFTER
+        )
+        conversation_cache.put_conversation(conv)
+        self.stats["refreshes"] += 1
+        return summary
+
+    @staticmethod
+    def _parse(reply: str):
+        text = reply.strip()
+        if text.startswith("```"):
+            text = text.strip("`").split("\n", 1)[-1]
+        try:
+            data = json.loads(text)
+            return str(data.get("summary", "")).strip(), data.get("facts") or {}
+        except (ValueError, AttributeError):
+            # Model ignored the format; keep its text as the summary
+            return reply.strip(), {}
+
+    async def _get_conversation(self, conversation_id: str) -> Optional[Dict]:
+        conv_obj_id = ObjectId(conversation_id)
+        pending = write_behind.pending_document("conversations", conv_obj_id)
+        if pending is not None:
+            return pending
+        cached = conversation_cache.get_conversation(conversation_id)
+        if cached is not None:
+            return cached
+        conv = await self.db.conversations.find_one({"_id": conv_obj_id})
+        conversation_cache.put_conversation(conv)
+        return conv
+
+    async def stop(self) -> None:
+        """Let in-flight refreshes finish (used at shutdown)."""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=10)
+
+    def snapshot(self) -> Dict:
+        return {"in_flight": len(self._refreshing), **self.stats}
+
+
+# Shared summarizer
+conversation_summarizer = ConversationSummarizer()
@@ -1,17 +1,29 @@
+import asyncio
+import logging
 from app.core.mongo import db
-from typing import Dict, List, Optional
-import openai
-import os
+from typing import Any, Dict, List, Optional
 from datetime import datetime, timedelta
+from app.services.llm_gateway import llm_gateway
+from app.services.write_behind import write_behind
+from app.core.request_context import memoize
+from app.core.ids import as_object_id, normalize_ref, ref_variants
+from app.services.analytics_rollups import analytics_rollups
+from app.services.lead_scoring import lead_scorer
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
 
 class CRMService:
-    def __init__(self):
-        self.openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
     async def extract_user_info(self, message: str, user_id: str) -> Dict:
         """
         Extract user information from messages using AI
         """
+        return await memoize(("crm_service.extraction", message), lambda: self._extract_user_info(message))
+
+    async def _extract_user_info(self, message: str) -> Dict:
         prompt = f"""
         Extract the following information from this message: "{message}"
         
@@ -27,9 +39,9 @@ class CRMService:
         """
         
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
+            response = await llm_gateway.chat(
+                "extraction",
+                [{"role": "user", "content": prompt}],
                 max_tokens=200
             )
             # Parse the response (in production, you'd want better JSON parsing)
@@ -65,7 +77,7 @@ class CRMService:
         Create a new lead in the CRM
         """
         lead = {
-            "user_id": user_id,
+            "user_id": normalize_ref(user_id),
             "extracted_info": extracted_info,
             "status": "new",
             "created_at": datetime.utcnow(),
@@ -76,18 +88,63 @@ class CRMService:
         
         result = await db.leads.insert_one(lead)
         lead["_id"] = result.inserted_id
+        lead_scorer.touch_lead(lead["_id"])
         return lead
     
+    @staticmethod
+    def _new_lead_fields(extracted_info: Dict) -> Dict:
+        now = datetime.utcnow()
+        return {
+            "extracted_info": extracted_info,
+            "status": "new",
+            "created_at": now,
+            "last_contact": now,
+            "notes": [],
+            "follow_up_date": now + timedelta(days=1)
+        }
+
+    async def queue_lead_upsert(self, user_id: str, extracted_info: Dict) -> None:
+        """
+        Create a lead for the user unless they have one, via the write-behind queue.
+
+        Any existing lead matches (whether or not `mark_primary_leads` has run);
+        a created lead is marked primary, so the leads.user_primary_unique index
+        turns a concurrent second insert into a duplicate-key no-op.
+        """
+        await write_behind.upsert("leads", {"user_id": {"$in": ref_variants(user_id)}},
+                                  {"$setOnInsert": {"user_id": normalize_ref(user_id), "primary": True,
+                                                    **self._new_lead_fields(extracted_info)}})
+        # The lead id isn't known until the flush; rescore by user
+        lead_scorer.touch_user(user_id)
+    
     async def update_lead(self, lead_id: str, updates: Dict) -> Dict:
         """
         Update lead information
         """
         updates["last_contact"] = datetime.utcnow()
-        result = await db.leads.update_one(
-            {"_id": lead_id},
-            {"$set": updates}
+        lead_obj_id = as_object_id(lead_id)
+        if lead_obj_id is None:
+            return {"updated": False}
+        lead_scorer.touch_lead(lead_obj_id)
+        if "status" not in updates:
+            result = await db.leads.update_one(
+                {"_id": lead_obj_id},
+                {"$set": updates}
+            )
+            return {"updated": result.modified_count > 0}
+        # Status changes also move the lead between the rolled-up status counters
+        before = await db.leads.find_one_and_update(
+            {"_id": lead_obj_id},
+            {"$set": updates},
+            projection={"status": 1, "created_at": 1},
+            return_document=ReturnDocument.BEFORE
         )
-        return {"updated": result.modified_count > 0}
+        if before is None:
+            return {"updated": False}
+        # Undated legacy leads are not in the rollups until `rollups rebuild` dates them
+        if before.get("created_at") is not None:
+            await analytics_rollups.record_lead_status(before.get("status"), updates["status"])
+        return {"updated": True}
     
     async def add_note_to_lead(self, lead_id: str, note: str) -> Dict:
         """
@@ -97,18 +154,21 @@ class CRMService:
             "content": note,
             "created_at": datetime.utcnow()
         }
-        
+        lead_obj_id = as_object_id(lead_id)
+        if lead_obj_id is None:
+            return {"added": False}
         result = await db.leads.update_one(
-            {"_id": lead_id},
+            {"_id": lead_obj_id},
             {"$push": {"notes": note_entry}}
         )
+        lead_scorer.touch_lead(lead_obj_id)
         return {"added": result.modified_count > 0}
     
     async def get_leads_by_user(self, user_id: str) -> List[Dict]:
         """
         Get all leads for a user
         """
-        return [lead async for lead in db.leads.find({"user_id": user_id})]
+        return [lead async for lead in db.leads.find({"user_id": normalize_ref(user_id)})]
     
     async def get_leads_needing_followup(self) -> List[Dict]:
         """
@@ -125,8 +185,62 @@ class CRMService:
         Schedule a follow-up for a lead
         """
         follow_up_date = datetime.utcnow() + timedelta(days=days_from_now)
+        lead_obj_id = as_object_id(lead_id)
+        if lead_obj_id is None:
+            return {"scheduled": False}
         result = await db.leads.update_one(
-            {"_id": lead_id},
+            {"_id": lead_obj_id},
             {"$set": {"follow_up_date": follow_up_date}}
         )
-        return {"scheduled": result.modified_count > 0} 
\ No newline at end of file
+        return {"scheduled": result.modified_count > 0} 
+
+
+async def mark_primary_leads(database, batch_size: int = 500, pause_s: float = 0.05,
+                             dry_run: bool = False) -> Dict[str, int]:
+    """
+    Mark the oldest lead of every user without a primary lead as `primary: True`.
+
+    Idempotent and safe while serving: each update only matches a lead that is
+    still unmarked, and a user who got a primary lead concurrently is skipped
+    by the leads.user_primary_unique index. Run `ids migrate` first so a
+    user's string and ObjectId references are grouped together.
+    """
+    stats = {"users": 0, "marked": 0, "skipped": 0, "batches": 0}
+    pipeline = [
+        {"$sort": {"user_id": 1, "created_at": 1, "_id": 1}},
+        {"$group": {
+            "_id": "$user_id",
+            "oldest": {"$first": "$_id"},
+            "has_primary": {"$max": {"$eq": ["$primary", True]}},
+        }},
+        {"$match": {"has_primary": False}},
+    ]
+    requests: List[Any] = []
+
+    async def write() -> None:
+        stats["batches"] += 1
+        if dry_run:
+            stats["marked"] += len(requests)
+            return
+        try:
+            result = await database.leads.bulk_write(requests, ordered=False)
+            stats["marked"] += result.modified_count
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != DUPLICATE_KEY for err in errors):
+                raise
+            stats["marked"] += e.details.get("nModified", 0)
+            stats["skipped"] += len(errors)
+        if pause_s:
+            await asyncio.sleep(pause_s)
+
+    async for row in database.leads.aggregate(pipeline, allowDiskUse=True):
+        stats["users"] += 1
+        requests.append(UpdateOne({"_id": row["oldest"], "primary": {"$exists": False}}, {"$set": {"primary": True}}))
+        if len(requests) >= batch_size:
+            await write()
+            requests = []
+    if requests:
+        await write()
+    logger.info(f"Primary lead migration: {stats}")
+    return stats
@@ -0,0 +1,156 @@
+# app/services/exports.py
+"""
+Streaming exports of CRM collections for BI.
+
+Documents are read from a Mongo cursor `EXPORT_BATCH_SIZE` at a time and
+encoded as NDJSON (one JSON object per line) or CSV. Each batch is yielded as
+one chunk, optionally through an incremental gzip compressor, so an export of
+any size starts sending after the first batch and holds one batch in memory.
+
+    query = build_query("leads", start=datetime(2026, 1, 1), status="new")
+    chunks = export_chunks("leads", "csv", query, compress=True)
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+from bson import ObjectId
+from pymongo import ASCENDING
+from dotenv import load_dotenv
+
+from app.core.mongo import db
+from app.core.ids import ref_variants
+
+load_dotenv()
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+class ExportSpec:
+    """What one export reads: collection, date-range field, CSV columns and allowed filters."""
+
+    def __init__(self, collection: str, time_field: str, columns: List[str], filters: List[str]):
+        self.collection = collection
+        self.time_field = time_field
+        self.columns = columns
+        self.filters = filters
+
+
+EXPORTS: Dict[str, ExportSpec] = {
+    "users": ExportSpec("users", "created_at", ["_id", "email", "name", "company", "created_at"], []),
+    "conversations": ExportSpec(
+        "conversations", "started_at",
+        ["_id", "user_id", "started_at", "message_count", "last_message_at"], ["user_id"],
+    ),
+    "messages": ExportSpec(
+        "messages", "created_at", ["_id", "conversation_id", "role", "content", "created_at"], ["conversation_id"],
+    ),
+    "leads": ExportSpec(
+        "leads", "created_at",
+        ["_id", "user_id", "status", "score", "created_at", "last_contact", "follow_up_date", "extracted_info", "notes"],
+        ["user_id", "status"],
+    ),
+}
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _cell(value: Any) -> Any:
+    """CSV cell: scalars as text, nested values as JSON."""
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_default, separators=(",", ":"))
+    if isinstance(value, (ObjectId, datetime, date)):
+        return _default(value)
+    return value
+
+
+def build_query(kind: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                **filters: Optional[str]) -> Dict[str, Any]:
+    """Mongo filter for an export; raises ValueError for bad ranges or unsupported filters."""
+    spec = EXPORTS[kind]
+    if start and end and start >= end:
+        raise ValueError("start must be before end")
+    query: Dict[str, Any] = {}
+    if start or end:
+        query[spec.time_field] = {**({"$gte": start} if start else {}), **({"$lt": end} if end else {})}
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if name not in spec.filters:
+            raise ValueError(f"{kind} exports cannot be filtered by {name}")
+        # References may still be stored as legacy strings (app/core/ids.py)
+        query[name] = {"$in": ref_variants(value)} if name.endswith("_id") else value
+    return query
+
+
+async def iter_batches(kind: str, query: Dict[str, Any], batch_size: int = EXPORT_BATCH_SIZE,
+                       database=None) -> AsyncIterator[List[Dict]]:
+    """Matching documents, oldest first, in lists of at most `batch_size`."""
+    spec = EXPORTS[kind]
+    database = database if database is not None else db
+    cursor = database[spec.collection].find(query).sort(spec.time_field, ASCENDING).batch_size(batch_size)
+    batch: List[Dict] = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def encode_ndjson(docs: List[Dict]) -> bytes:
+    return "".join(json.dumps(doc, default=_default, separators=(",", ":")) + "\n" for doc in docs).encode()
+
+
+def encode_csv(docs: List[Dict], columns: List[str], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([_cell(doc.get(column)) for column in columns] for doc in docs)
+    return buffer.getvalue().encode()
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = EXPORT_GZIP_LEVEL) -> AsyncIterator[bytes]:
+    """Compress a byte stream into one gzip member, flushing after every chunk so it keeps streaming."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def export_chunks(kind: str, fmt: str, query: Dict[str, Any], compress: bool = False,
+                        batch_size: int = EXPORT_BATCH_SIZE, database=None) -> AsyncIterator[bytes]:
+    """Encoded export body, one chunk per cursor batch (CSV starts with its header)."""
+    columns = EXPORTS[kind].columns
+
+    async def encoded() -> AsyncIterator[bytes]:
+        if fmt == "csv":
+            yield encode_csv([], columns, header=True)
+        async for batch in iter_batches(kind, query, batch_size, database):
+            yield encode_ndjson(batch) if fmt == "ndjson" else encode_csv(batch, columns)
+
+    if compress:
+        async for chunk in gzip_chunks(encoded()):
+            yield chunk
+    else:
+        async for chunk in encoded():
+            yield chunk
@@ -0,0 +1,285 @@
+# app/services/lead_scoring.py
+"""
+Lead scoring.
+
+Each lead gets a 0-100 score from six features in [0, 1], computed in batch as
+NumPy columns and combined with configurable weights (LEAD_SCORE_WEIGHTS).
+Each field is read from the lead documents in one `np.fromiter` pass; labels
+are mapped once per distinct value and per-user activity is gathered by row
+index, so everything after extraction is array arithmetic:
+
+    recency     exponential decay since the last contact or chat message
+    messages    chat messages by the lead's user (log-scaled)
+    budget      a budget was mentioned
+    urgency     extracted urgency (high / medium / low)
+    follow_up   pipeline stage from the lead status (0 once closed)
+    engagement  conversations plus CRM notes (log-scaled)
+
+Scores are stored on the lead with `scored_at` and read back with a sorted
+top-N query on the `score` index. A background job rescores the leads touched
+since its last run (chat turns, lead updates) and rescores everything every
+LEAD_SCORE_FULL_EVERY_S so recency keeps decaying. Touched leads are tracked
+per worker; full runs happen in the one worker holding the "lead_scoring"
+lease (app/core/leases.py), which also records when the last one finished.
+"""
+
+import asyncio
+import json
+import os
+import time
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+from app.core.mongo import db
+from app.core.ids import normalize_ref
+from app.core.leases import job_lease
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEIGHTS = {
+    "recency": 0.25,
+    "messages": 0.15,
+    "budget": 0.15,
+    "urgency": 0.2,
+    "follow_up": 0.1,
+    "engagement": 0.15,
+}
+LEAD_SCORE_WEIGHTS: Dict[str, float] = {**DEFAULT_WEIGHTS, **json.loads(os.getenv("LEAD_SCORE_WEIGHTS") or "{}")}
+LEAD_SCORING_ENABLED = os.getenv("LEAD_SCORING_ENABLED", "true").lower() == "true"
+LEAD_SCORE_INTERVAL_S = float(os.getenv("LEAD_SCORE_INTERVAL_S", "60"))
+LEAD_SCORE_FULL_EVERY_S = float(os.getenv("LEAD_SCORE_FULL_EVERY_S", "86400"))
+LEAD_SCORE_BATCH = int(os.getenv("LEAD_SCORE_BATCH", "5000"))
+LEAD_SCORE_HALF_LIFE_DAYS = float(os.getenv("LEAD_SCORE_HALF_LIFE_DAYS", "7"))
+
+# Feature saturation points: this many messages / conversations+notes score 1.0
+MESSAGE_SATURATION = 50
+ENGAGEMENT_SATURATION = 10
+
+URGENCY_LEVELS = {"high": 1.0, "medium": 0.5, "low": 0.1}
+UNKNOWN_URGENCY = 0.3
+STATUS_PROGRESS = {"new": 0.4, "contacted": 0.6, "qualified": 0.8, "negotiating": 0.9, "closed": 0.0, "lost": 0.0}
+UNKNOWN_STATUS = 0.4
+
+LEAD_FIELDS = {"user_id": 1, "extracted_info": 1, "status": 1, "last_contact": 1, "created_at": 1, "notes": 1}
+
+
+def _epoch(moment: Optional[datetime]) -> float:
+    return moment.timestamp() if isinstance(moment, datetime) else 0.0
+
+
+def _labels(values: Iterable[Any], n: int) -> Tuple[np.ndarray, List[Any]]:
+    """A column of labels as integer codes, plus the distinct labels in code order."""
+    codes: Dict[Any, int] = {}
+    column = np.fromiter((codes.setdefault(value, len(codes)) for value in values), np.int64, n)
+    return column, list(codes)
+
+
+def _mapped(values: Iterable[Any], n: int, table: Dict[str, float], default: float,
+            normalize=lambda label: label) -> np.ndarray:
+    """Map a column of labels through `table`, one lookup per distinct label."""
+    column, labels = _labels(values, n)
+    return np.array([table.get(normalize(label), default) for label in labels] + [default])[column]
+
+
+def build_features(leads: List[Dict], activity: Dict[Any, Dict], now: datetime) -> Dict[str, np.ndarray]:
+    """Feature columns for `leads`; `activity` maps user_id -> conversations/messages/last_message_at."""
+    n = len(leads)
+    info = [lead.get("extracted_info") or {} for lead in leads]
+    last_contact = np.fromiter((_epoch(lead.get("last_contact") or lead.get("created_at")) for lead in leads),
+                               float, n)
+    notes = np.fromiter((len(lead.get("notes") or ()) for lead in leads), float, n)
+    has_budget = np.fromiter((bool(i.get("budget")) for i in info), float, n)
+    urgency = _mapped((i.get("urgency") for i in info), n, URGENCY_LEVELS, UNKNOWN_URGENCY,
+                      lambda label: str(label or "").lower())
+    status = _mapped((lead.get("status") for lead in leads), n, STATUS_PROGRESS, UNKNOWN_STATUS)
+
+    # Per-user activity columns gathered by row index; the extra last row is "no activity"
+    users = list(activity.values())
+    rows = {user_id: row for row, user_id in enumerate(activity)}
+    row = np.fromiter((rows.get(lead.get("user_id"), -1) for lead in leads), np.int64, n)
+    messages = np.array([u.get("messages", 0) for u in users] + [0], dtype=float)[row]
+    conversations = np.array([u.get("conversations", 0) for u in users] + [0], dtype=float)[row]
+    last_message = np.array([_epoch(u.get("last_message_at")) for u in users] + [0.0])[row]
+
+    idle_days = np.maximum(0.0, (now.timestamp() - np.maximum(last_contact, last_message)) / 86400)
+    return {
+        "recency": np.exp2(-idle_days / LEAD_SCORE_HALF_LIFE_DAYS),
+        "messages": np.minimum(1.0, np.log1p(messages) / np.log1p(MESSAGE_SATURATION)),
+        "budget": has_budget,
+        "urgency": urgency,
+        "follow_up": status,
+        "engagement": np.minimum(1.0, np.log1p(conversations + notes) / np.log1p(ENGAGEMENT_SATURATION)),
+    }
+
+
+def apply_weights(features: Dict[str, np.ndarray], weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """Weighted average of the feature columns, scaled to 0-100."""
+    weights = {name: w for name, w in (weights or LEAD_SCORE_WEIGHTS).items() if w and name in features}
+    if not weights:
+        raise ValueError("Lead score weights are all zero")
+    matrix = np.column_stack([features[name] for name in weights])
+    vector = np.array(list(weights.values()), dtype=float)
+    return np.round(100 * (matrix @ vector) / vector.sum(), 1)
+
+
+class LeadScorer:
+    """Batch scorer with incremental rescoring of touched users and leads."""
+
+    def __init__(self, interval: float = LEAD_SCORE_INTERVAL_S, full_every: float = LEAD_SCORE_FULL_EVERY_S,
+                 batch_size: int = LEAD_SCORE_BATCH, enabled: bool = LEAD_SCORING_ENABLED, database=None):
+        self.interval = interval
+        self.full_every = full_every
+        self.batch_size = batch_size
+        self.enabled = enabled
+        self.database = database
+        self._dirty_users: Set[Any] = set()
+        self._dirty_leads: Set[Any] = set()
+        self.lease = job_lease("lead_scoring", interval, database)
+        self._leader = False
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"runs": 0, "full_runs": 0, "scored": 0, "failures": 0, "last_run_ms": None}
+
+    @property
+    def db(self):
+        return self.database if self.database is not None else db
+
+    # ---------- change tracking ----------
+    def touch_user(self, user_id: Any) -> None:
+        """Rescore this user's leads on the next run (new messages, new lead)."""
+        if self.enabled and user_id is not None:
+            self._dirty_users.add(normalize_ref(user_id))
+
+    def touch_lead(self, lead_id: Any) -> None:
+        """Rescore this lead on the next run."""
+        if self.enabled and lead_id is not None:
+            self._dirty_leads.add(normalize_ref(lead_id))
+
+    # ---------- scoring ----------
+    async def _activity(self, user_ids: Iterable[Any]) -> Dict[Any, Dict]:
+        pipeline = [
+            {"$match": {"user_id": {"$in": list(user_ids)}}},
+            {"$group": {
+                "_id": "$user_id",
+                "conversations": {"$sum": 1},
+                "messages": {"$sum": {"$ifNull": ["$message_count", 0]}},
+                "last_message_at": {"$max": "$last_message_at"},
+            }},
+        ]
+        rows = await self.db.conversations.aggregate(pipeline).to_list(None)
+        return {row["_id"]: row for row in rows}
+
+    async def _score_batch(self, leads: List[Dict], now: datetime) -> int:
+        activity = await self._activity({lead.get("user_id") for lead in leads})
+        scores = apply_weights(build_features(leads, activity, now))
+        requests = [
+            UpdateOne({"_id": lead["_id"]}, {"$set": {"score": float(score), "scored_at": now}})
+            for lead, score in zip(leads, scores)
+        ]
+        if requests:
+            await self.db.leads.bulk_write(requests, ordered=False)
+        return len(requests)
+
+    async def score(self, query: Optional[Dict] = None, renew_lease: bool = False) -> int:
+        """Score every lead matching `query` (all leads by default), batch by batch."""
+        now = datetime.utcnow()
+        scored = 0
+        batch: List[Dict] = []
+        async for lead in self.db.leads.find(query or {}, LEAD_FIELDS):
+            batch.append(lead)
+            if len(batch) >= self.batch_size:
+                scored += await self._score_batch(batch, now)
+                batch = []
+                if renew_lease:
+                    # Long full runs keep the lease, so no other worker starts one too
+                    await self.lease.acquire()
+        if batch:
+            scored += await self._score_batch(batch, now)
+        return scored
+
+    async def _full_run_due(self) -> bool:
+        """True in the lease holder once LEAD_SCORE_FULL_EVERY_S passed since the last full run."""
+        self._leader = await self.lease.acquire()
+        if not self._leader:
+            return False
+        last_full = (await self.lease.state()).get("last_full_at")
+        return last_full is None or (datetime.utcnow() - last_full).total_seconds() >= self.full_every
+
+    async def run(self, full: bool = False) -> Dict:
+        """Rescore touched leads, or all of them when `full` or a full run is due."""
+        started = time.perf_counter()
+        due = not full and await self._full_run_due()
+        if full or due:
+            self._dirty_users.clear()
+            self._dirty_leads.clear()
+            scored = await self.score(renew_lease=due)
+            if due:
+                await self.lease.save(last_full_at=datetime.utcnow())
+            self.stats["full_runs"] += 1
+        else:
+            users, leads = self._dirty_users, self._dirty_leads
+            self._dirty_users, self._dirty_leads = set(), set()
+            if not users and not leads:
+                return {"full": False, "scored": 0}
+            try:
+                scored = await self.score({"$or": [{"user_id": {"$in": list(users)}}, {"_id": {"$in": list(leads)}}]})
+            except Exception:
+                # Retry these on the next run
+                self._dirty_users |= users
+                self._dirty_leads |= leads
+                raise
+        self.stats["runs"] += 1
+        self.stats["scored"] += scored
+        self.stats["last_run_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return {"full": full or due, "scored": scored, "ms": self.stats["last_run_ms"]}
+
+    async def top(self, limit: int = 100) -> List[Dict]:
+        """Highest-scored leads, served by the leads.score index."""
+        cursor = self.db.leads.find({"score": {"$exists": True}}).sort("score", -1).limit(limit)
+        return await cursor.to_list(limit)
+
+    # ---------- lifecycle ----------
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.error(f"Lead scoring run failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._leader:
+            await self.lease.release()
+            self._leader = False
+
+    def snapshot(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "leader": self._leader,
+            "weights": LEAD_SCORE_WEIGHTS,
+            "pending_users": len(self._dirty_users),
+            "pending_leads": len(self._dirty_leads),
+            **self.stats,
+        }
+
+
+# Shared instance: services mark changes on it, the container runs its loop
+lead_scorer = LeadScorer()
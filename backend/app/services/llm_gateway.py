@@ -0,0 +1,156 @@
+# app/services/llm_gateway.py
+"""
+Shared entry point for OpenAI chat and embedding calls.
+
+Every call is routed to a model, admitted by the shared rate limiter and
+retried with jittered backoff. Retries re-enter the limiter, so a burst of
+429s slows the whole worker down instead of turning into a retry storm.
+Interactive calls may additionally be hedged (see request_hedging.py).
+"""
+
+import asyncio
+import os
+import time
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+import openai
+from tenacity import AsyncRetrying, stop_after_attempt, wait_random_exponential, retry_if_exception_type
+
+from app.core.openai_client import get_openai_client
+from app.services.model_router import ModelRouter, model_router, estimate_tokens
+from app.services.rate_limiter import AdaptiveRateLimiter, Priority, openai_limiter
+from app.services.request_hedging import HedgingPolicy
+from app.services.rag_telemetry import rag_telemetry
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+MAX_ATTEMPTS = int(os.getenv("OPENAI_MAX_ATTEMPTS", "3"))
+DEFAULT_COMPLETION_TOKENS = 256
+# Telemetry latency field per event kind (retrievals use retrieval_ms, see rag_service.py)
+STAGE_FIELDS = {"llm": "llm_ms", "embedding": "embed_ms"}
+
+RETRYABLE = retry_if_exception_type((
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+))
+
+
+class LLMGateway:
+    """Rate-limited, routed access to OpenAI chat completions and embeddings."""
+
+    def __init__(self, limiter: Optional[AdaptiveRateLimiter] = None,
+                 router: Optional[ModelRouter] = None,
+                 hedging: Optional[HedgingPolicy] = None,
+                 client_factory: Callable = get_openai_client):
+        self.limiter = limiter or openai_limiter
+        self.router = router or model_router
+        self.hedging = hedging or HedgingPolicy(self.router)
+        self.client_factory = client_factory
+        # The worker's event loop, set at startup; chat_sync runs calls on it
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def chat(self, task: str, messages: List[Dict], max_tokens: Optional[int] = None,
+                   items: Optional[int] = None, route_text: Optional[str] = None,
+                   priority: Priority = Priority.INTERACTIVE, model: Optional[str] = None) -> str:
+        """Run a chat completion and return the assistant text."""
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        model = model or self.router.choose(task, route_text or prompt, items=items)
+        tokens = estimate_tokens(prompt) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+        async def call():
+            kwargs = {"model": model, "messages": messages}
+            if max_tokens:
+                kwargs["max_tokens"] = max_tokens
+            response = await self.client_factory().chat.completions.create(**kwargs)
+            return response.choices[0].message.content.strip()
+
+        return await self._timed("llm", self._call(model, call, priority, tokens),
+                                 task=task, model=model, priority=priority.name.lower())
+
+    def chat_sync(self, task: str, messages: List[Dict], **kwargs) -> str:
+        """
+        Blocking `chat` for synchronous callers (MCP tools) running in worker threads.
+
+        The call runs on the worker's event loop so it shares the limiter and
+        client with everything else; without one (scripts) it gets its own loop.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("chat_sync() would block the event loop; await llm_gateway.chat() instead")
+        if self.loop is not None and self.loop.is_running():
+            return asyncio.run_coroutine_threadsafe(self.chat(task, messages, **kwargs), self.loop).result()
+        return asyncio.run(self.chat(task, messages, **kwargs))
+
+    async def embed(self, texts: List[str], model: str = EMBEDDING_MODEL,
+                    priority: Priority = Priority.INTERACTIVE) -> List[List[float]]:
+        """Embed a batch of texts, preserving order."""
+        tokens = sum(estimate_tokens(text) for text in texts)
+
+        async def call():
+            response = await self.client_factory().embeddings.create(model=model, input=texts)
+            return [item.embedding for item in response.data]
+
+        return await self._timed("embedding", self._call(model, call, priority, tokens),
+                                 model=model, texts=len(texts), priority=priority.name.lower())
+
+    @staticmethod
+    async def _timed(kind: str, call: Awaitable, **fields):
+        """Await `call` and emit a telemetry event with its latency (retries and queueing included)."""
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await call
+            ok = True
+            return result
+        finally:
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+            rag_telemetry.record(kind, **{STAGE_FIELDS[kind]: elapsed_ms}, ok=ok, **fields)
+
+    async def _call(self, model: str, call: Callable, priority: Priority, tokens: float):
+        async def attempt_once():
+            async with self.limiter.slot(priority, tokens) as permit:
+                started = time.perf_counter()
+                try:
+                    result = await call()
+                except asyncio.CancelledError:
+                    # A hedge loser took at least this long; leaving it out would bias percentiles low
+                    self.router.record(model, (time.perf_counter() - started) * 1000)
+                    raise
+                except openai.RateLimitError:
+                    permit.rate_limited()
+                    self.router.record(model, (time.perf_counter() - started) * 1000, ok=False)
+                    raise
+                except Exception:
+                    self.router.record(model, (time.perf_counter() - started) * 1000, ok=False)
+                    raise
+                self.router.record(model, (time.perf_counter() - started) * 1000)
+                return result
+
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(MAX_ATTEMPTS),
+            wait=wait_random_exponential(multiplier=0.5, max=10),
+            retry=RETRYABLE,
+            reraise=True,
+        ):
+            with attempt:
+                # Only user-facing calls are worth the extra load of a hedge
+                if priority == Priority.INTERACTIVE:
+                    return await self.hedging.run(model, attempt_once)
+                return await attempt_once()
+
+    def snapshot(self) -> Dict:
+        """Router, limiter and hedging state for diagnostics."""
+        return {
+            **self.router.snapshot(),
+            "rate_limiter": self.limiter.snapshot(),
+            "hedging": self.hedging.snapshot(),
+        }
+
+
+# Shared gateway used by the services
+llm_gateway = LLMGateway()
@@ -0,0 +1,236 @@
+# app/services/model_router.py
+"""
+Latency-aware model routing for OpenAI chat calls.
+
+Picks a model per request from the task type, the prompt size and the
+configured latency SLO, and keeps per-model latency histograms so the
+routing table can be tuned from real traffic.
+
+Histogram weights decay with a half-life, so an SLO downgrade reflects recent
+latency only. While downgraded, a small probe fraction of requests still goes
+to the large model; once its fresh samples are back under the SLO (or too few
+samples remain), routing returns to the large model.
+"""
+
+import os
+import re
+import random
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "gpt-4o-mini")
+LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "gpt-4")
+LATENCY_SLO_MS = float(os.getenv("LLM_LATENCY_SLO_MS", "4000"))
+LARGE_PROMPT_TOKENS = int(os.getenv("LLM_LARGE_PROMPT_TOKENS", "1500"))
+COMPLEX_CONSTRAINTS = int(os.getenv("LLM_COMPLEX_CONSTRAINTS", "3"))
+# Observations needed before a histogram is trusted for SLO decisions
+MIN_SLO_SAMPLES = 20
+# Older latency samples count half as much every this many seconds
+LATENCY_HALF_LIFE_S = float(os.getenv("LLM_LATENCY_HALF_LIFE_S", "600"))
+# Share of downgraded requests still sent to the large model, to notice recovery
+SLO_PROBE_FRACTION = float(os.getenv("LLM_SLO_PROBE_FRACTION", "0.05"))
+
+# Histogram bucket upper bounds in milliseconds (last bucket is open-ended)
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000, 8000, 13000, 21000, 34000]
+
+# tier:               model tier used by default for the task
+# max_small_items:    escalate to the large tier above this many items (e.g. listings)
+# complex_tier:       tier for multi-constraint prompts
+# escalate_on_size:   use the large tier for prompts above LARGE_PROMPT_TOKENS
+# slo_downgrade:      fall back to the small tier when the large one breaks the SLO
+ROUTING_TABLE: Dict[str, Dict] = {
+    "extraction": {"tier": "small"},
+    "conversation_summary": {"tier": "small"},
+    "summary": {"tier": "small", "max_small_items": 3, "complex_tier": "large", "slo_downgrade": True},
+    "chat": {"tier": "small", "complex_tier": "large", "escalate_on_size": True, "slo_downgrade": True},
+    "complex_qa": {"tier": "large", "slo_downgrade": False},
+}
+
+# Constraint categories used to detect multi-constraint questions
+CONSTRAINT_PATTERNS = {
+    "price": re.compile(r"\$\s?\d|\bbudget\b|\bprice\b|\bunder\s+\d|\b\d+\s?(k|m)\b", re.I),
+    "bedrooms": re.compile(r"\b\d+\s*(bed|br|bedroom)s?\b|\bbedrooms?\b", re.I),
+    "bathrooms": re.compile(r"\b\d+(\.\d)?\s*(bath|ba|bathroom)s?\b", re.I),
+    "size": re.compile(r"\b\d[\d,]*\s*(sq\.?\s?ft|sqft|square feet)\b", re.I),
+    # A bare "in" is in most sentences, so it only counts before a capitalised place name
+    "location": re.compile(r"\b(near|around|downtown|suburb\w*|waterfront|close to)\b|(?-i:\bin\s+[A-Z][a-z]+)", re.I),
+    "amenities": re.compile(r"\b(parking|pool|gym|garage|balcony|elevator|pet[s-]?friendly|laundry)\b", re.I),
+    "timeline": re.compile(r"\b(by|before|within|next)\s+(week|month|year|\w+day|january|february|march|april|may|june|july|august|september|october|november|december)\b", re.I),
+    "property_type": re.compile(r"\b(house|condo|townhouse|apartment|office|retail|studio|loft)\b", re.I),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) without loading a tokenizer."""
+    return max(1, len(text) // 4)
+
+
+def count_constraints(text: str) -> int:
+    """Number of distinct constraint categories mentioned in the text."""
+    return sum(1 for pattern in CONSTRAINT_PATTERNS.values() if pattern.search(text))
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram with approximate percentiles.
+
+    `counts` and `count` are lifetime totals. Percentiles use `weights`, which
+    decay with `half_life_s` (never, when None) so they follow recent traffic.
+    """
+
+    def __init__(self, buckets: Optional[List[float]] = None, half_life_s: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.buckets = list(buckets or LATENCY_BUCKETS_MS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.weights = [0.0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.weight = 0.0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.half_life_s = half_life_s
+        self._clock = clock
+        self._decayed_at = clock()
+
+    def _decay(self) -> None:
+        if not self.half_life_s:
+            return
+        now = self._clock()
+        if now <= self._decayed_at:
+            return
+        factor = 0.5 ** ((now - self._decayed_at) / self.half_life_s)
+        self.weights = [w * factor for w in self.weights]
+        self.weight *= factor
+        self._decayed_at = now
+
+    def observe(self, latency_ms: float) -> None:
+        """Record one successful call."""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if latency_ms <= bound:
+                index = i
+                break
+        self._decay()
+        self.counts[index] += 1
+        self.weights[index] += 1.0
+        self.count += 1
+        self.weight += 1.0
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def recent_samples(self) -> float:
+        """Decayed number of observations (equals `count` without decay)."""
+        self._decay()
+        return self.weight
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile (0 < q <= 1)."""
+        self._decay()
+        if not self.count:
+            return None
+        rank = q * self.weight
+        seen = 0.0
+        for i, bucket_weight in enumerate(self.weights):
+            seen += bucket_weight
+            if seen >= rank and bucket_weight:
+                return float(self.buckets[i]) if i < len(self.buckets) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> Dict:
+        """Serializable view of the histogram."""
+        labels = [f"le_{b}" for b in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "recent": round(self.recent_samples(), 1),
+            "errors": self.errors,
+            "mean_ms": round(self.total_ms / self.count, 1) if self.count else None,
+            "p50_ms": self.percentile(0.50),
+            "p90_ms": self.percentile(0.90),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 1),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class ModelRouter:
+    """Chooses a model per request and records per-model latency."""
+
+    def __init__(self, small_model: str = SMALL_MODEL, large_model: str = LARGE_MODEL,
+                 slo_ms: float = LATENCY_SLO_MS, routing_table: Optional[Dict[str, Dict]] = None,
+                 half_life_s: Optional[float] = LATENCY_HALF_LIFE_S, probe_fraction: float = SLO_PROBE_FRACTION,
+                 clock: Callable[[], float] = time.monotonic):
+        self.models = {"small": small_model, "large": large_model}
+        self.slo_ms = slo_ms
+        self.routing_table = routing_table or ROUTING_TABLE
+        self.half_life_s = half_life_s
+        self.probe_fraction = probe_fraction
+        self._clock = clock
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def choose(self, task: str, prompt: str = "", items: Optional[int] = None,
+               slo_ms: Optional[float] = None) -> str:
+        """Return the model name to use for this request."""
+        spec = self.routing_table.get(task, {"tier": "large"})
+        tier = spec.get("tier", "large")
+
+        max_small_items = spec.get("max_small_items")
+        if items is not None and max_small_items is not None and items > max_small_items:
+            tier = "large"
+        if spec.get("complex_tier") and count_constraints(prompt) >= COMPLEX_CONSTRAINTS:
+            tier = spec["complex_tier"]
+        if spec.get("escalate_on_size") and estimate_tokens(prompt) > LARGE_PROMPT_TOKENS:
+            tier = "large"
+
+        if tier == "large" and spec.get("slo_downgrade"):
+            observed = self.get_percentile(self.models["large"], 0.95)
+            if observed is not None and observed > (slo_ms or self.slo_ms):
+                if random.random() < self.probe_fraction:
+                    # Keeps fresh large-model samples coming, so the downgrade can end
+                    logger.debug(f"Large model p95 {observed:.0f}ms exceeds SLO, probing it with {task}")
+                else:
+                    logger.info(f"Large model p95 {observed:.0f}ms exceeds SLO, routing {task} to small model")
+                    tier = "small"
+
+        return self.models[tier]
+
+    def get_percentile(self, model: str, q: float, min_samples: int = MIN_SLO_SAMPLES) -> Optional[float]:
+        """Observed latency percentile for a model, or None until enough samples exist."""
+        with self._lock:
+            histogram = self.histograms.get(model)
+            if not histogram or histogram.recent_samples() < min_samples:
+                return None
+            return histogram.percentile(q)
+
+    def record(self, model: str, latency_ms: float, ok: bool = True) -> None:
+        """Record the outcome of a call to `model`."""
+        with self._lock:
+            histogram = self.histograms.get(model)
+            if histogram is None:
+                histogram = self.histograms[model] = LatencyHistogram(half_life_s=self.half_life_s, clock=self._clock)
+            if ok:
+                histogram.observe(latency_ms)
+            else:
+                histogram.errors += 1
+
+    def snapshot(self) -> Dict:
+        """Routing configuration and per-model latency histograms."""
+        with self._lock:
+            return {
+                "models": dict(self.models),
+                "slo_ms": self.slo_ms,
+                "routing_table": self.routing_table,
+                "latency": {model: h.snapshot() for model, h in self.histograms.items()},
+            }
+
+
+# Shared router used by all LLM call sites
+model_router = ModelRouter()
@@ -1,35 +1,52 @@
 from app.core.mongo import db
 from typing import Optional
-from bson import ObjectId
 from datetime import datetime
 from app.services.mongo_user_service import MongoUserService
+from app.services.write_behind import write_behind
+from app.services.conversation_cache import conversation_cache
+from app.core.ids import as_object_id
 
 async def resolve_user_id(user_id: str):
-    try:
-        return ObjectId(user_id)
-    except Exception:
-        # Treat as email, look up or create user
-        user = await MongoUserService.get_or_create_user_by_email(user_id)
-        return user['_id']
+    oid = as_object_id(user_id)
+    if oid is not None:
+        return oid
+    # Treat as email, look up or create user
+    user = await MongoUserService.get_or_create_user_by_email(user_id)
+    return user['_id']
 
 class MongoConversationService:
     @staticmethod
-    async def create_conversation(user_id: str):
+    async def create_conversation(user_id: str, deferred: bool = False):
+        """Create a conversation; `deferred` hands the insert to the write-behind queue."""
         user_obj_id = await resolve_user_id(user_id)
         conversation = {
             "user_id": user_obj_id,
             "started_at": datetime.utcnow(),
         }
-        result = await db.conversations.insert_one(conversation)
-        conversation["_id"] = result.inserted_id
+        if deferred:
+            conversation = await write_behind.insert("conversations", conversation)
+        else:
+            result = await db.conversations.insert_one(conversation)
+            conversation["_id"] = result.inserted_id
+        conversation_cache.put_conversation(conversation, new=True)
         return conversation
 
     @staticmethod
     async def get_conversation(conversation_id: str):
-        try:
-            return await db.conversations.find_one({"_id": ObjectId(conversation_id)})
-        except Exception:
-            return await db.conversations.find_one({"_id": conversation_id})
+        conv_obj_id = as_object_id(conversation_id)
+        if conv_obj_id is None:
+            # Conversation ids are always ObjectIds (see app/core/ids.py)
+            return None
+        # Read-your-writes for conversations not yet flushed
+        pending = write_behind.pending_document("conversations", conv_obj_id)
+        if pending:
+            return pending
+        cached = conversation_cache.get_conversation(conversation_id)
+        if cached:
+            return cached
+        conversation = await db.conversations.find_one({"_id": conv_obj_id})
+        conversation_cache.put_conversation(conversation)
+        return conversation
 
     @staticmethod
     async def list_conversations_for_user(user_id: str):
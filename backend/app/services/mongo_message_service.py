@@ -1,21 +1,123 @@
 from app.core.mongo import db
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from bson import ObjectId
 from datetime import datetime
+import base64
+import json
+import os
+from pymongo import ASCENDING, DESCENDING
+from app.services.write_behind import write_behind
+from app.services.conversation_cache import conversation_cache
+from app.core.ids import to_object_id
+
+# Messages of prior turns given to the orchestrator each turn
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "10"))
+MAX_PAGE_SIZE = 200
+
+# Newest first; `_id` breaks ties between messages stored in the same millisecond.
+# Served by the messages.conversation_created_at index (app/core/indexes.py)
+NEWEST_FIRST = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+
+def to_millis(moment: datetime) -> datetime:
+    """`moment` at the millisecond precision BSON dates are stored with."""
+    return moment.replace(microsecond=moment.microsecond // 1000 * 1000)
+
+
+def encode_cursor(message: Dict) -> str:
+    """Opaque keyset cursor pointing just past `message`."""
+    # A cursor with microseconds would sort after the stored (truncated) message and repeat it
+    payload = {"t": to_millis(message["created_at"]).isoformat(), "id": str(message["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Inverse of `encode_cursor`; raises ValueError for malformed cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), ObjectId(payload["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _older_than(message: Dict, created_at: datetime, _id: ObjectId) -> bool:
+    return (message["created_at"], message["_id"]) < (created_at, _id)
+
 
 class MongoMessageService:
     @staticmethod
-    async def add_message(conversation_id: str, role: str, content: str):
+    async def add_message(conversation_id: str, role: str, content: str, deferred: bool = False):
+        """Store a message; `deferred` hands it to the write-behind queue."""
         message = {
-            "conversation_id": ObjectId(conversation_id),
+            "conversation_id": to_object_id(conversation_id),
             "role": role,
             "content": content,
-            "created_at": datetime.utcnow(),
+            # Truncated like Mongo will store it, so cached and pending copies sort the same
+            "created_at": to_millis(datetime.utcnow()),
         }
-        result = await db.messages.insert_one(message)
-        message["_id"] = result.inserted_id
+        if deferred:
+            message = await write_behind.insert("messages", message)
+        else:
+            result = await db.messages.insert_one(message)
+            message["_id"] = result.inserted_id
+        conversation_cache.append_message(conversation_id, message)
         return message
 
     @staticmethod
     async def get_messages_for_conversation(conversation_id: str):
-        return [msg async for msg in db.messages.find({"conversation_id": ObjectId(conversation_id)})] 
\ No newline at end of file
+        """Every message in the conversation, oldest first. Prefer the windowed readers below."""
+        conv_obj_id = to_object_id(conversation_id)
+        messages = [msg async for msg in db.messages.find({"conversation_id": conv_obj_id}).sort([("created_at", ASCENDING), ("_id", ASCENDING)])]
+        # Read-your-writes: include messages still waiting in the write-behind queue
+        seen = {msg["_id"] for msg in messages}
+        messages += [msg for msg in write_behind.pending_documents("messages", conversation_id=conv_obj_id)
+                     if msg["_id"] not in seen]
+        messages.sort(key=lambda m: (m["created_at"], m["_id"]))
+        return messages
+
+    @staticmethod
+    async def get_recent_messages(conversation_id: str, limit: int = HISTORY_WINDOW) -> List[Dict]:
+        """The last `limit` messages, oldest first; cost does not grow with conversation length."""
+        cached = conversation_cache.recent_messages(conversation_id, limit)
+        if cached is not None:
+            return cached
+        # Read a full cache window so later turns are served from memory
+        fill = max(limit, conversation_cache.window) if conversation_cache.enabled else limit
+        page = await MongoMessageService.get_messages_page(conversation_id, limit=fill)
+        if fill <= MAX_PAGE_SIZE:
+            conversation_cache.put_messages(conversation_id, page["messages"])
+        return page["messages"][-limit:]
+
+    @staticmethod
+    async def get_messages_page(conversation_id: str, limit: int = 50, cursor: Optional[str] = None) -> Dict:
+        """
+        One page of history, walking from the newest message backwards.
+
+        Returns the page oldest first plus `next_cursor` for the page of older
+        messages (None when there are no more).
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conv_obj_id = to_object_id(conversation_id)
+        query: Dict = {"conversation_id": conv_obj_id}
+        before = decode_cursor(cursor) if cursor else None
+        if before:
+            created_at, _id = before
+            query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": _id}},
+            ]
+        # One extra document tells us whether an older page exists
+        messages = [msg async for msg in db.messages.find(query).sort(NEWEST_FIRST).limit(limit + 1)]
+        # Read-your-writes: queued messages are the newest, merge them into the window
+        seen = {msg["_id"] for msg in messages}
+        pending = [msg for msg in write_behind.pending_documents("messages", conversation_id=conv_obj_id)
+                   if msg["_id"] not in seen and (before is None or _older_than(msg, *before))]
+        if pending:
+            messages = sorted(messages + pending, key=lambda m: (m["created_at"], m["_id"]), reverse=True)
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        return {
+            "messages": messages[::-1],
+            "next_cursor": encode_cursor(messages[-1]) if has_more else None,
+        }
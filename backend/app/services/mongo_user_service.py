@@ -1,7 +1,31 @@
-from app.core.mongo import db
+from app.core.mongo import db, get_or_create
 from typing import Optional
-from bson import ObjectId
 from datetime import datetime
+import copy
+import os
+from app.utils.cache import TTLCache
+from app.core.ids import as_object_id, to_object_id
+
+# Profiles are cached by id and by email; misses are cached briefly so unknown
+# emails don't hit Mongo every turn. Writes through this service invalidate.
+USER_CACHE_TTL_S = float(os.getenv("USER_CACHE_TTL_S", "60"))
+USER_CACHE_NEGATIVE_TTL_S = float(os.getenv("USER_CACHE_NEGATIVE_TTL_S", "5"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+user_cache = TTLCache(max_entries=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_S, negative_ttl=USER_CACHE_NEGATIVE_TTL_S)
+
+
+def _cache_user(user: dict) -> None:
+    user = copy.deepcopy({k: v for k, v in user.items() if k != "created"})
+    user_cache.set(("id", str(user["_id"])), user)
+    if user.get("email"):
+        user_cache.set(("email", user["email"]), user)
+
+
+def _copy(user: Optional[dict]) -> Optional[dict]:
+    # Callers mutate the returned document; never hand out the cached one
+    return copy.deepcopy(user) if user is not None else None
+
 
 class MongoUserService:
     @staticmethod
@@ -13,30 +37,47 @@ class MongoUserService:
         }
         result = await db.users.insert_one(user)
         user["_id"] = result.inserted_id
+        # Replaces a cached "not found" for this email
+        _cache_user(user)
         return user
 
     @staticmethod
     async def get_user_by_email(email: str):
-        return await db.users.find_one({"email": email})
+        hit, user = user_cache.get(("email", email))
+        if hit:
+            return _copy(user)
+        user = await db.users.find_one({"email": email})
+        if user:
+            _cache_user(user)
+        else:
+            user_cache.set(("email", email), None)
+        return user
 
     @staticmethod
     async def get_user_by_id(user_id: str):
-        try:
-            return await db.users.find_one({"_id": ObjectId(user_id)})
-        except Exception:
-            return await db.users.find_one({"_id": user_id})
+        hit, user = user_cache.get(("id", str(user_id)))
+        if hit:
+            return _copy(user)
+        oid = as_object_id(user_id)
+        # User ids are always ObjectIds (see app/core/ids.py)
+        user = await db.users.find_one({"_id": oid}) if oid is not None else None
+        if user:
+            _cache_user(user)
+        else:
+            user_cache.set(("id", str(user_id)), None)
+        return user
 
     @staticmethod
     async def get_or_create_user_by_email(email: str):
-        user = await db.users.find_one({"email": email})
-        if user:
-            return user
-        # Create new user
-        new_user = {"email": email, "created_at": datetime.utcnow()}
-        result = await db.users.insert_one(new_user)
-        new_user["_id"] = result.inserted_id
-        new_user["created"] = True
-        return new_user
+        """Cached lookup, else one atomic upsert (users.email is unique); sets `created` on insert."""
+        hit, user = user_cache.get(("email", email))
+        if hit and user:
+            return _copy(user)
+        user, created = await get_or_create(db.users, {"email": email}, {"created_at": datetime.utcnow()})
+        _cache_user(user)
+        if created:
+            user["created"] = True
+        return user
 
     @staticmethod
     async def list_users():
@@ -44,4 +85,15 @@ class MongoUserService:
 
     @staticmethod
     async def update_user(user_id: str, update_data: dict):
-        await db.users.update_one({"_id": ObjectId(user_id)}, {"$set": update_data}) 
\ No newline at end of file
+        await db.users.update_one({"_id": to_object_id(user_id)}, {"$set": update_data})
+        MongoUserService.invalidate(user_id, update_data.get("email"))
+
+    @staticmethod
+    def invalidate(user_id: str, *emails: Optional[str]) -> None:
+        """Drop cached entries for a user (call after writing to `users` elsewhere)."""
+        cached = user_cache.peek(("id", str(user_id)))
+        keys = [("id", str(user_id))]
+        if cached and cached.get("email"):
+            keys.append(("email", cached["email"]))
+        keys += [("email", email) for email in emails if email]
+        user_cache.invalidate(*keys)
@@ -1,11 +1,18 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.core.mongo import db
 from typing import List, Dict, Optional
-import openai
 import os
 from datetime import datetime
 import numpy as np
 import csv
+from app.services.llm_gateway import llm_gateway
+from app.services.rate_limiter import Priority
+from app.core.request_context import memoize, is_memoized
+from app.services.rag_telemetry import rag_telemetry
+import time
+
+# Chunks embedded per OpenAI request during ingestion
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
 
 # Helper: chunk text (reuse your tokenizer logic as needed)
 def simple_chunk_text(text: str, chunk_size: int = 500) -> list:
@@ -20,9 +27,6 @@ async def ingest_document_to_mongodb(file_path: str, collection_name: str = "rag
     """
     if db is None:
         raise RuntimeError("MongoDB connection is not initialized. Check your MONGO_URI.")
-    import openai
-    import os
-    openai.api_key = os.getenv("OPENAI_API_KEY")
     docs = []
     if file_path.lower().endswith('.csv'):
         # Read CSV and treat each row as a chunk
@@ -33,11 +37,8 @@ async def ingest_document_to_mongodb(file_path: str, collection_name: str = "rag
                 chunk = ", ".join(f"{k}: {v}" for k, v in row.items() if v and k.lower() not in {"", "id", "unique_id"})
                 if not chunk.strip():
                     continue
-                resp = openai.embeddings.create(model="text-embedding-3-small", input=[chunk])
-                embedding = resp.data[0].embedding
                 doc = {
                     "text": chunk,
-                    "embedding": embedding,
                     "file": os.path.basename(file_path),
                     "chunk_id": i,
                     "created_at": datetime.utcnow(),
@@ -51,33 +52,37 @@ async def ingest_document_to_mongodb(file_path: str, collection_name: str = "rag
         
         chunks = simple_chunk_text(text)
         for i, chunk in enumerate(chunks):
-            # Get embedding from OpenAI
-            resp = openai.embeddings.create(model="text-embedding-3-small", input=[chunk])
-            embedding = resp.data[0].embedding
             doc = {
                 "text": chunk,
-                "embedding": embedding,
                 "file": os.path.basename(file_path),
                 "chunk_id": i,
                 "created_at": datetime.utcnow(),
                 "metadata": {}
             }
             docs.append(doc)
+    # Embed in batches at bulk priority so interactive chat is served first
+    for start in range(0, len(docs), EMBED_BATCH_SIZE):
+        batch = docs[start:start + EMBED_BATCH_SIZE]
+        embeddings = await llm_gateway.embed([doc["text"] for doc in batch], priority=Priority.BULK)
+        for doc, embedding in zip(batch, embeddings):
+            doc["embedding"] = embedding
     if not docs:
         return 0
     await db[collection_name].insert_many(docs)
     return len(docs)
 
-async def vector_search_mongodb(query: str, collection_name: str = "rag_chunks", k: int = 4):
+async def vector_search_mongodb(query: str, collection_name: str = "rag_chunks", k: int = 4,
+                                timings: Optional[Dict] = None):
     """
     Perform a vector search in MongoDB Atlas for the most similar chunks to the query.
+    Stage latencies and the embedding cache hit are written to `timings` when given.
     """
-    import openai
-    import os
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    # Get embedding for the query
-    resp = openai.embeddings.create(model="text-embedding-3-small", input=[query])
-    query_embedding = resp.data[0].embedding
+    timings = {} if timings is None else timings
+    timings["embedding_cached"] = is_memoized(("embedding", query))
+    started = time.perf_counter()
+    # Get embedding for the query (once per request, whoever asks first)
+    query_embedding = await embed_query(query)
+    timings["embed_ms"] = round((time.perf_counter() - started) * 1000, 2)
     
     pipeline = [
         {
@@ -94,18 +99,42 @@ async def vector_search_mongodb(query: str, collection_name: str = "rag_chunks",
     results = []
     if db is None:
         raise RuntimeError("MongoDB connection is not initialized. Check your MONGO_URI.")
+    started = time.perf_counter()
     async for doc in db[collection_name].aggregate(pipeline):
         results.append(doc)
+    timings["search_ms"] = round((time.perf_counter() - started) * 1000, 2)
     return results
 
+async def embed_query(query: str) -> list:
+    """Embedding of a search query, memoized for the current request."""
+    async def embed():
+        return (await llm_gateway.embed([query]))[0]
+    return await memoize(("embedding", query), embed)
+
 class RAGService:
-    def __init__(self):
-        self.openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
     async def search_properties(self, query: str, limit: int = 5) -> list:
-        # Remove mock data. Use vector_search_mongodb for real retrieval.
-        results = await vector_search_mongodb(query, k=limit)
-        return results
+        key = ("vector_search", query, limit)
+        cached = is_memoized(key)
+        timings: Dict = {}
+        started = time.perf_counter()
+        ok = False
+        results: list = []
+        try:
+            results = await memoize(key, lambda: vector_search_mongodb(query, k=limit, timings=timings))
+            ok = True
+            return results
+        finally:
+            rag_telemetry.record(
+                "retrieval",
+                query=query[:200],
+                k=limit,
+                results=len(results),
+                retrieval_ms=round((time.perf_counter() - started) * 1000, 2),
+                embed_ms=timings.get("embed_ms"),
+                search_ms=timings.get("search_ms"),
+                cache_hits={"search": cached, "embedding": timings.get("embedding_cached", False)},
+                ok=ok,
+            )
 
     async def get_property_details(self, property_id: str) -> dict:
         """
@@ -133,9 +162,10 @@ class RAGService:
             pass
         return None
 
-    async def generate_property_response(self, query: str, properties: list) -> str:
+    async def generate_property_response(self, query: str, properties: list, context: Optional[List[Dict]] = None) -> str:
         """
         Use OpenAI LLM to generate a summary response for the given properties.
+        `context` is the conversation summary + recent window (see conversation_summary.context_messages).
         """
         if not properties:
             return "Sorry, I couldn't find any properties matching your request. Please try a different search or provide more details."
@@ -154,11 +184,12 @@ class RAGService:
             "\n\nPlease summarize these properties for the user in a friendly, concise way."
         )
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=300
+            return await llm_gateway.chat(
+                "summary",
+                (context or []) + [{"role": "user", "content": prompt}],
+                max_tokens=300,
+                items=len(properties),
+                route_text=query
             )
-            return response.choices[0].message.content.strip()
         except Exception as e:
             return f"Found {len(properties)} properties, but could not generate a summary: {e}" 
\ No newline at end of file
@@ -0,0 +1,201 @@
+# app/services/rag_telemetry.py
+"""
+Telemetry for retrievals and LLM calls.
+
+Callers `record` an event (kind, stage latencies, k, result count, cache hits);
+recording is synchronous and in-memory. A background task flushes every
+RAG_TELEMETRY_FLUSH_MS:
+
+- the raw events go to `rag_logs` in one unordered `insert_many`;
+- per time window (RAG_TELEMETRY_WINDOW_S), event counters and a DDSketch per
+  latency metric are merged into one `rag_metrics` document with `$inc`, so
+  all workers feed the same sketches and quantiles never need raw events.
+
+`load_metrics` merges the window documents of a period into p50/p95/p99.
+When the buffer is full (database down), new events are dropped and counted.
+"""
+
+import asyncio
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+from app.core.mongo import db
+from app.utils.sketch import DDSketch
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RAG_TELEMETRY_ENABLED = os.getenv("RAG_TELEMETRY_ENABLED", "true").lower() == "true"
+RAG_TELEMETRY_FLUSH_MS = int(os.getenv("RAG_TELEMETRY_FLUSH_MS", "1000"))
+RAG_TELEMETRY_WINDOW_S = int(os.getenv("RAG_TELEMETRY_WINDOW_S", "3600"))
+RAG_TELEMETRY_MAX_BUFFER = int(os.getenv("RAG_TELEMETRY_MAX_BUFFER", "10000"))
+
+LOGS = "rag_logs"
+METRICS = "rag_metrics"
+# Event fields summarized by a sketch per window
+LATENCY_FIELDS = ("embed_ms", "search_ms", "retrieval_ms", "llm_ms")
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def window_start(moment: datetime, window_s: int = RAG_TELEMETRY_WINDOW_S) -> datetime:
+    """Start of the window holding `moment` (naive UTC)."""
+    seconds = int((moment - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % window_s)
+
+
+class _Window:
+    """Counters and sketches accumulated for one window since the last flush."""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.sketches: Dict[str, DDSketch] = {}
+
+    def add(self, event: Dict) -> None:
+        kind = event["kind"]
+        self._count(f"{kind}.events")
+        if not event.get("ok", True):
+            self._count(f"{kind}.errors")
+        for name, hit in (event.get("cache_hits") or {}).items():
+            if hit:
+                self._count(f"{kind}.cache_hits.{name}")
+        for field in LATENCY_FIELDS:
+            value = event.get(field)
+            if value is not None:
+                self.sketches.setdefault(f"{kind}.{field}", DDSketch()).add(max(0.0, value))
+
+    def _count(self, name: str) -> None:
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    def update(self) -> Dict:
+        """Mongo update merging this window into the stored one."""
+        inc: Dict[str, Any] = {f"counters.{name}": n for name, n in self.counters.items()}
+        mins: Dict[str, float] = {}
+        maxs: Dict[str, float] = {}
+        for name, sketch in self.sketches.items():
+            prefix = f"sketches.{name}"
+            for k, c in sketch.bins.items():
+                inc[f"{prefix}.bins.{k}"] = c
+            inc[f"{prefix}.zero"] = sketch.zero_count
+            inc[f"{prefix}.count"] = sketch.count
+            inc[f"{prefix}.sum"] = sketch.sum
+            mins[f"{prefix}.min"] = sketch.min
+            maxs[f"{prefix}.max"] = sketch.max
+        update: Dict[str, Any] = {"$inc": inc}
+        if mins:
+            update["$min"] = mins
+            update["$max"] = maxs
+        return update
+
+
+class RagTelemetry:
+    """Buffered writer of retrieval/LLM telemetry."""
+
+    def __init__(self, flush_interval: float = RAG_TELEMETRY_FLUSH_MS / 1000,
+                 window_s: int = RAG_TELEMETRY_WINDOW_S, max_buffer: int = RAG_TELEMETRY_MAX_BUFFER,
+                 enabled: bool = RAG_TELEMETRY_ENABLED, database=None):
+        self.flush_interval = flush_interval
+        self.window_s = window_s
+        self.max_buffer = max_buffer
+        self.enabled = enabled
+        self.database = database
+        self._events: List[Dict] = []
+        self._windows: Dict[datetime, _Window] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "flushes": 0, "failures": 0}
+
+    @property
+    def db(self):
+        return self.database if self.database is not None else db
+
+    def record(self, kind: str, **fields: Any) -> None:
+        """Queue one event, e.g. record("retrieval", embed_ms=12.0, search_ms=40.1, k=5, results=5)."""
+        if not self.enabled:
+            return
+        if len(self._events) >= self.max_buffer:
+            self.stats["dropped"] += 1
+            return
+        now = datetime.utcnow()
+        event = {"kind": kind, "timestamp": now, **fields}
+        self._events.append(event)
+        self._windows.setdefault(window_start(now, self.window_s), _Window()).add(event)
+        self.stats["recorded"] += 1
+
+    async def flush(self) -> int:
+        """Write buffered events and merge window sketches. Returns events written."""
+        async with self._flush_lock:
+            if not self._events or self.db is None:
+                return 0
+            events, windows = self._events, self._windows
+            self._events, self._windows = [], {}
+            try:
+                await self.db[LOGS].insert_many(events, ordered=False)
+                for start, window in windows.items():
+                    update = window.update()
+                    update["$setOnInsert"] = {"window": start, "window_s": self.window_s}
+                    await self.db[METRICS].update_one({"_id": f"{start:%Y-%m-%dT%H:%M}"}, update, upsert=True)
+            except Exception as e:
+                # Telemetry is best-effort: drop the batch rather than grow without bound
+                self.stats["failures"] += 1
+                self.stats["dropped"] += len(events)
+                logger.error(f"RAG telemetry flush failed ({len(events)} events dropped): {e}")
+                return 0
+            self.stats["written"] += len(events)
+            self.stats["flushes"] += 1
+            return len(events)
+
+    async def load_metrics(self, since: datetime, until: Optional[datetime] = None) -> Dict[str, Any]:
+        """Merged counters and latency sketches of the windows overlapping [since, until)."""
+        query: Dict[str, Any] = {"window": {"$gte": window_start(since, self.window_s)}}
+        if until is not None:
+            query["window"]["$lt"] = until
+        counters: Dict[str, int] = {}
+        sketches: Dict[str, DDSketch] = {}
+        async for doc in self.db[METRICS].find(query):
+            _sum_counters(counters, doc.get("counters") or {})
+            for kind, fields in (doc.get("sketches") or {}).items():
+                for field, sketch_doc in fields.items():
+                    sketches.setdefault(f"{kind}.{field}", DDSketch()).merge(DDSketch.from_doc(sketch_doc))
+        return {"counters": counters, "sketches": sketches}
+
+    # ---------- lifecycle ----------
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def stop(self) -> None:
+        """Stop the flusher and write what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> Dict:
+        return {"enabled": self.enabled, "buffered": len(self._events), **self.stats}
+
+
+def _sum_counters(total: Dict[str, int], nested: Dict[str, Any], prefix: str = "") -> None:
+    for name, value in nested.items():
+        if isinstance(value, dict):
+            _sum_counters(total, value, f"{prefix}{name}.")
+        else:
+            total[f"{prefix}{name}"] = total.get(f"{prefix}{name}", 0) + value
+
+
+# Shared writer used by the RAG service and the LLM gateway
+rag_telemetry = RagTelemetry()
@@ -0,0 +1,216 @@
+# app/services/rate_limiter.py
+"""
+Client-side rate limiting and adaptive concurrency for OpenAI calls.
+
+One shared limiter enforces requests/min and tokens/min budgets with token
+buckets, and sizes the number of in-flight calls with AIMD: additive
+increase while calls are fast, multiplicative decrease on 429s or slow
+responses. Waiters are served by priority so interactive chat goes ahead
+of background work and bulk ingestion embeddings.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+import logging
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+OPENAI_MIN_CONCURRENCY = int(os.getenv("OPENAI_MIN_CONCURRENCY", "2"))
+OPENAI_LATENCY_TARGET_MS = float(os.getenv("OPENAI_LATENCY_TARGET_MS", "8000"))
+
+
+class Priority(IntEnum):
+    """Lower value is served first."""
+    INTERACTIVE = 0   # user-facing chat turns
+    BACKGROUND = 1    # summaries, scoring and other deferred work
+    BULK = 2          # document ingestion embeddings
+
+
+# Fraction of concurrency and bucket capacity each class may use; the rest
+# is headroom kept free for higher-priority traffic.
+PRIORITY_SHARE: Dict[Priority, float] = {
+    Priority.INTERACTIVE: 1.0,
+    Priority.BACKGROUND: 0.9,
+    Priority.BULK: 0.75,
+}
+
+
+class TokenBucket:
+    """Continuously refilling token bucket sized in units per minute."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """Seconds until `amount` can be taken while leaving `reserve` in the bucket."""
+        self._refill()
+        amount = min(amount, self.capacity - reserve)
+        missing = amount + reserve - self.level
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after the server said we are over the limit."""
+        self._refill()
+        self.level = min(self.level, 0.0)
+
+
+class Permit:
+    """Handle for one admitted call; reports the outcome back to the limiter."""
+
+    def __init__(self, limiter: "AdaptiveRateLimiter", priority: Priority):
+        self.limiter = limiter
+        self.priority = priority
+        self.started = time.monotonic()
+        self.was_rate_limited = False
+
+    def rate_limited(self) -> None:
+        """Mark the call as rejected with HTTP 429."""
+        self.was_rate_limited = True
+
+
+class AdaptiveRateLimiter:
+    """Token-bucket limiter with AIMD concurrency and priority classes."""
+
+    def __init__(self, rpm: float = OPENAI_RPM, tpm: float = OPENAI_TPM,
+                 max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+                 min_concurrency: int = OPENAI_MIN_CONCURRENCY,
+                 latency_target_ms: float = OPENAI_LATENCY_TARGET_MS):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.latency_target_ms = latency_target_ms
+        self.limit = float(max(min_concurrency, max_concurrency // 2))
+        self.in_flight = 0
+        self._waiting: List[Tuple[int, int]] = []
+        self._seq = itertools.count()
+        self._changed: Optional[asyncio.Event] = None
+        self._last_decrease = 0.0
+        self.stats = {"admitted": 0, "rate_limited": 0, "slow": 0, "decreases": 0}
+
+    def _event(self) -> asyncio.Event:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def _notify(self) -> None:
+        event = self._event()
+        event.set()
+        self._changed = asyncio.Event()
+
+    def _admission_wait(self, priority: Priority, tokens: float) -> Optional[float]:
+        """None if blocked on concurrency, else seconds to wait for the buckets (0 = go)."""
+        share = PRIORITY_SHARE[priority]
+        if self.in_flight >= max(1, int(self.limit * share)):
+            return None
+        return max(
+            self.requests.wait_time(1, reserve=self.requests.capacity * (1 - share)),
+            self.tokens.wait_time(tokens, reserve=self.tokens.capacity * (1 - share)),
+        )
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE, tokens: float = 0) -> Permit:
+        """Wait until a call of `tokens` estimated tokens may start."""
+        ticket = (int(priority), next(self._seq))
+        heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                timeout = None
+                if self._waiting[0] == ticket:
+                    wait = self._admission_wait(priority, tokens)
+                    if wait == 0:
+                        heapq.heappop(self._waiting)
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        self.in_flight += 1
+                        self.stats["admitted"] += 1
+                        self._notify()
+                        return Permit(self, priority)
+                    timeout = wait
+                event = self._event()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._notify()
+            raise
+
+    def release(self, permit: Permit) -> None:
+        """Return the slot and adapt the concurrency limit to the outcome."""
+        self.in_flight -= 1
+        latency_ms = (time.monotonic() - permit.started) * 1000
+        now = time.monotonic()
+        if permit.was_rate_limited:
+            self.stats["rate_limited"] += 1
+            self.requests.drain()
+            self._decrease(now, 0.5)
+        elif latency_ms > self.latency_target_ms:
+            self.stats["slow"] += 1
+            self._decrease(now, 0.9)
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+        self._notify()
+
+    def _decrease(self, now: float, factor: float) -> None:
+        # At most one decrease per second so a burst of 429s from calls
+        # admitted under the old limit does not collapse it to the floor.
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_concurrency, self.limit * factor)
+        self.stats["decreases"] += 1
+        logger.info(f"OpenAI concurrency limit lowered to {self.limit:.1f}")
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.INTERACTIVE, tokens: float = 0):
+        """`async with limiter.slot(...) as permit:` around one API call."""
+        permit = await self.acquire(priority, tokens)
+        try:
+            yield permit
+        finally:
+            self.release(permit)
+
+    def snapshot(self) -> Dict:
+        """Current limits, levels and counters."""
+        waiting = {p.name.lower(): 0 for p in Priority}
+        for priority, _ in self._waiting:
+            waiting[Priority(priority).name.lower()] += 1
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": waiting,
+            "requests_available": round(self.requests.level, 1),
+            "tokens_available": round(self.tokens.level, 1),
+            **self.stats,
+        }
+
+
+# Shared limiter for every OpenAI call made by this worker
+openai_limiter = AdaptiveRateLimiter()
@@ -0,0 +1,102 @@
+# app/services/request_hedging.py
+"""
+Request hedging for latency-sensitive OpenAI calls.
+
+If a call has not returned by the model's observed latency percentile, a
+duplicate is sent and whichever finishes first wins; the other is
+cancelled. Hedges draw from a budget that refills with each primary
+request, which caps the extra load at a fixed fraction of traffic.
+"""
+
+import asyncio
+import os
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+from app.services.model_router import ModelRouter, model_router
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.05"))       # extra requests per primary
+HEDGE_MIN_DELAY_MS = float(os.getenv("LLM_HEDGE_MIN_DELAY_MS", "250"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "50"))
+# Largest burst of hedges the budget can save up
+HEDGE_BUDGET_CAP = 10.0
+
+
+class HedgingPolicy:
+    """Decides when to hedge, enforces the budget and counts outcomes."""
+
+    def __init__(self, router: Optional[ModelRouter] = None, enabled: bool = HEDGE_ENABLED,
+                 percentile: float = HEDGE_PERCENTILE, budget: float = HEDGE_BUDGET,
+                 min_delay_ms: float = HEDGE_MIN_DELAY_MS, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.router = router or model_router
+        self.enabled = enabled
+        self.percentile = percentile
+        self.budget = budget
+        self.min_delay_ms = min_delay_ms
+        self.min_samples = min_samples
+        self._balance = 1.0
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "budget_denied": 0}
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None when there is no usable history."""
+        observed = self.router.get_percentile(model, self.percentile, min_samples=self.min_samples)
+        if observed is None:
+            return None
+        return max(observed, self.min_delay_ms) / 1000
+
+    def _spend(self) -> bool:
+        if self._balance >= 1.0:
+            self._balance -= 1.0
+            return True
+        self.stats["budget_denied"] += 1
+        return False
+
+    async def run(self, model: str, call: Callable[[], Awaitable]):
+        """Run `call`, hedging it once if it is slower than the model's percentile."""
+        self.stats["requests"] += 1
+        self._balance = min(HEDGE_BUDGET_CAP, self._balance + self.budget)
+        delay = self.hedge_delay(model) if self.enabled else None
+        primary = asyncio.ensure_future(call())
+        if delay is None:
+            return await primary
+
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._spend():
+                return await primary
+
+            self.stats["hedged"] += 1
+            hedge = asyncio.ensure_future(call())
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer a successful result; only fail once both attempts failed
+                winner = next((t for t in done if not t.exception()), None)
+                if winner is not None:
+                    self.stats["hedge_wins" if winner is hedge else "primary_wins"] += 1
+                    return winner.result()
+            return await primary
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def snapshot(self) -> Dict:
+        """Configuration and outcome counters."""
+        hedged = self.stats["hedged"]
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "budget": self.budget,
+            **self.stats,
+            "hedge_rate": round(hedged / self.stats["requests"], 4) if self.stats["requests"] else 0.0,
+            "hedge_win_rate": round(self.stats["hedge_wins"] / hedged, 4) if hedged else 0.0,
+        }
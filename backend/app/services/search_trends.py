@@ -0,0 +1,331 @@
+# app/services/search_trends.py
+"""
+Property search trends.
+
+Searches from /chat, /advanced/smart-chat and /advanced/properties/search are
+`record`ed with attributes parsed from the query (location, property type,
+price band, bedrooms) and the ids of the retrieved documents:
+
+- each search is appended to `search_logs` in compact form (expired after
+  SEARCH_LOG_TTL_DAYS by a TTL index, see app/core/indexes.py);
+- per UTC day, each worker keeps counters (searches per source and hour,
+  price bands, bedrooms, property types) and Space-Saving top-k sketches of
+  locations, query texts and retrieved ids, and `$set`s them every
+  SEARCH_TRENDS_FLUSH_S into its own `search_trends` document.
+
+Trends merge the documents of the requested days, so reads cost a few
+hundred small documents regardless of how many searches were made.
+"""
+
+import asyncio
+import os
+import re
+import socket
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+
+from app.core.mongo import db
+from app.utils.sketch import SpaceSaving
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TRENDS_ENABLED = os.getenv("SEARCH_TRENDS_ENABLED", "true").lower() == "true"
+SEARCH_TRENDS_FLUSH_S = float(os.getenv("SEARCH_TRENDS_FLUSH_S", "10"))
+SEARCH_TRENDS_CAPACITY = int(os.getenv("SEARCH_TRENDS_CAPACITY", "200"))
+SEARCH_TRENDS_MAX_BUFFER = int(os.getenv("SEARCH_TRENDS_MAX_BUFFER", "10000"))
+
+LOGS = "search_logs"
+TRENDS = "search_trends"
+# Documents of one worker are never written by another, so plain $set is safe
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+# High-cardinality attributes tracked with top-k sketches; the rest are counters
+SKETCHED = ("location", "query", "result")
+COUNTED = ("property_type", "price_band", "bedrooms")
+
+PROPERTY_TYPES = [
+    ("townhouse", re.compile(r"\btown\s?(?:house|home)s?\b")),
+    ("condo", re.compile(r"\b(?:condo(?:minium)?s?|apartments?|flats?|lofts?)\b")),
+    ("multi-family", re.compile(r"\b(?:multi-?family|duplex(?:es)?|triplex(?:es)?)\b")),
+    ("land", re.compile(r"\b(?:land|lots?|acreage)\b")),
+    ("house", re.compile(r"\b(?:house|home|single[- ]family|bungalow|villa)s?\b")),
+]
+# Upper bound (exclusive) -> label; the last band is open-ended
+PRICE_BANDS = [(300_000, "<300k"), (500_000, "300k-500k"), (750_000, "500k-750k"), (1_000_000, "750k-1m")]
+TOP_PRICE_BAND = "1m+"
+KNOWN_LOCATIONS = ("downtown", "suburban", "suburbs", "waterfront", "beachfront", "uptown", "midtown", "rural")
+
+_PRICE = re.compile(r"\$\s*(\d[\d,]*(?:\.\d+)?)\s*(k|m|mm|million|thousand)?\b|"
+                    r"\b(\d+(?:\.\d+)?)\s*(k|m|million|thousand)\b", re.IGNORECASE)
+_MULTIPLIERS = {"k": 1_000, "thousand": 1_000, "m": 1_000_000, "mm": 1_000_000, "million": 1_000_000}
+_BEDROOMS = re.compile(r"\b(\d+|one|two|three|four|five|six)\s*-?\s*(?:bed(?:room)?s?|bd|br)\b", re.IGNORECASE)
+_WORD_NUMBERS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6}
+_LOCATION = re.compile(r"\b(?:in|near|around|at)\s+((?:[A-Z][\w'-]*)(?:\s+[A-Z][\w'-]*){0,2})")
+
+
+def _property_type(text: str) -> Optional[str]:
+    text = text.lower()
+    return next((name for name, pattern in PROPERTY_TYPES if pattern.search(text)), None)
+
+
+def _price(text: str) -> Optional[float]:
+    """Largest amount mentioned in `text` (a budget is usually an upper bound)."""
+    amounts = []
+    for match in _PRICE.finditer(text):
+        number, unit = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+        value = float(number.replace(",", "")) * _MULTIPLIERS.get((unit or "").lower(), 1)
+        if value >= 10_000:  # ignore "$50 fee" and the like
+            amounts.append(value)
+    return max(amounts) if amounts else None
+
+
+def price_band(amount: Optional[float]) -> Optional[str]:
+    if amount is None:
+        return None
+    return next((label for bound, label in PRICE_BANDS if amount < bound), TOP_PRICE_BAND)
+
+
+def _bedrooms(text: str) -> Optional[str]:
+    if re.search(r"\bstudio\b", text, re.IGNORECASE):
+        return "0"
+    match = _BEDROOMS.search(text)
+    if not match:
+        return None
+    raw = match.group(1).lower()
+    count = _WORD_NUMBERS.get(raw) or int(raw)
+    return "4+" if count >= 4 else str(count)
+
+
+def _location(text: str) -> Optional[str]:
+    lowered = text.lower()
+    known = next((name for name in KNOWN_LOCATIONS if re.search(rf"\b{name}\b", lowered)), None)
+    if known:
+        return "suburban" if known == "suburbs" else known
+    match = _LOCATION.search(text)
+    return match.group(1).lower() if match else None
+
+
+def extract_attributes(query: str, extracted_info: Optional[Dict] = None) -> Dict[str, Optional[str]]:
+    """Search attributes from the query text, preferring what CRM extraction already found."""
+    info = extracted_info or {}
+    budget = info.get("budget")
+    amount = _price(str(budget)) if budget else None
+    return {
+        "location": (str(info["location_preference"]).strip().lower() if info.get("location_preference")
+                     else _location(query)),
+        "property_type": _property_type(str(info.get("property_type") or "")) or _property_type(query),
+        "price_band": price_band(amount if amount is not None else _price(query)),
+        "bedrooms": _bedrooms(query),
+    }
+
+
+def result_ids(results: Iterable[Any]) -> List[str]:
+    """Ids of retrieved documents (property id when present, else chunk or document id)."""
+    ids = []
+    for doc in results or ():
+        if not isinstance(doc, dict):
+            continue
+        metadata = doc.get("metadata") or {}
+        for key in ("property_id", "id", "chunk_id", "_id"):
+            value = doc.get(key) or metadata.get(key)
+            if value:
+                ids.append(str(value))
+                break
+    return ids
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())[:200]
+
+
+class _Day:
+    """This worker's counters and sketches for one UTC day."""
+
+    def __init__(self, capacity: int):
+        self.counters: Dict[str, Dict[str, int]] = {"searches": {"total": 0}, "sources": {}, "hours": {},
+                                                    **{name: {} for name in COUNTED}}
+        self.sketches = {name: SpaceSaving(capacity) for name in SKETCHED}
+
+    def add(self, source: str, moment: datetime, attributes: Dict, query: str, ids: List[str]) -> None:
+        self._count("searches", "total")
+        self._count("sources", source)
+        self._count("hours", f"{moment.hour:02d}")
+        for name in COUNTED:
+            if attributes.get(name):
+                self._count(name, attributes[name])
+        if attributes.get("location"):
+            self.sketches["location"].add(attributes["location"])
+        self.sketches["query"].add(query)
+        for item in ids:
+            self.sketches["result"].add(item)
+
+    def _count(self, group: str, name: str) -> None:
+        # Field names cannot contain "." or start with "$" in MongoDB
+        name = name.replace(".", "_").lstrip("$")
+        self.counters[group][name] = self.counters[group].get(name, 0) + 1
+
+    def to_doc(self) -> Dict:
+        return {"counters": self.counters, "sketches": {name: s.to_doc() for name, s in self.sketches.items()}}
+
+
+class SearchTrends:
+    """Search logger and trend aggregator."""
+
+    def __init__(self, flush_interval: float = SEARCH_TRENDS_FLUSH_S, capacity: int = SEARCH_TRENDS_CAPACITY,
+                 max_buffer: int = SEARCH_TRENDS_MAX_BUFFER, enabled: bool = SEARCH_TRENDS_ENABLED,
+                 worker_id: str = WORKER_ID, database=None):
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.max_buffer = max_buffer
+        self.enabled = enabled
+        self.worker_id = worker_id
+        self.database = database
+        self._logs: List[Dict] = []
+        self._days: Dict[datetime, _Day] = {}
+        self._dirty: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "flushes": 0, "failures": 0}
+
+    @property
+    def db(self):
+        return self.database if self.database is not None else db
+
+    def record(self, source: str, query: str, extracted_info: Optional[Dict] = None,
+               results: Iterable[Any] = (), user_id: Optional[str] = None) -> None:
+        """Log one search; cheap and synchronous, safe to call from request handlers."""
+        if not self.enabled or not query:
+            return
+        try:
+            attributes = extract_attributes(query, extracted_info)
+            ids = result_ids(results)
+        except Exception as e:
+            logger.warning(f"Search attributes not extracted: {e}")
+            return
+        now = datetime.utcnow()
+        day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        text = normalize_query(query)
+        self._days.setdefault(day, _Day(self.capacity)).add(source, now, attributes, text, ids)
+        self._dirty.add(day)
+        self.stats["recorded"] += 1
+        if len(self._logs) >= self.max_buffer:
+            self.stats["dropped"] += 1
+            return
+        entry = {"ts": now, "src": source, "q": text, "attrs": {k: v for k, v in attributes.items() if v}, "ids": ids}
+        if user_id:
+            entry["user_id"] = str(user_id)
+        self._logs.append(entry)
+
+    async def flush(self) -> int:
+        """Write buffered logs and this worker's day documents. Returns logs written."""
+        async with self._flush_lock:
+            if self.db is None or (not self._logs and not self._dirty):
+                return 0
+            logs, self._logs = self._logs, []
+            dirty, self._dirty = self._dirty, set()
+            try:
+                if logs:
+                    await self.db[LOGS].insert_many(logs, ordered=False)
+                for day in dirty:
+                    await self.db[TRENDS].update_one(
+                        {"_id": f"{day:%Y-%m-%d}:{self.worker_id}"},
+                        {"$set": {"day": day, "worker": self.worker_id, "updated_at": datetime.utcnow(),
+                                  **self._days[day].to_doc()}},
+                        upsert=True,
+                    )
+            except Exception as e:
+                # Day documents are rewritten whole, so retry them; logs are best-effort
+                self._dirty |= dirty
+                self.stats["failures"] += 1
+                self.stats["dropped"] += len(logs)
+                logger.error(f"Search trends flush failed ({len(logs)} logs dropped): {e}")
+                return 0
+            # Past days are final once written
+            today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            for day in [d for d in self._days if d < today and d not in self._dirty]:
+                del self._days[day]
+            self.stats["written"] += len(logs)
+            self.stats["flushes"] += 1
+            return len(logs)
+
+    async def load(self, since: datetime, until: Optional[datetime] = None) -> Dict[str, Any]:
+        """Counters summed and sketches merged over the day documents in [since, until)."""
+        query: Dict[str, Any] = {"day": {"$gte": since.replace(hour=0, minute=0, second=0, microsecond=0)}}
+        if until is not None:
+            query["day"]["$lt"] = until
+        counters: Dict[str, Dict[str, int]] = {}
+        daily: Dict[datetime, int] = {}
+        sketches = {name: SpaceSaving(self.capacity) for name in SKETCHED}
+        async for doc in self.db[TRENDS].find(query):
+            for group, values in (doc.get("counters") or {}).items():
+                target = counters.setdefault(group, {})
+                for name, count in values.items():
+                    target[name] = target.get(name, 0) + count
+            daily[doc["day"]] = daily.get(doc["day"], 0) + (doc.get("counters") or {}).get("searches", {}).get("total", 0)
+            for name, sketch_doc in (doc.get("sketches") or {}).items():
+                if name in sketches:
+                    sketches[name].merge(SpaceSaving.from_doc(sketch_doc))
+        return {"counters": counters, "daily": daily, "sketches": sketches}
+
+    async def trends(self, days: int = 30, limit: int = 10) -> Dict[str, Any]:
+        """Popular search criteria over the last `days` days."""
+        since = datetime.utcnow() - timedelta(days=days - 1)
+        loaded = await self.load(since)
+        counters, sketches = loaded["counters"], loaded["sketches"]
+
+        def ranked(group: str) -> Dict[str, int]:
+            return dict(sorted(counters.get(group, {}).items(), key=lambda kv: -kv[1]))
+
+        def top(name: str, key: str) -> List[Dict]:
+            return [{key: item, "count": count, "error": error} for item, count, error in sketches[name].top(limit)]
+
+        property_types = ranked("property_type")
+        return {
+            "days": days,
+            "total_searches": counters.get("searches", {}).get("total", 0),
+            "popular_locations": [row["location"] for row in top("location", "location")],
+            "popular_property_types": list(property_types)[:limit],
+            "price_ranges": ranked("price_band"),
+            "bedroom_preferences": ranked("bedrooms"),
+            "property_types": property_types,
+            "top_locations": top("location", "location"),
+            "top_queries": top("query", "query"),
+            "top_results": top("result", "id"),
+            "sources": ranked("sources"),
+            "hourly": dict(sorted(counters.get("hours", {}).items())),
+            "daily": [{"date": day.strftime("%Y-%m-%d"), "searches": n} for day, n in sorted(loaded["daily"].items())],
+        }
+
+    # ---------- lifecycle ----------
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def stop(self) -> None:
+        """Stop the flusher and write what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def snapshot(self) -> Dict:
+        return {"enabled": self.enabled, "worker": self.worker_id, "buffered": len(self._logs),
+                "days_in_memory": len(self._days), **self.stats}
+
+
+# Shared instance: search endpoints record into it, the container runs its flusher
+search_trends = SearchTrends()
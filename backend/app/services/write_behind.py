@@ -0,0 +1,375 @@
+# app/services/write_behind.py
+"""
+Write-behind persistence for chat turns.
+
+Chat endpoints enqueue message inserts, conversation inserts, lead upserts and
+counter updates here and respond immediately; a background task groups them into
+one `bulk_write` per collection, flushing on batch size or interval.
+
+Durability: every operation is appended to a journal file before it is
+acknowledged. Each worker holds an exclusive `flock` on its journal segments
+until they are flushed and deleted, so on startup a worker replays only the
+journals whose lock it can take: those of stopped or crashed workers, never
+those of a sibling that is still running. Inserts carry client-generated
+`_id`s and upserts use `$setOnInsert`/`$set`, so replaying an
+already-applied batch is harmless; only `update` ops (`$inc` counters) can
+count twice if a worker dies between a flush and removing its segment.
+
+Ops the server rejects (write errors other than duplicate keys) are retried
+with the next batches and moved to `dead-letter.jsonl` in the journal
+directory after WRITE_BEHIND_MAX_ATTEMPTS, so one bad document cannot block
+the queue. On replay, a torn last line (a worker killed mid-append) is
+dropped and any other unreadable line is dead-lettered; the rest still apply.
+
+Read-your-writes: documents that are queued but not yet flushed can be read
+back with `pending_documents`, which the message and conversation services
+merge into their results. Queued `update`s are applied to those documents in
+memory too; the journal and the insert keep their own copies, so the database
+receives each change exactly once.
+"""
+
+import asyncio
+import copy
+import fcntl
+import glob
+import os
+import time
+import uuid
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId, json_util
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+
+from app.core.mongo import db
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BEHIND_JOURNAL_DIR = os.getenv("WRITE_BEHIND_JOURNAL_DIR", "data/write_behind")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "250"))
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "false").lower() == "true"
+# Above this many queued ops, enqueuing waits for a flush (backpressure)
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+# Rejected ops are dead-lettered after this many failed writes
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "5"))
+
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindQueue:
+    """Journaled, batching write-behind queue for Mongo inserts and upserts."""
+
+    def __init__(self, journal_dir: str = WRITE_BEHIND_JOURNAL_DIR,
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval: float = WRITE_BEHIND_FLUSH_MS / 1000,
+                 database=None):
+        self.journal_dir = journal_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.database = database
+        self._ops: List[Dict[str, Any]] = []
+        self._pending_docs: Dict[str, Dict[Any, Dict]] = {}
+        self._journal = None
+        self._journal_path: Optional[str] = None
+        # Sealed segments awaiting a successful flush; their handles keep the lock
+        self._sealed: List[Tuple[str, Any]] = []
+        self._segment = 0
+        self._token = uuid.uuid4().hex[:8]
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.running = False
+        self.stats = {"enqueued": 0, "flushed": 0, "batches": 0, "failures": 0, "replayed": 0,
+                      "rejected": 0, "dead_lettered": 0, "torn": 0}
+
+    @property
+    def db(self):
+        return self.database if self.database is not None else db
+
+    # ---------- lifecycle ----------
+    async def start(self) -> None:
+        """Replay leftover journals and start the background flusher."""
+        if self.running:
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        # Open (and lock) our own segment first: replay may re-journal rejected ops
+        self._open_segment()
+        self._wakeup = asyncio.Event()
+        await self._replay()
+        self.running = True
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Write-behind queue started (journal: {self.journal_dir})")
+
+    async def stop(self) -> None:
+        """Flush everything that is queued and stop the flusher."""
+        if not self.running:
+            return
+        self.running = False
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.flush()
+        except Exception as e:
+            # Leave the journal in place; the next worker to start replays it
+            logger.error(f"Final write-behind flush failed, {len(self._ops)} ops kept in journal: {e}")
+        if self._journal:
+            if not self._ops:
+                os.remove(self._journal_path)
+            # Closing releases the locks; a leftover journal is replayed by the next worker
+            self._journal.close()
+            self._journal = None
+        for _, handle in self._sealed:
+            handle.close()
+        self._sealed = []
+        logger.info("Write-behind queue stopped")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Ops stay queued and journaled; retried on the next tick
+                logger.error(f"Write-behind flush failed: {e}")
+
+    # ---------- enqueue ----------
+    async def insert(self, collection: str, doc: Dict) -> Dict:
+        """Queue an insert; assigns `_id` so callers can use it immediately."""
+        doc.setdefault("_id", ObjectId())
+        if not self.running:
+            await self.db[collection].insert_one(doc)
+            return doc
+        self._pending_docs.setdefault(collection, {})[doc["_id"]] = doc
+        # Insert a snapshot: later `update`s reach the database as their own ops
+        await self._enqueue({"c": collection, "op": "insert", "doc": copy.deepcopy(doc)})
+        return doc
+
+    async def upsert(self, collection: str, filter: Dict, update: Dict) -> None:
+        """Queue an idempotent upsert (`$set` / `$setOnInsert` only)."""
+        if not self.running:
+            await self.db[collection].update_one(filter, update, upsert=True)
+            return
+        await self._enqueue({"c": collection, "op": "upsert", "filter": filter, "update": update})
+
+    async def update(self, collection: str, filter: Dict, update: Dict) -> None:
+        """Queue an update (`$set` / `$inc`) of existing or queued documents."""
+        if not self.running:
+            await self.db[collection].update_one(filter, update)
+            return
+        pending = self.pending_document(collection, filter.get("_id"))
+        if pending is not None:
+            _apply_update(pending, update)
+        await self._enqueue({"c": collection, "op": "update", "filter": filter, "update": update})
+
+    async def _enqueue(self, op: Dict) -> None:
+        self._requeue(op)
+        self.stats["enqueued"] += 1
+        if len(self._ops) >= WRITE_BEHIND_MAX_PENDING:
+            await self.flush()
+        elif len(self._ops) >= self.batch_size:
+            self._wakeup.set()
+
+    def _requeue(self, op: Dict) -> None:
+        """Journal `op` in the active segment and queue it."""
+        self._journal.write(json_util.dumps(op) + "\n")
+        self._journal.flush()
+        if WRITE_BEHIND_FSYNC:
+            os.fsync(self._journal.fileno())
+        self._ops.append(op)
+
+    # ---------- read-your-writes ----------
+    def pending_documents(self, collection: str, **match) -> List[Dict]:
+        """Queued (not yet flushed) inserts in `collection` whose fields equal `match`."""
+        docs = self._pending_docs.get(collection, {}).values()
+        return [d for d in docs if all(d.get(k) == v for k, v in match.items())]
+
+    def pending_document(self, collection: str, _id: Any) -> Optional[Dict]:
+        return self._pending_docs.get(collection, {}).get(_id)
+
+    # ---------- flushing ----------
+    async def flush(self) -> int:
+        """Write all queued ops with one bulk_write per collection."""
+        async with self._flush_lock:
+            if not self._ops:
+                return 0
+            ops, self._ops = self._ops, []
+            if self._journal:
+                self._seal_segment()
+            try:
+                rejected = await self._apply(ops)
+            except Exception:
+                # Transient (network, write concern): retry the whole batch
+                self.stats["failures"] += 1
+                self._ops = ops + self._ops
+                raise
+            # Retried ops are journaled again before the sealed segments go
+            retried = self._retry_or_dead_letter(rejected)
+            for path, handle in self._sealed:
+                os.remove(path)
+                handle.close()
+            self._sealed = []
+            for op in ops:
+                if op["op"] == "insert" and id(op) not in retried:
+                    self._pending_docs.get(op["c"], {}).pop(op["doc"]["_id"], None)
+            self.stats["flushed"] += len(ops) - len(rejected)
+            self.stats["batches"] += 1
+            return len(ops) - len(rejected)
+
+    async def _apply(self, ops: List[Dict]) -> List[Tuple[Dict, str]]:
+        """Write `ops`; returns (op, error) for ops the server rejected, raises on transient errors."""
+        by_collection: Dict[str, List[Dict]] = {}
+        for op in ops:
+            by_collection.setdefault(op["c"], []).append(op)
+        rejected: List[Tuple[Dict, str]] = []
+        for collection, collection_ops in by_collection.items():
+            requests = [
+                InsertOne(op["doc"]) if op["op"] == "insert"
+                else UpdateOne(op["filter"], op["update"], upsert=op["op"] == "upsert")
+                for op in collection_ops
+            ]
+            try:
+                # Unordered bulk writes run inserts before updates, so an update
+                # always follows the queued insert it applies to
+                await self.db[collection].bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                if e.details.get("writeConcernErrors"):
+                    raise
+                # Replayed inserts that already landed are fine
+                rejected += [(collection_ops[err["index"]], err.get("errmsg", ""))
+                             for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+        return rejected
+
+    def _retry_or_dead_letter(self, rejected: List[Tuple[Dict, str]]) -> set:
+        """Requeue rejected ops, or dead-letter those out of attempts. Returns ids of requeued ops."""
+        retried = set()
+        for op, error in rejected:
+            op["attempts"] = op.get("attempts", 0) + 1
+            self.stats["rejected"] += 1
+            if op["attempts"] >= WRITE_BEHIND_MAX_ATTEMPTS:
+                self._dead_letter(op, error)
+            else:
+                self._requeue(op)
+                retried.add(id(op))
+        return retried
+
+    def _dead_letter(self, op: Dict, error: str) -> None:
+        entry = {"op": op, "error": error, "dead_lettered_at": datetime.utcnow()}
+        with open(os.path.join(self.journal_dir, DEAD_LETTER_FILE), "a", encoding="utf-8") as f:
+            f.write(json_util.dumps(entry) + "\n")
+        if op["op"] == "insert":
+            self._pending_docs.get(op["c"], {}).pop(op["doc"]["_id"], None)
+        self.stats["dead_lettered"] += 1
+        logger.error(f"Write-behind {op['op']} on {op['c']} dead-lettered after {op['attempts']} attempts: {error}")
+
+    # ---------- journal ----------
+    def _segment_path(self, suffix: str) -> str:
+        return os.path.join(self.journal_dir, f"journal-{os.getpid()}-{self._token}-{int(time.time() * 1000)}-{self._segment}.{suffix}")
+
+    def _open_segment(self) -> None:
+        self._segment += 1
+        # Locked under a name replay ignores, then published, so no sibling sees it unlocked
+        opening = self._segment_path("opening")
+        self._journal = open(opening, "a", encoding="utf-8")
+        fcntl.flock(self._journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._journal_path = opening[:-len("opening")] + "active"
+        os.rename(opening, self._journal_path)
+
+    def _seal_segment(self) -> None:
+        # The handle stays open (and locked) until the segment is flushed and removed
+        sealed = self._journal_path[:-len("active")] + "sealed"
+        os.rename(self._journal_path, sealed)
+        self._sealed.append((sealed, self._journal))
+        self._open_segment()
+
+    async def _replay(self) -> None:
+        """Apply journals whose owner has exited; segments still locked by a live worker are skipped."""
+        paths = sorted(glob.glob(os.path.join(self.journal_dir, "journal-*.active")) +
+                       glob.glob(os.path.join(self.journal_dir, "journal-*.sealed")))
+        for path in paths:
+            try:
+                await self._replay_segment(path)
+            except Exception as e:
+                # Never keep the worker from starting; the segment stays for the next start
+                logger.error(f"Could not replay {os.path.basename(path)}, will retry on next start: {e}")
+
+    async def _replay_segment(self, path: str) -> None:
+        try:
+            handle = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with handle:
+            try:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # owned by a running worker (or being replayed by one)
+            if os.fstat(handle.fileno()).st_nlink == 0:
+                return  # replayed and removed by another worker before we got the lock
+            ops = self._read_segment(path, handle.read().split("\n"))
+            rejected = await self._apply(ops) if ops else []
+            # Rejected ops move into our own journal before the file goes
+            self._retry_or_dead_letter(rejected)
+            os.remove(path)
+        self.stats["replayed"] += len(ops) - len(rejected)
+        if ops:
+            logger.info(f"Replayed {len(ops)} write-behind ops from {os.path.basename(path)}")
+
+    def _read_segment(self, path: str, lines: List[str]) -> List[Dict]:
+        """Parse journal lines; a torn last line (crash mid-append) is dropped, other bad lines dead-lettered."""
+        ops = []
+        name = os.path.basename(path)
+        last = max((i for i, line in enumerate(lines) if line.strip()), default=-1)
+        for i, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                ops.append(json_util.loads(line))
+            except ValueError as e:
+                if i == last:
+                    self.stats["torn"] += 1
+                    logger.warning(f"Dropped torn last line of {name}: {e}")
+                    continue
+                entry = {"line": line, "journal": name, "error": str(e), "dead_lettered_at": datetime.utcnow()}
+                with open(os.path.join(self.journal_dir, DEAD_LETTER_FILE), "a", encoding="utf-8") as f:
+                    f.write(json_util.dumps(entry) + "\n")
+                self.stats["dead_lettered"] += 1
+                logger.error(f"Unreadable line {i + 1} of {name} dead-lettered: {e}")
+        return ops
+
+    def snapshot(self) -> Dict:
+        return {"running": self.running, "queued": len(self._ops), **self.stats}
+
+
+def _apply_update(doc: Dict, update: Dict) -> None:
+    """Apply `$set` / `$inc` (dotted paths allowed) to an in-memory document."""
+    for op, fields in update.items():
+        for path, value in fields.items():
+            *parents, field = path.split(".")
+            target = doc
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            if op == "$inc":
+                target[field] = target.get(field, 0) + value
+            elif op == "$set":
+                target[field] = value
+            else:
+                raise ValueError(f"write-behind updates support $set and $inc, not {op}")
+
+
+# Shared queue; started and stopped with the application
+write_behind = WriteBehindQueue()
@@ -0,0 +1,188 @@
+# utils/cache.py
+"""
+Small in-process caches.
+
+TTL cache with negative caching:
+
+    cache = TTLCache(max_entries=10_000, ttl=60, negative_ttl=5)
+    hit, value = cache.get(key)      # value is None for a cached "not found"
+    cache.set(key, value)            # value=None stores a negative entry
+
+Stale-while-revalidate cache for expensive async computations:
+
+    cache = SWRCache(max_entries=1000)
+    value, age, status = await cache.get(key, factory, ttl=60, stale_ttl=300)
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """LRU-bounded cache whose entries expire after `ttl` (or `negative_ttl` for misses)."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60.0, negative_ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return (hit, value); a hit with value None is a cached negative result."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats["misses"] += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.stats["negative_hits" if value is None else "hits"] += 1
+        return True, value
+
+    def peek(self, key: Hashable) -> Any:
+        """Unexpired value for `key` (or None) without touching LRU order or stats."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        if ttl <= 0:
+            self._entries.pop(key, None)
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, *keys: Hashable) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+        hits = self.stats["hits"] + self.stats["negative_hits"]
+        return {
+            "entries": len(self._entries),
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+            **self.stats,
+        }
+
+
+class SWRCache:
+    """
+    Async cache with stale-while-revalidate and single-flight recompute.
+
+    Within `ttl` a value is served as is ("hit"). Up to `stale_ttl` seconds
+    later it is still served ("stale") while one background task recomputes
+    it. Older or missing values are computed inline ("miss"); concurrent
+    callers for the same key share one computation. Failures aren't cached.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        # key -> (computed_at monotonic, value)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._refreshes: Set[asyncio.Task] = set()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0,
+                      "refreshes": 0, "refresh_failures": 0, "evictions": 0}
+
+    async def get(self, key: Hashable, factory: Callable[[], Awaitable[Any]],
+                  ttl: float, stale_ttl: float = 0.0) -> Tuple[Any, float, str]:
+        """Return (value, age in seconds, "hit" | "stale" | "miss")."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            computed_at, value = entry
+            age = time.monotonic() - computed_at
+            if age < ttl:
+                self.stats["hits"] += 1
+                self._entries.move_to_end(key)
+                return value, age, "hit"
+            if age < ttl + stale_ttl:
+                self.stats["stale_hits"] += 1
+                self._entries.move_to_end(key)
+                self._revalidate(key, factory)
+                return value, age, "stale"
+        self.stats["misses"] += 1
+        return await self._compute(key, factory), 0.0, "miss"
+
+    async def _compute(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._start(key, factory)
+        else:
+            self.stats["coalesced"] += 1
+        # shield: a cancelled waiter must not cancel the shared computation
+        return await asyncio.shield(future)
+
+    def _start(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        # Registered before the task first runs, so racing callers find it
+        future = asyncio.ensure_future(self._run(key, factory))
+        self._inflight[key] = future
+        return future
+
+    async def _run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await factory()
+            self._store(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def _revalidate(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._inflight:
+            return
+        self.stats["refreshes"] += 1
+        future = self._start(key, factory)
+
+        async def watch():
+            try:
+                await future
+            except Exception as e:
+                # Keep serving the stale value; the next stale hit retries
+                self.stats["refresh_failures"] += 1
+                logger.error(f"Background refresh of {key!r} failed: {e}")
+
+        task = asyncio.ensure_future(watch())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def invalidate(self, *keys: Hashable) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        served = self.stats["hits"] + self.stats["stale_hits"]
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hit_rate": round(served / lookups, 3) if lookups else None,
+            **self.stats,
+        }
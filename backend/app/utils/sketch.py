@@ -0,0 +1,187 @@
+# utils/sketch.py
+"""
+Streaming sketches.
+
+DDSketch: quantiles with bounded relative error. Values fall into logarithmic
+bins (bin i covers (gamma^(i-1), gamma^i]), so any quantile is within
+`relative_accuracy` of the true value, memory grows with the log of the value
+range, and two sketches merge by adding their bin counts. That last property
+lets workers merge sketches in MongoDB with `$inc`.
+
+    sketch = DDSketch()
+    sketch.add(12.5)
+    sketch.quantile(0.99)
+
+SpaceSaving: the most frequent items of an unbounded stream in fixed memory.
+Counts are over-estimates by at most the recorded error, and any item seen
+more than total / capacity times is guaranteed to be tracked.
+
+    top = SpaceSaving(capacity=100)
+    top.add("downtown")
+    top.top(10)
+"""
+
+import math
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+
+class DDSketch:
+    """Mergeable quantile sketch for non-negative values (latencies)."""
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value < 0:
+            raise ValueError("DDSketch only accepts non-negative values")
+        if value == 0:
+            self.zero_count += count
+        else:
+            k = self.key(value)
+            self.bins[k] = self.bins.get(k, 0) + count
+        self.count += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: "DDSketch") -> None:
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for k, c in other.bins.items():
+            self.bins[k] = self.bins.get(k, 0) + c
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        for bound in (other.min, other.max):
+            if bound is not None:
+                self.min = bound if self.min is None else min(self.min, bound)
+                self.max = bound if self.max is None else max(self.max, bound)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate q-th quantile (0 <= q <= 1), or None when empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for k in sorted(self.bins):
+            seen += self.bins[k]
+            if seen > rank:
+                # Midpoint (in relative terms) of the bin; clamp to what was observed
+                estimate = 2 * self.gamma ** k / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.sum / self.count if self.count else None
+
+    def to_doc(self) -> Dict:
+        """BSON-friendly form; bin keys are strings."""
+        return {
+            "bins": {str(k): c for k, c in self.bins.items()},
+            "zero": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_doc(cls, doc: Dict, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY) -> "DDSketch":
+        sketch = cls(relative_accuracy)
+        sketch.bins = {int(k): c for k, c in (doc.get("bins") or {}).items()}
+        sketch.zero_count = doc.get("zero", 0)
+        sketch.count = doc.get("count", 0)
+        sketch.sum = doc.get("sum", 0.0)
+        sketch.min = doc.get("min")
+        sketch.max = doc.get("max")
+        return sketch
+
+    def summary(self) -> Dict:
+        def rounded(value):
+            return round(value, 1) if value is not None else None
+        return {
+            "count": self.count,
+            "mean_ms": rounded(self.mean),
+            "p50_ms": rounded(self.quantile(0.50)),
+            "p95_ms": rounded(self.quantile(0.95)),
+            "p99_ms": rounded(self.quantile(0.99)),
+            "max_ms": rounded(self.max),
+        }
+
+
+class SpaceSaving:
+    """Top-k heavy hitters (Metwally et al.) over string items."""
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.total = 0
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+            return
+        # Replace the least frequent item; the newcomer inherits its count as error
+        evicted = min(self.counts, key=self.counts.__getitem__)
+        floor = self.counts.pop(evicted)
+        del self.errors[evicted]
+        self.counts[item] = floor + count
+        self.errors[item] = floor
+
+    def _floor(self) -> int:
+        """Upper bound on the count of any untracked item."""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """Combine with a sketch of another stream, keeping the `capacity` largest."""
+        floor, other_floor = self._floor(), other._floor()
+        counts: Dict[str, int] = {}
+        errors: Dict[str, int] = {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, floor) + other.counts.get(item, other_floor)
+            errors[item] = self.errors.get(item, floor) + other.errors.get(item, other_floor)
+        kept = sorted(counts, key=counts.__getitem__, reverse=True)[:self.capacity]
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        self.total += other.total
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """(item, count, error) by descending count; the true count is in [count - error, count]."""
+        ranked = sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+        return [(item, count, self.errors[item]) for item, count in ranked]
+
+    def to_doc(self) -> Dict:
+        """BSON-friendly form; items are stored in an array so any string is a valid item."""
+        return {"capacity": self.capacity, "total": self.total,
+                "items": [[item, count, error] for item, count, error in self.top()]}
+
+    @classmethod
+    def from_doc(cls, doc: Dict) -> "SpaceSaving":
+        sketch = cls(doc.get("capacity", 100))
+        sketch.total = doc.get("total", 0)
+        for item, count, error in doc.get("items") or ():
+            sketch.counts[item] = count
+            sketch.errors[item] = error
+        return sketch
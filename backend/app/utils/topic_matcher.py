@@ -0,0 +1,107 @@
+# utils/topic_matcher.py
+"""
+Multi-keyword topic matching.
+
+All keywords of a taxonomy ({topic: [keyword, ...]}) are compiled into one
+Aho-Corasick automaton, so a text is scanned once no matter how many topics
+and keywords there are. Keywords are case-insensitive, may be phrases, and
+only match whole words ("area" does not match "areas").
+
+    matcher = TopicMatcher({"Pricing": ["price", "budget"], "Viewings": ["open house"]})
+    matcher.topics_in("What's the price? Is there an open house?")   # {"Pricing", "Viewings"}
+
+The taxonomy used by analytics lives in config/topic_taxonomy.json
+(TOPIC_TAXONOMY_PATH).
+"""
+
+import json
+import os
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+TOPIC_TAXONOMY_PATH = os.getenv(
+    "TOPIC_TAXONOMY_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "..", "config", "topic_taxonomy.json"),
+)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class TopicMatcher:
+    """Aho-Corasick automaton mapping keyword hits to topics."""
+
+    def __init__(self, taxonomy: Dict[str, Iterable[str]]):
+        self.topics: List[str] = list(taxonomy)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Per state: (topic index, keyword length) of every keyword ending there
+        self._out: List[List[Tuple[int, int]]] = [[]]
+        for index, keywords in enumerate(taxonomy.values()):
+            for keyword in keywords:
+                keyword = _normalize(keyword)
+                if keyword:
+                    self._add(keyword, index)
+        self._link()
+
+    def _add(self, keyword: str, topic: int) -> None:
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((topic, len(keyword)))
+
+    def _link(self) -> None:
+        """Failure links, breadth first; outputs inherit those of their failure state."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def scan(self, text: str) -> Iterator[Tuple[str, int, int]]:
+        """(topic, start, end) of every whole-word keyword hit in the normalized text."""
+        text = _normalize(text)
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            if not self._out[state]:
+                continue
+            after_ok = i + 1 == len(text) or not text[i + 1].isalnum()
+            for topic, length in self._out[state]:
+                start = i - length + 1
+                if after_ok and (start == 0 or not text[start - 1].isalnum()):
+                    yield self.topics[topic], start, i + 1
+
+    def topics_in(self, text: str) -> Set[str]:
+        return {topic for topic, _, _ in self.scan(text)}
+
+
+def load_taxonomy(path: str = TOPIC_TAXONOMY_PATH) -> Dict[str, List[str]]:
+    with open(path, encoding="utf-8") as f:
+        taxonomy = json.load(f)
+    if not isinstance(taxonomy, dict) or not all(isinstance(v, list) for v in taxonomy.values()):
+        raise ValueError(f"{path}: expected an object of topic -> list of keywords")
+    return taxonomy
+
+
+@lru_cache(maxsize=None)
+def get_topic_matcher(path: str = TOPIC_TAXONOMY_PATH) -> TopicMatcher:
+    """Matcher compiled once per taxonomy file."""
+    return TopicMatcher(load_taxonomy(path))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Fake OpenAI-compatible server for offline load and latency testing.
+
+Serves /v1/chat/completions (including streaming), /v1/embeddings and
+/v1/models with configurable latency, error and 429 injection. Embeddings
+are deterministic (feature-hashed bag of words), so retrieval results are
+reproducible across runs.
+
+Usage:
+    python fake_openai_server.py --port 8100 --latency lognormal:600,0.4 --rate-limit-rate 0.02
+    # then point the backend at it
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake python -m uvicorn app.main:app
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+from fastapi import Body, FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBEDDING_DIMENSIONS = 1536
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+@dataclass
+class FakeSettings:
+    """Fault-injection knobs; every field can also be set via FAKE_OPENAI_<NAME>."""
+    latency: str = "lognormal:400,0.5"          # fixed:MS | uniform:LO,HI | exponential:MEAN | lognormal:MEDIAN,SIGMA
+    embedding_latency: str = "lognormal:80,0.3"
+    token_delay_ms: float = 15.0                # per streamed chunk
+    error_rate: float = 0.0                     # fraction answered with HTTP 500
+    rate_limit_rate: float = 0.0                # fraction answered with HTTP 429
+    retry_after_s: float = 1.0
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "FakeSettings":
+        settings = cls()
+        for name, value in asdict(settings).items():
+            raw = os.getenv(f"FAKE_OPENAI_{name.upper()}")
+            if raw is None:
+                continue
+            kind = type(value) if value is not None else int
+            setattr(settings, name, kind(raw))
+        return settings
+
+
+def sample_latency_ms(spec: str, rng: random.Random) -> float:
+    """Draw one latency in milliseconds from a distribution spec."""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return values[0]
+    if kind == "uniform":
+        return rng.uniform(values[0], values[1])
+    if kind == "exponential":
+        return rng.expovariate(1.0 / values[0])
+    if kind == "lognormal":
+        return rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def fake_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> List[float]:
+    """Deterministic unit vector; texts sharing words get high cosine similarity."""
+    vector = [0.0] * dimensions
+    for token in TOKEN_RE.findall(text.lower()):
+        digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if not norm:
+        vector[0] = norm = 1.0
+    return [v / norm for v in vector]
+
+
+def fake_reply(messages: List[Dict]) -> str:
+    """Deterministic assistant text derived from the last user message."""
+    last = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    words = str(last).split()
+    return "This is a simulated response about: " + " ".join(words[:24])
+
+
+def error_body(message: str, kind: str, code: str) -> Dict:
+    return {"error": {"message": message, "type": kind, "param": None, "code": code}}
+
+
+def create_app(settings: Optional[FakeSettings] = None) -> FastAPI:
+    settings = settings or FakeSettings.from_env()
+    rng = random.Random(settings.seed)
+    stats = {"chat": 0, "stream": 0, "embeddings": 0, "errors": 0, "rate_limited": 0}
+    app = FastAPI(title="Fake OpenAI")
+
+    async def inject_faults(latency_spec: str) -> Optional[JSONResponse]:
+        await asyncio.sleep(sample_latency_ms(latency_spec, rng) / 1000)
+        roll = rng.random()
+        if roll < settings.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                error_body("Rate limit reached (simulated)", "requests", "rate_limit_exceeded"),
+                status_code=429,
+                headers={"retry-after": str(settings.retry_after_s)},
+            )
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(error_body("Simulated server error", "server_error", "server_error"), status_code=500)
+        return None
+
+    @app.get("/v1/models")
+    async def list_models():
+        created = int(time.time())
+        return {"object": "list", "data": [
+            {"id": name, "object": "model", "created": created, "owned_by": "fake"}
+            for name in ("gpt-4", "gpt-4o-mini", "text-embedding-3-small")
+        ]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(payload: Dict = Body(...)):
+        failure = await inject_faults(settings.latency)
+        if failure:
+            return failure
+        model = payload.get("model", "gpt-4o-mini")
+        text = fake_reply(payload.get("messages", []))
+        max_tokens = payload.get("max_tokens")
+        if max_tokens:
+            text = " ".join(text.split()[:max_tokens])
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in payload.get("messages", []))
+
+        if payload.get("stream"):
+            stats["stream"] += 1
+
+            async def events():
+                words = text.split(" ")
+                for i, word in enumerate(words):
+                    delta = {"content": word if i == 0 else " " + word}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                             "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(settings.token_delay_ms / 1000)
+                final = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        stats["chat"] += 1
+        completion_tokens = len(text.split())
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(payload: Dict = Body(...)):
+        failure = await inject_faults(settings.embedding_latency)
+        if failure:
+            return failure
+        stats["embeddings"] += 1
+        inputs = payload.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = payload.get("dimensions") or EMBEDDING_DIMENSIONS
+        tokens = sum(len(str(text).split()) for text in inputs)
+        return {
+            "object": "list",
+            "model": payload.get("model", "text-embedding-3-small"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(str(text), dimensions)}
+                     for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.get("/_fake/config")
+    async def get_config():
+        return {"settings": asdict(settings), "stats": stats}
+
+    @app.post("/_fake/config")
+    async def update_config(updates: Dict = Body(...)):
+        """Change fault injection at runtime, e.g. {"rate_limit_rate": 0.2}."""
+        for name, value in updates.items():
+            if hasattr(settings, name):
+                setattr(settings, name, value)
+        return {"settings": asdict(settings)}
+
+    return app
+
+
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", help="chat latency distribution, e.g. lognormal:400,0.5")
+    parser.add_argument("--embedding-latency", help="embedding latency distribution")
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--rate-limit-rate", type=float)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    settings = FakeSettings.from_env()
+    for name in ("latency", "embedding_latency", "error_rate", "rate_limit_rate", "seed"):
+        if getattr(args, name) is not None:
+            setattr(settings, name, getattr(args, name))
+    uvicorn.run(create_app(settings), host=args.host, port=args.port)
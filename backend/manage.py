@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Maintenance commands for the backend.
+
+    python manage.py indexes ensure [--fix-drift] [--drop-unknown] [--dry-run]
+    python manage.py indexes check      # exit 1 on missing/drifted indexes
+    python manage.py indexes explain    # exit 1 if a hot query does a COLLSCAN
+    python manage.py ids check          # count legacy string references
+    python manage.py ids migrate [--batch-size N] [--pause-ms N] [--dry-run]
+    python manage.py rollups refresh    # roll up hours closed since the watermark
+    python manage.py rollups rebuild    # recompute analytics rollups from raw data
+    python manage.py rollups check      # exit 1 if rollups disagree with raw counts
+    python manage.py leads score        # score every lead now
+    python manage.py leads top [--limit N]
+    python manage.py leads mark-primary [--batch-size N] [--pause-ms N] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+# Add the backend directory to Python path
+sys.path.append(str(Path(__file__).parent))
+
+from app.core.mongo import db
+from app.core import indexes, ids
+from app.services.analytics_rollups import analytics_rollups
+from app.services.lead_scoring import lead_scorer
+from app.services.crm_service import mark_primary_leads
+
+
+def print_json(data) -> None:
+    print(json.dumps(data, indent=2, default=str))
+
+
+async def cmd_indexes(args) -> int:
+    if args.action == "explain":
+        results = await indexes.explain_hot_queries(db)
+        print_json(results)
+        bad = [r["name"] for r in results if r.get("collscan") or r.get("error")]
+        if bad:
+            print(f"❌ Queries without index support: {', '.join(bad)}", file=sys.stderr)
+            return 1
+        print(f"✅ All {len(results)} hot queries use an index", file=sys.stderr)
+        return 0
+
+    check = args.action == "check"
+    report = await indexes.ensure_indexes(
+        db,
+        fix_drift=getattr(args, "fix_drift", False),
+        drop_unknown=getattr(args, "drop_unknown", False),
+        dry_run=check or getattr(args, "dry_run", False),
+    )
+    print_json(report)
+    if check:
+        problems = {c: r for c, r in report.items() if r["missing"] or r["drifted"]}
+        return 1 if problems else 0
+    return 1 if any(r["errors"] for r in report.values()) else 0
+
+
+async def cmd_ids(args) -> int:
+    if args.action == "check":
+        report = await ids.count_legacy_refs(db)
+        print_json(report)
+        return 1 if any(r["legacy"] for r in report.values()) else 0
+    report = await ids.migrate_ids(db, batch_size=args.batch_size, pause_s=args.pause_ms / 1000, dry_run=args.dry_run)
+    print_json(report)
+    return 0
+
+
+async def cmd_rollups(args) -> int:
+    if args.action == "check":
+        report = await analytics_rollups.check()
+        print_json(report)
+        return 0 if report["ok"] else 1
+    report = await (analytics_rollups.rebuild() if args.action == "rebuild" else analytics_rollups.refresh())
+    print_json(report)
+    return 0
+
+
+async def cmd_leads(args) -> int:
+    if args.action == "top":
+        print_json(await lead_scorer.top(args.limit))
+        return 0
+    if args.action == "mark-primary":
+        print_json(await mark_primary_leads(db, batch_size=args.batch_size, pause_s=args.pause_ms / 1000, dry_run=args.dry_run))
+        return 0
+    print_json(await lead_scorer.run(full=True))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Backend maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    idx = commands.add_parser("indexes", help="Manage MongoDB indexes (app/core/indexes.py)")
+    actions = idx.add_subparsers(dest="action", required=True)
+    ensure = actions.add_parser("ensure", help="Create missing indexes")
+    ensure.add_argument("--fix-drift", action="store_true", help="Drop and recreate indexes whose definition changed")
+    ensure.add_argument("--drop-unknown", action="store_true", help="Drop indexes not in the registry")
+    ensure.add_argument("--dry-run", action="store_true", help="Report what would change")
+    actions.add_parser("check", help="Report missing and drifted indexes without changing anything")
+    actions.add_parser("explain", help="Explain plans of the hot queries")
+    idx.set_defaults(handler=cmd_indexes)
+
+    id_cmd = commands.add_parser("ids", help="Canonical ObjectId references (app/core/ids.py)")
+    id_actions = id_cmd.add_subparsers(dest="action", required=True)
+    id_actions.add_parser("check", help="Count string references that should be ObjectIds")
+    migrate = id_actions.add_parser("migrate", help="Rewrite string references in batches (safe while serving)")
+    migrate.add_argument("--batch-size", type=int, default=500)
+    migrate.add_argument("--pause-ms", type=int, default=50, help="Pause between batches to limit load")
+    migrate.add_argument("--dry-run", action="store_true")
+    id_cmd.set_defaults(handler=cmd_ids)
+
+    rollups = commands.add_parser("rollups", help="Analytics rollups (app/services/analytics_rollups.py)")
+    rollup_actions = rollups.add_subparsers(dest="action", required=True)
+    rollup_actions.add_parser("refresh", help="Roll up the hours closed since the watermark")
+    rollup_actions.add_parser("rebuild", help="Drop and recompute all rollups from raw data")
+    rollup_actions.add_parser("check", help="Compare rollups with raw counts")
+    rollups.set_defaults(handler=cmd_rollups)
+
+    leads = commands.add_parser("leads", help="Lead scoring and maintenance")
+    lead_actions = leads.add_subparsers(dest="action", required=True)
+    lead_actions.add_parser("score", help="Score every lead now")
+    top = lead_actions.add_parser("top", help="Print the highest-scored leads")
+    top.add_argument("--limit", type=int, default=20)
+    primary = lead_actions.add_parser("mark-primary", help="Mark each user's oldest lead as primary (safe while serving)")
+    primary.add_argument("--batch-size", type=int, default=500)
+    primary.add_argument("--pause-ms", type=int, default=50, help="Pause between batches to limit load")
+    primary.add_argument("--dry-run", action="store_true")
+    leads.set_defaults(handler=cmd_leads)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if db is None:
+        print("[ERROR] MongoDB connection is not initialized. Check your MONGO_URI.", file=sys.stderr)
+        return 2
+    return asyncio.run(args.handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,560 @@
+"""
+Shared test fixtures.
+
+`fake_db` is an in-memory stand-in for a Motor database, so service tests can
+run real queries, updates and aggregation pipelines without MongoDB:
+
+    database = fake_db.seed(leads=[{"_id": 1, "status": "new"}])
+    monkeypatch.setattr(some_service, "db", database)
+
+Collections are created on first access (`database.leads` or
+`database["leads"]`) and hold plain dicts in `docs`. Every call is logged in
+`collection.calls`; `calls_to("aggregate")` returns the first argument of each
+aggregate call (the pipeline). The fake covers the query, update and pipeline
+operators this app uses. Tests can shape it per collection:
+
+- `validator`: function(doc) -> error message or None, like a schema validator
+- `on_aggregate`: function(pipeline) -> rows, replacing pipeline evaluation
+- `before`: {method: function(*args)} hooks run before a call, e.g. to
+  simulate another worker's concurrent write or raise an error
+"""
+
+import math
+import re
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import pytest
+from bson import ObjectId
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, WriteError
+
+MISSING = object()
+
+
+# ---------- values ----------
+def get_path(doc: Any, path: str) -> Any:
+    """Value at a dotted path; through an array, the list of its elements' values."""
+    for i, part in enumerate(path.split(".")):
+        if isinstance(doc, list):
+            rest = ".".join(path.split(".")[i:])
+            return [v for v in (get_path(item, rest) for item in doc) if v is not MISSING]
+        if not isinstance(doc, dict) or part not in doc:
+            return MISSING
+        doc = doc[part]
+    return doc
+
+
+def set_path(doc: Dict, path: str, value: Any) -> None:
+    *parents, field = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[field] = value
+
+
+def unset_path(doc: Dict, path: str) -> None:
+    *parents, field = path.split(".")
+    for part in parents:
+        doc = doc.get(part, {})
+    doc.pop(field, None)
+
+
+def type_rank(value: Any) -> int:
+    """BSON comparison order of the types used in tests."""
+    if value is None or value is MISSING:
+        return 0
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, (list, tuple)):
+        return 4
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+
+def sort_key(value: Any):
+    rank = type_rank(value)
+    if rank == 0:
+        return (0, 0)
+    if rank in (3, 10):
+        return (rank, repr(value))
+    if rank == 4:
+        return (rank, [sort_key(v) for v in value])
+    return (rank, value)
+
+
+def _compare(value: Any, target: Any, op: Callable) -> bool:
+    if isinstance(value, list):
+        return any(_compare(v, target, op) for v in value)
+    return type_rank(value) == type_rank(target) and value is not MISSING and op(value, target)
+
+
+def _equals(value: Any, target: Any) -> bool:
+    if value is MISSING:
+        return target is None
+    if isinstance(value, list) and not isinstance(target, list):
+        return target in value
+    return value == target
+
+
+TYPE_NAMES = {"string": str, "objectId": ObjectId, "date": datetime, "bool": bool, "object": dict, "array": list}
+
+
+def _matches_operator(value: Any, op: str, arg: Any) -> bool:
+    if op == "$eq":
+        return _equals(value, arg)
+    if op == "$ne":
+        return not _equals(value, arg)
+    if op == "$in":
+        return any(_equals(value, a) for a in arg)
+    if op == "$nin":
+        return not any(_equals(value, a) for a in arg)
+    if op == "$exists":
+        return (value is not MISSING) == bool(arg)
+    if op == "$type":
+        return isinstance(value, TYPE_NAMES[arg]) and not (arg != "bool" and isinstance(value, bool))
+    if op == "$regex":
+        return isinstance(value, str) and re.search(arg, value) is not None
+    comparisons = {
+        "$lt": lambda a, b: a < b, "$lte": lambda a, b: a <= b,
+        "$gt": lambda a, b: a > b, "$gte": lambda a, b: a >= b,
+    }
+    if op in comparisons:
+        return _compare(value, arg, comparisons[op])
+    raise NotImplementedError(f"fake_db: query operator {op}")
+
+
+def matches(doc: Dict, query: Optional[Dict]) -> bool:
+    for key, cond in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, clause) for clause in cond):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, clause) for clause in cond):
+                return False
+        elif isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            value = get_path(doc, key)
+            if not all(_matches_operator(value, op, arg) for op, arg in cond.items()):
+                return False
+        elif not _equals(get_path(doc, key), cond):
+            return False
+    return True
+
+
+def project(doc: Dict, projection: Optional[Dict]) -> Dict:
+    if not projection:
+        return dict(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        result = {k: doc[k] for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+
+# ---------- updates ----------
+def apply_update(doc: Dict, update: Dict, inserting: bool = False) -> None:
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            current = get_path(doc, path)
+            if op in ("$set", "$setOnInsert"):
+                set_path(doc, path, value)
+            elif op == "$unset":
+                unset_path(doc, path)
+            elif op == "$inc":
+                set_path(doc, path, (0 if current is MISSING else current) + value)
+            elif op == "$min":
+                set_path(doc, path, value if current in (MISSING, None) else min(current, value))
+            elif op == "$max":
+                set_path(doc, path, value if current in (MISSING, None) else max(current, value))
+            elif op == "$push":
+                values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                set_path(doc, path, ([] if current is MISSING else list(current)) + list(values))
+            elif op == "$addToSet":
+                items = [] if current is MISSING else list(current)
+                set_path(doc, path, items + ([value] if value not in items else []))
+            else:
+                raise NotImplementedError(f"fake_db: update operator {op}")
+
+
+def upsert_seed(query: Dict) -> Dict:
+    """Equality fields of a filter, which an upsert copies into the new document."""
+    return {k: v for k, v in query.items()
+            if not k.startswith("$") and not (isinstance(v, dict) and any(op.startswith("$") for op in v))}
+
+
+# ---------- aggregation ----------
+def truncate(moment: datetime, unit: str, start_of_week: str = "sunday") -> datetime:
+    if unit == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "week":
+        first = 0 if start_of_week.lower().startswith("mon") else 6
+        return day - timedelta(days=(day.weekday() - first) % 7)
+    if unit == "day":
+        return day
+    raise NotImplementedError(f"fake_db: $dateTrunc unit {unit}")
+
+
+def evaluate(expr: Any, doc: Dict) -> Any:
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = get_path(doc, expr[1:])
+        return None if value is MISSING else value
+    if isinstance(expr, dict) and len(expr) == 1 and next(iter(expr)).startswith("$"):
+        op, arg = next(iter(expr.items()))
+        if op == "$ifNull":
+            value = evaluate(arg[0], doc)
+            return evaluate(arg[1], doc) if value is None else value
+        if op == "$eq":
+            return evaluate(arg[0], doc) == evaluate(arg[1], doc)
+        if op == "$first":
+            values = evaluate(arg, doc)
+            return values[0] if values else None
+        if op == "$size":
+            return len(evaluate(arg, doc) or [])
+        if op == "$dateTrunc":
+            return truncate(evaluate(arg["date"], doc), arg["unit"], arg.get("startOfWeek", "sunday"))
+        raise NotImplementedError(f"fake_db: expression {op}")
+    if isinstance(expr, dict):
+        return {k: evaluate(v, doc) for k, v in expr.items()}
+    return expr
+
+
+def accumulate(op: str, arg: Any, docs: List[Dict]) -> Any:
+    if op == "$percentile":
+        values = sorted(v for v in (evaluate(arg["input"], d) for d in docs) if isinstance(v, (int, float)))
+        return [values[max(1, math.ceil(p * len(values))) - 1] if values else None for p in arg["p"]]
+    values = [evaluate(arg, d) for d in docs]
+    present = [v for v in values if v is not None]
+    if op == "$sum":
+        return sum(v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool))
+    if op == "$avg":
+        numbers = [v for v in present if isinstance(v, (int, float))]
+        return sum(numbers) / len(numbers) if numbers else None
+    if op == "$min":
+        return min(present, key=sort_key) if present else None
+    if op == "$max":
+        return max(present, key=sort_key) if present else None
+    if op == "$first":
+        return values[0] if values else None
+    if op == "$last":
+        return values[-1] if values else None
+    if op == "$push":
+        return values
+    if op == "$addToSet":
+        return list(dict.fromkeys(values))
+    raise NotImplementedError(f"fake_db: accumulator {op}")
+
+
+def sort_docs(docs: List[Dict], keys: List) -> List[Dict]:
+    docs = list(docs)
+    for field, direction in reversed(keys):
+        docs.sort(key=lambda d: sort_key(get_path(d, field)), reverse=direction < 0)
+    return docs
+
+
+def run_pipeline(database: "FakeDatabase", docs: List[Dict], pipeline: List[Dict]) -> List[Dict]:
+    docs = [dict(d) for d in docs]
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [d for d in docs if matches(d, spec)]
+        elif name == "$group":
+            spec = dict(spec)
+            key_expr = spec.pop("_id")
+            groups: Dict[str, Dict] = {}
+            for doc in docs:
+                key = evaluate(key_expr, doc)
+                groups.setdefault(repr(key), {"_id": key, "docs": []})["docs"].append(doc)
+            docs = [
+                {"_id": group["_id"], **{name: accumulate(*next(iter(acc.items())), group["docs"])
+                                         for name, acc in spec.items()}}
+                for group in groups.values()
+            ]
+        elif name == "$sort":
+            docs = sort_docs(docs, list(spec.items()))
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$skip":
+            docs = docs[spec:]
+        elif name == "$count":
+            docs = [{spec: len(docs)}] if docs else []
+        elif name == "$project":
+            projected = []
+            for doc in docs:
+                out = {"_id": doc.get("_id")} if spec.get("_id", 1) else {}
+                for field, value in spec.items():
+                    if field == "_id":
+                        continue
+                    if value in (1, True):
+                        if get_path(doc, field) is not MISSING:
+                            out[field] = get_path(doc, field)
+                    elif value not in (0, False):
+                        out[field] = evaluate(value, doc)
+                projected.append(out)
+            docs = projected
+        elif name == "$lookup":
+            foreign = database[spec["from"]].docs
+            for doc in docs:
+                local = get_path(doc, spec["localField"])
+                joined = [f for f in foreign if _equals(get_path(f, spec["foreignField"]), local)]
+                doc[spec["as"]] = run_pipeline(database, joined, spec.get("pipeline", []))
+        else:
+            raise NotImplementedError(f"fake_db: pipeline stage {name}")
+    return docs
+
+
+# ---------- cursors and results ----------
+class FakeCursor:
+    """find()/aggregate() cursor: chainable modifiers, async iteration and to_list."""
+
+    def __init__(self, collection: "FakeCollection", docs: List[Dict]):
+        self.collection = collection
+        self.docs = docs
+
+    def sort(self, key, direction: Optional[int] = None):
+        self.docs = sort_docs(self.docs, [(key, direction or 1)] if isinstance(key, str) else list(key))
+        return self
+
+    def skip(self, n: int):
+        self.docs = self.docs[n:]
+        return self
+
+    def limit(self, n: int):
+        if n:
+            self.docs = self.docs[:n]
+        return self
+
+    def batch_size(self, n: int):
+        return self
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in self.docs:
+            yield doc
+
+    async def to_list(self, length: Optional[int] = None):
+        self.collection.calls.append(("to_list", (length,)))
+        return self.docs if length is None else self.docs[:length]
+
+
+class Result:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+# ---------- collections ----------
+class FakeCollection:
+    def __init__(self, database: "FakeDatabase", name: str, docs=()):
+        self.database = database
+        self.name = name
+        self.docs: List[Dict] = []
+        self.calls: List[tuple] = []
+        self.indexes: Dict[str, Dict] = {"_id_": {"name": "_id_", "key": {"_id": 1}}}
+        self.validator: Optional[Callable[[Dict], Optional[str]]] = None
+        self.on_aggregate: Optional[Callable[[List[Dict]], List[Dict]]] = None
+        self.before: Dict[str, Callable] = {}
+        for doc in docs:
+            self._insert(dict(doc))
+
+    def _call(self, method: str, *args) -> None:
+        self.calls.append((method, args))
+        if method in self.before:
+            self.before[method](*args)
+
+    def calls_to(self, method: str) -> List:
+        """First argument of every call to `method`, oldest first."""
+        return [args[0] if args else None for name, args in self.calls if name == method]
+
+    def _insert(self, doc: Dict) -> Dict:
+        doc.setdefault("_id", ObjectId())
+        if self.validator:
+            error = self.validator(doc)
+            if error:
+                raise WriteError(error, 121)
+        if any(d["_id"] == doc["_id"] for d in self.docs):
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+        for index in self.indexes.values():
+            if index.get("unique") and index["name"] != "_id_":
+                fields = list(index["key"])
+                if all(get_path(doc, f) is not MISSING for f in fields) and any(
+                        all(get_path(d, f) == get_path(doc, f) for f in fields) for d in self.docs):
+                    raise DuplicateKeyError(f"E11000 duplicate key error index: {index['name']}", 11000)
+        self.docs.append(doc)
+        return doc
+
+    def _update(self, query: Dict, update: Dict, upsert: bool, many: bool = False) -> Dict:
+        targets = [d for d in self.docs if matches(d, query)]
+        if not many:
+            targets = targets[:1]
+        for doc in targets:
+            apply_update(doc, update)
+        if targets or not upsert:
+            return {"matched": len(targets), "upserted_id": None, "before": None}
+        doc = upsert_seed(query)
+        apply_update(doc, update, inserting=True)
+        return {"matched": 0, "upserted_id": self._insert(doc)["_id"], "before": None}
+
+    # reads
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None):
+        self._call("find", query, projection)
+        return FakeCursor(self, [project(d, projection) for d in self.docs if matches(d, query)])
+
+    async def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None):
+        self._call("find_one", query, projection)
+        doc = next((d for d in self.docs if matches(d, query)), None)
+        return project(doc, projection) if doc is not None else None
+
+    async def count_documents(self, query: Dict):
+        self._call("count_documents", query)
+        return sum(1 for d in self.docs if matches(d, query))
+
+    def aggregate(self, pipeline: List[Dict], **kwargs):
+        self._call("aggregate", pipeline)
+        rows = self.on_aggregate(pipeline) if self.on_aggregate else run_pipeline(self.database, self.docs, pipeline)
+        return FakeCursor(self, rows)
+
+    # writes
+    async def insert_one(self, doc: Dict):
+        self._call("insert_one", doc)
+        doc.setdefault("_id", ObjectId())
+        self._insert(dict(doc))
+        return Result(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs: List[Dict], ordered: bool = True):
+        self._call("insert_many", docs)
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self._insert(dict(doc))
+        return Result(inserted_ids=[d["_id"] for d in docs])
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        self._call("update_one", query, update)
+        outcome = self._update(query, update, upsert)
+        return Result(matched_count=outcome["matched"], modified_count=outcome["matched"],
+                      upserted_id=outcome["upserted_id"])
+
+    async def update_many(self, query: Dict, update: Dict, upsert: bool = False):
+        self._call("update_many", query, update)
+        outcome = self._update(query, update, upsert, many=True)
+        return Result(matched_count=outcome["matched"], modified_count=outcome["matched"],
+                      upserted_id=outcome["upserted_id"])
+
+    async def find_one_and_update(self, query: Dict, update: Dict, projection: Optional[Dict] = None,
+                                  upsert: bool = False, return_document: bool = ReturnDocument.BEFORE, **kwargs):
+        self._call("find_one_and_update", query, update)
+        doc = next((d for d in self.docs if matches(d, query)), None)
+        if doc is not None:
+            before = project(doc, projection)
+            apply_update(doc, update)
+            return project(doc, projection) if return_document else before
+        if not upsert:
+            return None
+        doc = upsert_seed(query)
+        apply_update(doc, update, inserting=True)
+        self._insert(doc)
+        return project(doc, projection) if return_document else None
+
+    async def delete_one(self, query: Dict):
+        self._call("delete_one", query)
+        doc = next((d for d in self.docs if matches(d, query)), None)
+        if doc is not None:
+            self.docs.remove(doc)
+        return Result(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query: Dict):
+        self._call("delete_many", query)
+        kept = [d for d in self.docs if not matches(d, query)]
+        deleted, self.docs = len(self.docs) - len(kept), kept
+        return Result(deleted_count=deleted)
+
+    async def bulk_write(self, requests: List, ordered: bool = True):
+        self._call("bulk_write", requests)
+        counts = {"inserted": 0, "matched": 0, "upserted": 0}
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(dict(request._doc))
+                    counts["inserted"] += 1
+                elif isinstance(request, UpdateOne):
+                    outcome = self._update(request._filter, request._doc, bool(request._upsert))
+                    counts["matched"] += outcome["matched"]
+                    counts["upserted"] += outcome["upserted_id"] is not None
+                else:
+                    raise NotImplementedError(f"fake_db: bulk operation {type(request).__name__}")
+            except (WriteError, DuplicateKeyError) as e:
+                errors.append({"index": index, "code": e.code, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [],
+                                  "nInserted": counts["inserted"], "nModified": counts["matched"],
+                                  "nUpserted": counts["upserted"]})
+        return Result(inserted_count=counts["inserted"], matched_count=counts["matched"],
+                      modified_count=counts["matched"], upserted_count=counts["upserted"])
+
+    # indexes
+    def list_indexes(self):
+        self._call("list_indexes")
+        return FakeCursor(self, [dict(index) for index in self.indexes.values()])
+
+    async def create_index(self, keys, name: Optional[str] = None, **options):
+        self._call("create_index", keys, name)
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        self.indexes[name] = {"name": name, "key": dict(keys), **options}
+        return name
+
+    async def drop_index(self, name: str):
+        self._call("drop_index", name)
+        if name not in self.indexes:
+            raise OperationFailure(f"index not found with name [{name}]", 27)
+        del self.indexes[name]
+
+
+class FakeDatabase:
+    """In-memory Motor database: collections by attribute or item, created on first use."""
+
+    def __init__(self, **collections: List[Dict]):
+        self.collections: Dict[str, FakeCollection] = {}
+        self.seed(**collections)
+
+    def seed(self, **collections: List[Dict]) -> "FakeDatabase":
+        for name, docs in collections.items():
+            self.collections[name] = FakeCollection(self, name, docs)
+        return self
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self, name)
+        return self.collections[name]
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, name: str, *args, **kwargs):
+        if name == "ping":
+            return {"ok": 1}
+        raise OperationFailure(f"fake_db: command {name}")
+
+
+@pytest.fixture
+def fake_db() -> FakeDatabase:
+    """An empty in-memory Motor database; see the module docstring."""
+    return FakeDatabase()
@@ -0,0 +1,96 @@
+import asyncio
+
+from app.services.analytics_cache import AnalyticsCache
+from app.utils.cache import SWRCache
+
+
+class SlowCounter:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return self.calls
+
+
+def test_concurrent_misses_share_one_computation():
+    cache = SWRCache()
+    factory = SlowCounter()
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get("k", factory, ttl=10) for _ in range(20)))
+
+    results = asyncio.run(scenario())
+    assert factory.calls == 1
+    assert {value for value, _, _ in results} == {1}
+    assert cache.stats["misses"] == 20 and cache.stats["coalesced"] == 19
+
+
+def test_stale_values_are_served_while_one_refresh_runs():
+    cache = SWRCache()
+    factory = SlowCounter()
+
+    async def scenario():
+        await cache.get("k", factory, ttl=0.05, stale_ttl=10)
+        fresh = await cache.get("k", factory, ttl=0.05, stale_ttl=10)
+        await asyncio.sleep(0.06)
+        stale = await asyncio.gather(*(cache.get("k", factory, ttl=0.05, stale_ttl=10) for _ in range(5)))
+        await asyncio.sleep(0.03)
+        refreshed = await cache.get("k", factory, ttl=0.05, stale_ttl=10)
+        return fresh, stale, refreshed
+
+    fresh, stale, refreshed = asyncio.run(scenario())
+    assert fresh[0] == 1 and fresh[2] == "hit"
+    assert all(value == 1 and status == "stale" and age >= 0.05 for value, age, status in stale)
+    assert factory.calls == 2 and cache.stats["refreshes"] == 1
+    assert refreshed[0] == 2 and refreshed[2] == "hit"
+
+
+def test_failed_refresh_keeps_the_stale_value():
+    cache = SWRCache()
+
+    async def failing():
+        raise RuntimeError("mongo down")
+
+    async def scenario():
+        await cache.get("k", SlowCounter(), ttl=0, stale_ttl=10)
+        value, _, status = await cache.get("k", failing, ttl=0, stale_ttl=10)
+        await asyncio.sleep(0.01)
+        return value, status
+
+    assert asyncio.run(scenario()) == (1, "stale")
+    assert cache.stats["refresh_failures"] == 1
+
+
+class FakeAnalytics:
+    def __init__(self):
+        self.calls = []
+
+    async def get_user_engagement(self, days):
+        self.calls.append(days)
+        return {"period_days": days}
+
+    async def get_user_journey_insights(self, user_id):
+        return {}
+
+
+def test_analytics_cache_keys_by_arguments_and_sets_headers():
+    service = FakeAnalytics()
+    cache = AnalyticsCache(service, enabled=True)
+
+    async def scenario():
+        first = await cache.call("get_user_engagement", 30)
+        second = await cache.call("get_user_engagement", 30)
+        other = await cache.call("get_user_engagement", 7)
+        uncached = await cache.call("get_user_journey_insights", "u1")
+        return first, second, other, uncached
+
+    first, second, other, uncached = asyncio.run(scenario())
+    assert service.calls == [30, 7]
+    assert second[2] == "hit" and other[0] == {"period_days": 7}
+    assert uncached[2] == "bypass"
+
+    headers = AnalyticsCache.headers("get_user_engagement", 12.5, "hit")
+    assert headers["Age"] == "12" and headers["X-Cache"] == "HIT"
+    assert headers["Cache-Control"] == "private, max-age=47, stale-while-revalidate=600"
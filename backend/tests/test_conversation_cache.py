@@ -0,0 +1,85 @@
+import time
+
+from bson import ObjectId
+
+from app.services.conversation_cache import ConversationCache
+
+
+def message(i, content="hello"):
+    return {"_id": ObjectId(), "role": "user", "content": f"{content} {i}", "created_at": i, "extra": "dropped"}
+
+
+def test_write_through_keeps_a_ring_of_recent_messages():
+    cache = ConversationCache(window=3)
+    conv_id = ObjectId()
+    cache.put_conversation({"_id": conv_id, "user_id": "u1"}, new=True)
+
+    for i in range(5):
+        cache.append_message(str(conv_id), message(i))
+
+    recent = cache.recent_messages(str(conv_id), 3)
+    assert [m["created_at"] for m in recent] == [2, 3, 4]
+    assert "extra" not in recent[0]
+    # Asking for more than the ring holds must go to Mongo
+    assert cache.recent_messages(str(conv_id), 4) is None
+
+
+def test_no_write_through_into_an_unseeded_buffer():
+    cache = ConversationCache(window=3)
+    cache.put_conversation({"_id": "c1"})
+    cache.append_message("c1", message(1))
+    assert cache.recent_messages("c1", 2) is None
+
+    cache.put_messages("c1", [message(i) for i in range(10)])
+    cache.append_message("c1", message(10))
+    assert [m["created_at"] for m in cache.recent_messages("c1", 3)] == [8, 9, 10]
+
+
+def test_lru_and_byte_bounds():
+    cache = ConversationCache(max_conversations=2, window=5)
+    for conv in ("a", "b", "c"):
+        cache.put_conversation({"_id": conv}, new=True)
+    assert cache.get_conversation("a") is None
+    assert cache.get_conversation("c") is not None
+
+    small = ConversationCache(max_bytes=20_000, window=5)
+    for conv in range(10):
+        small.put_messages(str(conv), [message(i, "x" * 1000) for i in range(5)])
+    snapshot = small.snapshot()
+    assert snapshot["approx_bytes"] <= 20_000
+    assert snapshot["evictions"] > 0
+
+
+def test_idle_entries_expire():
+    cache = ConversationCache(ttl=0.01)
+    cache.put_conversation({"_id": "c1"}, new=True)
+    time.sleep(0.02)
+    assert cache.get_conversation("c1") is None
+    assert cache.snapshot()["expirations"] == 1
+
+
+def test_cached_documents_are_copies():
+    cache = ConversationCache()
+    doc = {"_id": "c1", "facts": {"budget": "$1M"}}
+    cache.put_conversation(doc)
+    doc["facts"]["budget"] = "changed"
+    cached = cache.get_conversation("c1")
+    cached["facts"]["name"] = "Ana"
+    assert cache.get_conversation("c1")["facts"] == {"budget": "$1M"}
+
+
+def test_reads_and_write_through_do_not_extend_freshness():
+    cache = ConversationCache(ttl=0.05, window=3)
+    cache.put_conversation({"_id": "c1"})
+    cache.put_messages("c1", [message(i) for i in range(3)])
+    for i in range(4):
+        time.sleep(0.02)
+        cache.append_message("c1", message(3 + i))
+        cache.get_conversation("c1")
+        cache.recent_messages("c1", 2)
+    # Kept busy past the TTL, but both parts were loaded more than a TTL ago
+    assert cache.get_conversation("c1") is None
+    assert cache.recent_messages("c1", 2) is None
+
+    cache.put_messages("c1", [message(i) for i in range(3)])
+    assert cache.recent_messages("c1", 2) is not None
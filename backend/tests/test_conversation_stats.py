@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from app.services import analytics_service
+from app.services.analytics_service import AnalyticsService
+
+
+def seed(fake_db, user_id=None):
+    """10 conversations: 4 with 2 messages, 5 with 6, 1 with 30."""
+    conversations, messages = [], []
+    for count in [2] * 4 + [6] * 5 + [30]:
+        conversation = {"_id": ObjectId(), "user_id": user_id or ObjectId()}
+        conversations.append(conversation)
+        messages += [{"conversation_id": conversation["_id"]} for _ in range(count)]
+    return fake_db.seed(conversations=conversations, messages=messages)
+
+
+EXPECTED = {
+    "total_conversations": 10,
+    "total_messages": 68,
+    "avg_messages_per_conversation": 6.8,
+    "median_messages_per_conversation": 6,
+    "p90_messages_per_conversation": 6,
+}
+
+
+def test_stats_come_from_one_server_side_pipeline(monkeypatch, fake_db):
+    user_id = ObjectId()
+    fake = seed(fake_db, user_id)
+    fake.conversations.docs.append({"_id": ObjectId(), "user_id": ObjectId()})  # someone else's
+    monkeypatch.setattr(analytics_service, "db", fake)
+
+    stats = asyncio.run(AnalyticsService().get_conversation_stats(str(user_id)))
+
+    assert stats == EXPECTED
+    (pipeline,) = fake.conversations.calls_to("aggregate")
+    assert pipeline[0] == {"$match": {"user_id": user_id}}
+    assert pipeline[1]["$lookup"]["foreignField"] == "conversation_id"
+    # Conversation ids are never loaded into the app
+    assert fake.conversations.calls_to("find") == fake.messages.calls == []
+
+
+def test_no_conversations(monkeypatch, fake_db):
+    monkeypatch.setattr(analytics_service, "db", fake_db)
+    stats = asyncio.run(AnalyticsService().get_conversation_stats())
+    assert stats["total_conversations"] == 0 and stats["p90_messages_per_conversation"] == 0
+
+
+def test_falls_back_to_a_count_histogram_without_percentile(monkeypatch, fake_db):
+    fake = seed(fake_db)
+
+    def pre_seven(pipeline):
+        # MongoDB < 7.0 rejects $percentile
+        if "percentiles" in pipeline[-1].get("$group", {}):
+            raise OperationFailure("Unrecognized expression '$percentile'", code=168)
+
+    fake.conversations.before["aggregate"] = pre_seven
+    monkeypatch.setattr(analytics_service, "db", fake)
+
+    service = AnalyticsService()
+    stats = asyncio.run(service.get_conversation_stats())
+    again = asyncio.run(service.get_conversation_stats())
+
+    assert stats == again == EXPECTED
+    # The unsupported operator is tried once, then skipped
+    pipelines = fake.conversations.calls_to("aggregate")
+    assert len(pipelines) == 3
+    assert pipelines[-1][-2] == {"$group": {"_id": "$messages", "count": {"$sum": 1}}}
+
+
+def test_other_server_errors_are_raised_and_keep_percentile(monkeypatch, fake_db):
+    fake = seed(fake_db)
+    attempts = []
+
+    def timeout(pipeline):
+        attempts.append(pipeline)
+        if len(attempts) == 1:
+            raise OperationFailure("operation exceeded time limit", code=50)
+
+    fake.conversations.before["aggregate"] = timeout
+    monkeypatch.setattr(analytics_service, "db", fake)
+
+    service = AnalyticsService()
+    with pytest.raises(OperationFailure):
+        asyncio.run(service.get_conversation_stats())
+    assert service.percentile_supported
+    assert asyncio.run(service.get_conversation_stats()) == EXPECTED
+    assert "percentiles" in attempts[-1][-1]["$group"]
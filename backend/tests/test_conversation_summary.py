@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.services import conversation_summary
+from app.services.conversation_summary import ConversationSummarizer, context_messages
+
+
+def make_messages(conv_id, n):
+    start = datetime(2024, 1, 1)
+    return [{"_id": ObjectId(), "conversation_id": conv_id, "role": "user" if i % 2 == 0 else "assistant",
+             "content": f"m{i}", "created_at": start + timedelta(seconds=i)} for i in range(n)]
+
+
+def test_refresh_summarizes_only_messages_outside_the_window(monkeypatch, fake_db):
+    conv_id = ObjectId()
+    fake_db.seed(conversations=[{"_id": conv_id, "message_count": 0, "facts": {"budget": "$500k"}}])
+    messages = make_messages(conv_id, 14)
+    prompts = []
+
+    async def fake_page(conversation_id, limit=50, cursor=None):
+        return {"messages": messages[-limit:], "next_cursor": None}
+
+    async def fake_chat(task, msgs, **kwargs):
+        prompts.append(msgs[0]["content"])
+        return '{"summary": "Client wants a condo downtown.", "facts": {"budget": "$1M", "property_type": "condo"}}'
+
+    monkeypatch.setattr(conversation_summary.MongoMessageService, "get_messages_page", fake_page)
+    monkeypatch.setattr(conversation_summary.llm_gateway, "chat", fake_chat)
+    summarizer = ConversationSummarizer(every_n_turns=2, window=10, database=fake_db)
+
+    async def scenario():
+        for turn in range(7):
+            await summarizer.record_turn(str(conv_id), {"name": "Ana" if turn == 0 else None})
+        await summarizer.stop()
+
+    asyncio.run(scenario())
+
+    (doc,) = fake_db.conversations.docs
+    assert doc["message_count"] == 14
+    assert doc["summary"] == "Client wants a condo downtown."
+    # Oldest 4 messages folded in; the last 10 stay verbatim in the window
+    assert "m3" in prompts[0] and "m4" not in prompts[0]
+    assert doc["summary_until"] == messages[3]["created_at"]
+    assert doc["summary_message_count"] == 4
+    # Per-turn facts win over the model's guesses
+    assert doc["facts"] == {"budget": "$500k", "name": "Ana", "property_type": "condo"}
+    assert summarizer.snapshot()["refreshes"] == 1
+
+
+def test_turns_on_a_queued_conversation_go_through_the_journal(monkeypatch, tmp_path, fake_db):
+    from app.services.write_behind import WriteBehindQueue
+
+    queue = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+    monkeypatch.setattr(conversation_summary, "write_behind", queue)
+    summarizer = ConversationSummarizer(every_n_turns=50, database=fake_db)
+
+    async def scenario():
+        await queue.start()
+        conv = await queue.insert("conversations", {"message_count": 0})
+        await summarizer.record_turn(str(conv["_id"]), {"name": "Ana"})
+        # The insert may already be in flight when the next turn lands
+        flushing = asyncio.create_task(queue.flush())
+        await summarizer.record_turn(str(conv["_id"]))
+        await flushing
+        await queue.stop()
+
+    asyncio.run(scenario())
+    [doc] = fake_db.conversations.docs
+    assert doc["message_count"] == 4 and doc["facts"] == {"name": "Ana"}
+
+
+def test_context_is_summary_plus_recent_window():
+    memory = {"summary": "Looking for a 2-bed condo.", "facts": {"budget": "$600k"}}
+    recent = [{"role": "user", "content": f"q{i}"} for i in range(30)]
+
+    messages = context_messages(memory, recent)
+
+    assert messages[0]["role"] == "system"
+    assert "2-bed condo" in messages[0]["content"] and "$600k" in messages[0]["content"]
+    assert len(messages) == 1 + conversation_summary.HISTORY_WINDOW
+    assert messages[-1]["content"] == "q29"
+
+
+def test_orchestrator_reply_uses_summary_and_recent_window():
+    from app.agents.orchestrator import OrchestratorAgent
+
+    orchestrator = OrchestratorAgent.__new__(OrchestratorAgent)
+    orchestrator.chat_agent = None
+    memory = {"summary": "Looking for a 2-bed condo.", "facts": {"name": "Ana"}}
+    recent = [{"role": "user", "content": "hello again"}]
+
+    reply = asyncio.run(orchestrator._respond("hello again", [], {}, {}, memory, recent))
+    assert reply.startswith("Hello Ana! Welcome back")
+
+    reply = asyncio.run(orchestrator._respond("what else is there?", [], {}, {}, memory, recent))
+    assert "Conversation so far: Looking for a 2-bed condo." in reply
@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import analytics_service
+from app.services.analytics_service import AnalyticsService
+
+
+def make_db(fake_db, now):
+    return fake_db.seed(
+        conversations=[{"started_at": now}, {"started_at": now - timedelta(days=2)}],
+        messages=[{"created_at": ts} for ts in [now] * 3 + [now - timedelta(days=2, hours=1)]],
+        leads=[{"created_at": now - timedelta(days=40)}],
+    )
+
+
+def test_daily_activity_is_one_query_per_collection(monkeypatch, fake_db):
+    now = datetime.utcnow()
+    fake = make_db(fake_db, now)
+    monkeypatch.setattr(analytics_service, "db", fake)
+    monkeypatch.setattr(analytics_service.analytics_rollups, "enabled", False)
+
+    activity = asyncio.run(AnalyticsService().get_daily_activity(7))
+
+    assert len(activity) == 7
+    assert activity[-1] == {"date": now.strftime("%Y-%m-%d"), "conversations": 1, "messages": 3, "leads": 0}
+    assert activity[-3]["conversations"] == 1
+    assert sum(day["leads"] for day in activity) == 0
+    assert [len(c.calls_to("aggregate")) for c in fake.collections.values()] == [1, 1, 1]
+
+
+def test_hour_and_week_buckets(monkeypatch, fake_db):
+    monkeypatch.setattr(analytics_service, "db", make_db(fake_db, datetime(2026, 10, 14, 9, 30)))
+    monkeypatch.setattr(analytics_service.analytics_rollups, "enabled", False)
+    service = AnalyticsService()
+
+    hours = asyncio.run(service.get_activity(datetime(2026, 10, 14, 8), datetime(2026, 10, 14, 11), "hour"))
+    assert [h["date"] for h in hours] == ["2026-10-14T08:00", "2026-10-14T09:00", "2026-10-14T10:00"]
+    assert [h["messages"] for h in hours] == [0, 3, 0]
+
+    weeks = asyncio.run(service.get_activity(datetime(2026, 10, 5), datetime(2026, 10, 19), "week"))
+    assert [w["date"] for w in weeks] == ["2026-10-05", "2026-10-12"]  # Mondays
+    assert [w["conversations"] for w in weeks] == [0, 2]
+
+
+def test_rejects_unknown_granularity_and_huge_ranges():
+    service = AnalyticsService()
+    with pytest.raises(ValueError):
+        asyncio.run(service.get_activity(datetime(2026, 1, 1), datetime(2026, 1, 2), "minute"))
+    with pytest.raises(ValueError):
+        asyncio.run(service.get_activity(datetime(2000, 1, 1), datetime(2026, 1, 1), "hour"))
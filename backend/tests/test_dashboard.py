@@ -0,0 +1,86 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.core.container import get_analytics_cache
+from app.main import app
+from app.services.analytics_cache import AnalyticsCache
+
+
+class FakeAnalytics:
+    """Each method takes 50 ms, so sequential execution would be obvious."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def _slow(self, name, value):
+        self.calls.append(name)
+        await asyncio.sleep(0.05)
+        return value
+
+    async def get_user_engagement(self, days):
+        return await self._slow("engagement", {"active_users": 3, "period_days": days})
+
+    async def get_conversation_stats(self, user_id=None):
+        return await self._slow("conversations", {"total_conversations": 5})
+
+    async def get_rag_metrics(self):
+        return await self._slow("rag", {"retrieval_count": 7})
+
+    async def get_crm_insights(self):
+        raise RuntimeError("leads unavailable")
+
+    async def get_lead_conversion_stats(self):
+        return await self._slow("leads", {"total_leads": 2})
+
+
+def client_with(service):
+    cache = AnalyticsCache(service, enabled=True)
+    app.dependency_overrides[get_analytics_cache] = lambda: cache
+    return TestClient(app)
+
+
+def test_dashboard_combines_sections_and_reports_failures():
+    service = FakeAnalytics()
+    try:
+        client = client_with(service)
+        response = client.get("/analytics/dashboard?days=7")
+        body = response.json()
+        assert body["user_engagement"] == {"active_users": 3, "period_days": 7}
+        assert body["conversation_stats"] == {"total_conversations": 5}
+        assert body["crm_insights"] is None and "leads unavailable" in body["errors"]["crm_insights"]
+        assert response.headers["X-Cache"] == "MISS"
+
+        again = client.get("/analytics/dashboard?days=7")
+        assert again.headers["X-Cache"] == "HIT"
+        assert service.calls.count("engagement") == 1
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_dashboard_field_selection():
+    service = FakeAnalytics()
+    try:
+        client = client_with(service)
+        body = client.get("/analytics/dashboard?fields=rag_metrics,lead_conversion").json()
+        assert set(body) == {"rag_metrics", "lead_conversion"}
+        assert sorted(service.calls) == ["leads", "rag"]
+        assert client.get("/analytics/dashboard?fields=rag_metrics,nope").status_code == 400
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_sections_run_concurrently():
+    cache = AnalyticsCache(FakeAnalytics(), enabled=False)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await cache.call_many({name: (method, ()) for name, method in [
+            ("conversation_stats", "get_conversation_stats"),
+            ("rag_metrics", "get_rag_metrics"),
+            ("lead_conversion", "get_lead_conversion_stats"),
+        ]})
+        return loop.time() - started
+
+    assert asyncio.run(scenario()) < 0.12
@@ -0,0 +1,77 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import exports
+from app.services.exports import build_query, export_chunks
+
+
+def make_db(fake_db):
+    user = ObjectId()
+    base = datetime(2026, 1, 1)
+    leads = [
+        {"_id": ObjectId(), "user_id": user if i % 2 else str(user), "status": "new" if i < 4 else "closed",
+         "created_at": base + timedelta(days=i), "extracted_info": {"budget": "500k"}, "notes": []}
+        for i in range(6)
+    ]
+    return user, fake_db.seed(leads=leads)
+
+
+async def collect_chunks(chunks):
+    return [chunk async for chunk in chunks]
+
+
+async def collect(chunks):
+    return b"".join(await collect_chunks(chunks))
+
+
+def test_ndjson_batches_filters_and_legacy_refs(fake_db):
+    user, database = make_db(fake_db)
+    query = build_query("leads", start=datetime(2026, 1, 2), user_id=str(user), status="new")
+    chunks = asyncio.run(collect_chunks(export_chunks("leads", "ndjson", query, batch_size=2, database=database)))
+    rows = [json.loads(line) for chunk in chunks for line in chunk.decode().splitlines()]
+    # Days 1-3 are new leads on or after Jan 2, with both reference forms
+    assert [row["created_at"] for row in rows] == ["2026-01-02T00:00:00", "2026-01-03T00:00:00", "2026-01-04T00:00:00"]
+    assert {row["user_id"] for row in rows} == {str(user)}
+    assert len(chunks) == 2  # one chunk per cursor batch
+
+
+def test_csv_gzip_round_trip(fake_db):
+    _, database = make_db(fake_db)
+    body = asyncio.run(collect(export_chunks("leads", "csv", {}, compress=True, batch_size=4, database=database)))
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(body).decode())))
+    assert len(rows) == 6
+    assert rows[0]["status"] == "new" and json.loads(rows[0]["extracted_info"]) == {"budget": "500k"}
+    assert rows[0]["score"] == "" and rows[0]["notes"] == "[]"
+
+
+def test_build_query_rejects_bad_ranges_and_filters():
+    with pytest.raises(ValueError):
+        build_query("messages", start=datetime(2026, 2, 1), end=datetime(2026, 1, 1))
+    with pytest.raises(ValueError):
+        build_query("users", status="new")
+    assert build_query("conversations", end=datetime(2026, 1, 1)) == {"started_at": {"$lt": datetime(2026, 1, 1)}}
+
+
+def test_export_endpoint_streams_csv(monkeypatch, fake_db):
+    _, database = make_db(fake_db)
+    monkeypatch.setattr(exports, "db", database)
+    client = TestClient(app)
+
+    response = client.get("/exports/leads?format=csv&status=closed&gzip=true")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert response.headers["content-disposition"].endswith('.csv.gz"')
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert lines[0].startswith("_id,user_id,status") and len(lines) == 3
+
+    assert client.get("/exports/secrets").status_code == 404
+    assert client.get("/exports/users?status=new").status_code == 400
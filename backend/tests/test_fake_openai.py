@@ -0,0 +1,74 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from fake_openai_server import FakeSettings, create_app, fake_embedding
+
+
+def cosine(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def make_client(**overrides):
+    settings = FakeSettings(latency="fixed:0", embedding_latency="fixed:0", token_delay_ms=0, seed=7)
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    return TestClient(create_app(settings))
+
+
+def test_embeddings_are_deterministic_and_similarity_preserving():
+    client = make_client()
+    texts = ["3 bedroom house downtown", "3 bedroom house downtown", "office space with parking"]
+    data = client.post("/v1/embeddings", json={"model": "text-embedding-3-small", "input": texts}).json()["data"]
+    first, same, other = (item["embedding"] for item in data)
+    assert first == same == fake_embedding(texts[0])
+    assert abs(cosine(first, first) - 1.0) < 1e-9
+    assert cosine(first, fake_embedding("bedroom house")) > cosine(first, other)
+
+
+def test_streaming_chat_completion_ends_with_done():
+    client = make_client()
+    body = {"model": "gpt-4o-mini", "stream": True, "messages": [{"role": "user", "content": "condos near the park"}]}
+    with client.stream("POST", "/v1/chat/completions", json=body) as response:
+        lines = [line for line in response.iter_lines() if line]
+    assert lines[-1] == "data: [DONE]"
+    chunks = [json.loads(line[len("data: "):]) for line in lines[:-1]]
+    text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks)
+    assert "condos near the park" in text
+
+
+def test_rate_limit_injection():
+    client = make_client(rate_limit_rate=1.0)
+    response = client.post("/v1/chat/completions", json={"model": "gpt-4", "messages": []})
+    assert response.status_code == 429
+    assert response.json()["error"]["code"] == "rate_limit_exceeded"
+
+
+def test_gateway_against_fake_server(monkeypatch):
+    import asyncio
+    import httpx
+    from openai import AsyncOpenAI
+    from app.services import llm_gateway
+    from app.services.llm_gateway import LLMGateway
+    from app.services.model_router import ModelRouter
+    from app.services.rate_limiter import AdaptiveRateLimiter
+
+    events = []
+    monkeypatch.setattr(llm_gateway.rag_telemetry, "record", lambda kind, **fields: events.append((kind, fields)))
+    settings = FakeSettings(latency="fixed:0", embedding_latency="fixed:0", seed=1)
+    transport = httpx.ASGITransport(app=create_app(settings))
+    client = AsyncOpenAI(api_key="fake", base_url="http://fake/v1", max_retries=0,
+                         http_client=httpx.AsyncClient(transport=transport))
+
+    async def scenario():
+        gateway = LLMGateway(limiter=AdaptiveRateLimiter(), router=ModelRouter(), client_factory=lambda: client)
+        reply = await gateway.chat("summary", [{"role": "user", "content": "lofts downtown"}], items=2)
+        vectors = await gateway.embed(["lofts downtown", "lofts downtown"])
+        return reply, vectors, gateway.snapshot()
+
+    reply, vectors, snapshot = asyncio.run(scenario())
+    assert "lofts downtown" in reply
+    assert vectors[0] == vectors[1]
+    assert snapshot["latency"]["gpt-4o-mini"]["count"] == 1
+    # One latency field per stage
+    assert [(kind, "llm_ms" in f, "embed_ms" in f) for kind, f in events] == [("llm", True, False), ("embedding", False, True)]
@@ -0,0 +1,36 @@
+import asyncio
+
+from pymongo.errors import DuplicateKeyError
+
+from app.core.mongo import get_or_create
+
+
+def test_reports_creation_once(fake_db):
+    users = fake_db.users
+
+    async def scenario():
+        first = await get_or_create(users, {"email": "a@x.com"}, {"created_at": "now"})
+        second = await get_or_create(users, {"email": "a@x.com"}, {"created_at": "later"})
+        return first, second
+
+    (doc1, created1), (doc2, created2) = asyncio.run(scenario())
+    assert created1 and not created2
+    assert doc1["_id"] == doc2["_id"]
+    assert doc2["created_at"] == "now"
+    assert len(users.calls_to("find_one_and_update")) == 2 and len(users.docs) == 1
+
+
+def test_lost_race_returns_the_winner(fake_db):
+    users = fake_db.users
+
+    def lose_race(filter, update):
+        # Another worker inserted between our match and our insert, like a real unique index reports
+        del users.before["find_one_and_update"]
+        users.docs.append({**filter, "_id": "other-worker", "created_at": "earlier"})
+        raise DuplicateKeyError("E11000 duplicate key")
+
+    users.before["find_one_and_update"] = lose_race
+    doc, created = asyncio.run(get_or_create(users, {"email": "a@x.com"}, {"created_at": "now"}))
+    assert not created
+    assert doc["_id"] == "other-worker"
+    assert len(users.docs) == 1
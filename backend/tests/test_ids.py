@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from app.core.ids import as_object_id, migrate_ids, normalize_ref, to_object_id
+
+
+def test_helpers():
+    oid = ObjectId()
+    assert as_object_id(str(oid)) == oid
+    assert as_object_id(oid) is oid
+    assert as_object_id("user_1712345678") is None
+    assert normalize_ref("user_1712345678") == "user_1712345678"
+    assert normalize_ref(str(oid)) == oid
+    with pytest.raises(ValueError):
+        to_object_id("not-an-id")
+
+
+def test_migration_converts_in_batches_and_is_resumable(fake_db):
+    conv_ids = [ObjectId() for _ in range(7)]
+    messages = [{"_id": ObjectId(), "conversation_id": str(c)} for c in conv_ids]
+    messages.append({"_id": ObjectId(), "conversation_id": conv_ids[0]})  # already canonical
+    database = fake_db.seed(messages=messages, leads=[{"_id": ObjectId(), "user_id": "user_1712345678"}])
+
+    first = asyncio.run(migrate_ids(database, batch_size=3, pause_s=0, max_batches=1))
+    assert first["messages.conversation_id"]["converted"] == 3
+
+    report = asyncio.run(migrate_ids(database, batch_size=3, pause_s=0))
+    assert report["messages.conversation_id"]["converted"] == 4
+    assert all(isinstance(m["conversation_id"], ObjectId) for m in database.messages.docs)
+    assert [len(requests) for requests in database.messages.calls_to("bulk_write")] == [3, 3, 1]
+    # Opaque external ids are left alone
+    assert report["leads.user_id"] == {"scanned": 1, "converted": 0, "skipped": 1, "batches": 1}
+
+
+def test_smart_chat_starts_a_new_conversation_for_unknown_ids(monkeypatch):
+    from types import SimpleNamespace
+
+    from app.api import advanced_features
+
+    inserted, stored = [], []
+
+    async def get_conversation(conversation_id):
+        return None  # well-formed, but not in the database
+
+    async def insert(collection, doc):
+        inserted.append(collection)
+        return {**doc, "_id": ObjectId()}
+
+    async def add_message(conversation_id, role, content, deferred=False):
+        stored.append(conversation_id)
+
+    async def nothing(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(advanced_features.MongoConversationService, "get_conversation", get_conversation)
+    monkeypatch.setattr(advanced_features.MongoMessageService, "add_message", add_message)
+    monkeypatch.setattr(advanced_features.write_behind, "insert", insert)
+    monkeypatch.setattr(advanced_features.conversation_summarizer, "record_turn", nothing)
+    monkeypatch.setattr(advanced_features.search_trends, "record", lambda *args: None)
+    rag = SimpleNamespace(search_properties=lambda message: asyncio.sleep(0, []),
+                          generate_property_response=lambda message, properties, context: asyncio.sleep(0, "ok"))
+    crm = SimpleNamespace(extract_user_info=lambda message, user_id: asyncio.sleep(0, {}), queue_lead_upsert=nothing)
+
+    missing = str(ObjectId())
+    request = advanced_features.SmartChatRequest(message="hi", user_id="u1", conversation_id=missing)
+    response = asyncio.run(advanced_features.smart_chat_endpoint(request, rag, crm))
+
+    assert inserted == ["conversations"]
+    assert response.conversation_id != missing and stored == [response.conversation_id] * 2
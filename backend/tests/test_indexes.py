@@ -0,0 +1,57 @@
+import asyncio
+
+from app.core import indexes
+from app.core.indexes import INDEXES, IndexSpec, diff_indexes, ensure_indexes, summarize_plan
+
+
+def test_diff_detects_missing_drifted_and_unknown():
+    specs = [
+        IndexSpec("email_unique", [("email", 1)], unique=True),
+        IndexSpec("created_at", [("created_at", 1)]),
+        IndexSpec("company", [("company", 1)]),
+    ]
+    existing = [
+        {"name": "_id_", "key": {"_id": 1}},
+        {"name": "email_unique", "key": {"email": 1}},  # lost its unique flag
+        {"name": "created_at", "key": {"created_at": 1}},
+        {"name": "legacy_name", "key": {"name": 1}},
+    ]
+    diff = diff_indexes(specs, existing)
+    assert diff["ok"] == ["created_at"]
+    assert [s.name for s in diff["missing"]] == ["company"]
+    assert [s.name for s in diff["drifted"]] == ["email_unique"]
+    assert diff["unknown"] == ["legacy_name"]
+
+
+def test_ensure_creates_registry_and_only_repairs_drift_on_request(fake_db):
+    # email_unique lost its unique flag
+    fake_db.users.indexes["email_unique"] = {"name": "email_unique", "key": {"email": 1}}
+    report = asyncio.run(ensure_indexes(fake_db))
+    assert report["users"]["drifted"] == ["email_unique"]
+    assert fake_db.users.calls_to("drop_index") == []
+    assert list(fake_db.messages.indexes)[1:] == [spec.name for spec in INDEXES["messages"]]
+
+    asyncio.run(ensure_indexes(fake_db, fix_drift=True))
+    assert fake_db.users.calls_to("drop_index") == ["email_unique"]
+    assert fake_db.users.indexes["email_unique"]["unique"] is True
+
+
+def test_dry_run_changes_nothing(fake_db):
+    report = asyncio.run(ensure_indexes(fake_db, dry_run=True))
+    assert report["leads"]["missing"] and not fake_db.leads.calls_to("create_index")
+
+
+def test_summarize_plan_flags_collscan():
+    ixscan = {"queryPlanner": {"winningPlan": {"stage": "LIMIT", "inputStage": {
+        "stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "conversation_created_at"}}}}}
+    collscan = {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+
+    assert summarize_plan(ixscan) == {"stages": ["LIMIT", "FETCH", "IXSCAN"], "indexes": ["conversation_created_at"], "collscan": False}
+    assert summarize_plan(collscan)["collscan"] is True
+
+
+def test_every_hot_query_has_a_matching_index_prefix():
+    for query in indexes.HOT_QUERIES:
+        fields = list(query["filter"])
+        leading = [spec.keys[0][0] for spec in INDEXES[query["collection"]]]
+        assert any(field in leading for field in fields), query["name"]
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+
+from app.services.lead_scoring import LeadScorer, apply_weights, build_features
+
+
+NOW = datetime(2026, 10, 19, 12)
+
+
+def lead(user_id, **fields):
+    return {"_id": ObjectId(), "user_id": user_id, "status": "new", "last_contact": NOW, "notes": [],
+            "extracted_info": {}, **fields}
+
+
+def test_features_and_weighted_scores():
+    hot = lead("u1", extracted_info={"budget": "500k", "urgency": "high"}, status="qualified")
+    cold = lead("u2", last_contact=NOW - timedelta(days=60), extracted_info={"urgency": "low"})
+    closed = lead("u1", status="closed")
+    activity = {"u1": {"conversations": 4, "messages": 50, "last_message_at": NOW}}
+
+    features = build_features([hot, cold, closed], activity, NOW)
+    assert features["recency"][0] == 1.0 and features["recency"][1] < 0.01
+    assert features["messages"][0] == 1.0 and features["messages"][1] == 0.0
+    assert list(features["budget"]) == [1.0, 0.0, 0.0]
+    assert features["follow_up"][2] == 0.0
+
+    scores = apply_weights(features)
+    assert scores[0] > scores[2] > scores[1]
+    assert 0 <= scores.min() and scores.max() <= 100
+    # Only the weighted features count
+    assert list(apply_weights(features, {"budget": 1.0})) == [100.0, 0.0, 0.0]
+
+
+def test_scoring_is_vectorized():
+    leads = [lead(f"u{i % 1000}", extracted_info={"budget": i % 2, "urgency": "medium"}) for i in range(100_000)]
+    activity = {f"u{i}": {"conversations": i % 7, "messages": i % 40, "last_message_at": NOW} for i in range(1000)}
+    started = time.perf_counter()
+    scores = apply_weights(build_features(leads, activity, NOW))
+    assert len(scores) == 100_000 and np.isfinite(scores).all()
+    assert time.perf_counter() - started < 5
+
+
+def make_db(fake_db, leads):
+    users = {lead["user_id"] for lead in leads}
+    conversations = [{"user_id": u, "message_count": 10, "last_message_at": NOW} for u in users]
+    return fake_db.seed(leads=leads, conversations=conversations)
+
+
+def scored_ids(database):
+    return [request._filter["_id"] for requests in database.leads.calls_to("bulk_write") for request in requests]
+
+
+def test_full_then_incremental_runs_and_top_n(fake_db):
+    user_a, user_b = ObjectId(), ObjectId()
+    leads = [lead(user_a, extracted_info={"budget": "1M", "urgency": "high"}), lead(user_b), lead(user_b)]
+    database = make_db(fake_db, leads)
+    scorer = LeadScorer(database=database, batch_size=2, enabled=True)
+
+    async def scenario():
+        first = await scorer.run()
+        idle = await scorer.run()
+        scorer.touch_user(str(user_a))
+        scorer.touch_lead(leads[2]["_id"])
+        incremental = await scorer.run()
+        return first, idle, incremental, await scorer.top(2)
+
+    first, idle, incremental, top = asyncio.run(scenario())
+    assert first["full"] and first["scored"] == 3
+    assert idle == {"full": False, "scored": 0}
+    assert incremental["scored"] == 2
+    scored = scored_ids(database)
+    assert scored[3:] and set(scored[3:]) == {leads[0]["_id"], leads[2]["_id"]}
+    assert [t["_id"] for t in top][0] == leads[0]["_id"] and len(top) == 2
+    assert all("scored_at" in d for d in database.leads.docs)
+
+
+def test_full_runs_happen_once_across_workers_and_restarts(fake_db):
+    leads = [lead(ObjectId()) for _ in range(3)]
+    database = make_db(fake_db, leads)
+    worker = LeadScorer(database=database, enabled=True)
+    worker.lease.owner = "worker-1"
+    other = LeadScorer(database=database, enabled=True)
+    other.lease.owner = "worker-2"
+
+    async def scenario():
+        first = await worker.run()
+        # Another worker, and this worker after a restart, see the stored last full run
+        sibling = await other.run()
+        restarted = LeadScorer(database=database, enabled=True)
+        restarted.lease.owner = "worker-1"
+        again = await restarted.run()
+        return first, sibling, again
+
+    first, sibling, again = asyncio.run(scenario())
+    assert first["full"] and first["scored"] == 3
+    assert sibling == again == {"full": False, "scored": 0}
+    (state,) = database.job_leases.docs
+    assert state["owner"] == "worker-1" and "last_full_at" in state
+
+
+def test_unknown_labels_and_missing_activity_use_defaults():
+    leads = [lead("nobody", status="archived", last_contact=None, extracted_info={"urgency": "HIGH"}),
+             lead("nobody", status=None, extracted_info={"urgency": None})]
+    features = build_features(leads, {}, NOW)
+    assert list(features["urgency"]) == [1.0, 0.3]
+    assert list(features["follow_up"]) == [0.4, 0.4]
+    assert list(features["messages"]) == [0.0, 0.0]
+    assert features["recency"][0] < 1e-6 and features["recency"][1] == 1.0
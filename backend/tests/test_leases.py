@@ -0,0 +1,25 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.core.leases import Lease
+
+
+def test_one_owner_at_a_time_until_release_or_expiry(fake_db):
+    first = Lease("rollups", ttl=60, owner="a", database=fake_db)
+    second = Lease("rollups", ttl=60, owner="b", database=fake_db)
+
+    async def scenario():
+        results = [await first.acquire(), await second.acquire(), await first.acquire()]
+        await first.save(last_full_at=datetime(2026, 1, 1))
+        await second.save(last_full_at=datetime(2030, 1, 1))  # not the holder: ignored
+        state = await second.state()
+        await first.release()
+        results.append(await second.acquire())
+        # An expired lease goes to whoever asks next
+        fake_db.job_leases.docs[0]["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+        results.append(await first.acquire())
+        return results, state
+
+    results, state = asyncio.run(scenario())
+    assert results == [True, False, True, True, True]
+    assert state["last_full_at"] == datetime(2026, 1, 1)
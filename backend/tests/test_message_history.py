@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.services import mongo_message_service
+from app.services.mongo_message_service import MongoMessageService, decode_cursor, encode_cursor
+
+
+def make_conversation(n):
+    conv = ObjectId()
+    start = datetime(2024, 1, 1)
+    docs = [{"_id": ObjectId(), "conversation_id": conv, "content": f"m{i}",
+             "created_at": start + timedelta(seconds=i)} for i in range(n)]
+    return str(conv), docs
+
+
+def test_cursor_roundtrip_and_rejects_garbage():
+    msg = {"_id": ObjectId(), "created_at": datetime(2024, 5, 1, 12, 30, 0, 123000)}
+    assert decode_cursor(encode_cursor(msg)) == (msg["created_at"], msg["_id"])
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_new_messages_use_stored_millisecond_precision(monkeypatch, fake_db):
+    monkeypatch.setattr(mongo_message_service, "db", fake_db)
+    message = asyncio.run(MongoMessageService.add_message(str(ObjectId()), "user", "hi"))
+    assert message["created_at"].microsecond % 1000 == 0
+    assert fake_db.messages.docs[0]["created_at"] == message["created_at"]
+    # A cursor built from an in-memory copy with microseconds still points at the stored value
+    stored = {"_id": message["_id"], "created_at": message["created_at"]}
+    precise = {**stored, "created_at": stored["created_at"] + timedelta(microseconds=456)}
+    assert decode_cursor(encode_cursor(precise)) == decode_cursor(encode_cursor(stored))
+
+
+def test_recent_messages_are_a_bounded_window(monkeypatch, fake_db):
+    conv, docs = make_conversation(25)
+    monkeypatch.setattr(mongo_message_service, "db", fake_db.seed(messages=docs))
+
+    recent = asyncio.run(MongoMessageService.get_recent_messages(conv, limit=10))
+
+    assert [m["content"] for m in recent] == [f"m{i}" for i in range(15, 25)]
+
+
+def test_keyset_pages_cover_history_without_overlap(monkeypatch, fake_db):
+    conv, docs = make_conversation(23)
+    # Two messages in the same instant must still page deterministically
+    docs[10]["created_at"] = docs[11]["created_at"]
+    monkeypatch.setattr(mongo_message_service, "db", fake_db.seed(messages=docs))
+
+    async def walk():
+        seen, cursor = [], None
+        while True:
+            page = await MongoMessageService.get_messages_page(conv, limit=5, cursor=cursor)
+            seen = page["messages"] + seen
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    seen = asyncio.run(walk())
+    assert len(seen) == 23
+    assert len({m["_id"] for m in seen}) == 23
+    assert seen == sorted(seen, key=lambda m: (m["created_at"], m["_id"]))
+
+
+def test_messages_endpoint_keeps_the_list_response_unless_paging(monkeypatch, fake_db):
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    conv, docs = make_conversation(7)
+    monkeypatch.setattr(mongo_message_service, "db", fake_db.seed(messages=docs))
+    client = TestClient(app)
+
+    everything = client.get(f"/mongo/messages/{conv}").json()
+    assert [m["content"] for m in everything] == [f"m{i}" for i in range(7)]
+
+    page = client.get(f"/mongo/messages/{conv}?limit=3").json()
+    assert [m["content"] for m in page["messages"]] == ["m4", "m5", "m6"]
+    older = client.get(f"/mongo/messages/{conv}", params={"cursor": page["next_cursor"]}).json()
+    assert [m["content"] for m in older["messages"]] == [f"m{i}" for i in range(4)]
@@ -0,0 +1,61 @@
+from app.services.model_router import ModelRouter, LatencyHistogram, count_constraints
+
+
+def test_small_model_for_short_listing_summary():
+    router = ModelRouter(small_model="small", large_model="large")
+    assert router.choose("summary", "condo downtown", items=3) == "small"
+    assert router.choose("summary", "condo downtown", items=8) == "large"
+
+
+def test_multi_constraint_question_goes_to_large_model():
+    router = ModelRouter(small_model="small", large_model="large")
+    question = "3 bedroom house near downtown under $600k with parking"
+    assert router.choose("chat", question) == "large"
+    assert router.choose("extraction", question) == "small"
+
+
+def test_plain_in_is_not_a_location():
+    assert count_constraints("I'm interested in a condo, can we talk in 2 weeks?") == 1
+    assert count_constraints("Looking for a condo in Austin") == 2
+
+
+def test_slo_breach_downgrades_large_model():
+    router = ModelRouter(small_model="small", large_model="large", slo_ms=1000, probe_fraction=0)
+    for _ in range(50):
+        router.record("large", 6000)
+    assert router.choose("summary", "homes", items=10) == "small"
+    assert router.choose("complex_qa", "homes") == "large"
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram(buckets=[100, 200, 400])
+    for latency in [50] * 90 + [300] * 9 + [900]:
+        histogram.observe(latency)
+    assert histogram.percentile(0.5) == 100
+    assert histogram.percentile(0.95) == 400
+    assert histogram.percentile(1.0) == 900
+    assert histogram.snapshot()["count"] == 100
+
+
+def test_downgrade_ends_when_the_large_model_recovers():
+    now = [0.0]
+    router = ModelRouter(small_model="small", large_model="large", slo_ms=1000, half_life_s=60,
+                         probe_fraction=1.0, clock=lambda: now[0])
+    for _ in range(50):
+        router.record("large", 6000)
+    # Probes still reach the large model during the breach, and their fast samples outweigh the old slow ones
+    assert router.choose("summary", "homes", items=10) == "large"
+    now[0] += 300
+    for _ in range(50):
+        router.record("large", 500)
+    assert router.get_percentile("large", 0.95) == 500
+
+    router.probe_fraction = 0
+    for _ in range(50):
+        router.record("large", 6000)
+    assert router.choose("summary", "homes", items=10) == "small"
+    # Without new samples the breach fades out of the histogram
+    now[0] += 600
+    assert router.get_percentile("large", 0.95) is None
+    assert router.choose("summary", "homes", items=10) == "large"
+    assert router.snapshot()["latency"]["large"]["count"] == 150
@@ -0,0 +1,45 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.services import crm_service
+from app.services.crm_service import CRMService, mark_primary_leads
+
+
+def test_mark_primary_leads_marks_oldest_lead_once(fake_db):
+    now = datetime(2026, 1, 1)
+    with_leads, already_primary = ObjectId(), ObjectId()
+    leads = [
+        {"_id": 1, "user_id": with_leads, "created_at": now + timedelta(days=2)},
+        {"_id": 2, "user_id": with_leads, "created_at": now},
+        {"_id": 3, "user_id": already_primary, "created_at": now},
+        {"_id": 4, "user_id": already_primary, "created_at": now + timedelta(days=1), "primary": True},
+        {"_id": 5, "user_id": "user_1712345678", "created_at": now},
+    ]
+    database = fake_db.seed(leads=leads)
+
+    first = asyncio.run(mark_primary_leads(database, batch_size=1, pause_s=0))
+    again = asyncio.run(mark_primary_leads(database, pause_s=0))
+    assert first == {"users": 2, "marked": 2, "skipped": 0, "batches": 2}
+    assert again["marked"] == 0
+    assert [d["_id"] for d in database.leads.docs if d.get("primary")] == [2, 4, 5]
+    assert database.leads.calls_to("aggregate")[0][0] == {"$sort": {"user_id": 1, "created_at": 1, "_id": 1}}
+
+
+def test_queue_lead_upsert_matches_any_existing_lead(monkeypatch):
+    calls = []
+
+    async def upsert(collection, filter, update):
+        calls.append((collection, filter, update))
+
+    monkeypatch.setattr(crm_service.write_behind, "upsert", upsert)
+    user = ObjectId()
+    asyncio.run(CRMService().queue_lead_upsert(str(user), {"budget": "500k"}))
+
+    [(collection, filter, update)] = calls
+    assert collection == "leads"
+    # Legacy leads without `primary`, and string references, still count as existing
+    assert filter == {"user_id": {"$in": [user, str(user)]}}
+    inserted = update["$setOnInsert"]
+    assert inserted["user_id"] == user and inserted["primary"] is True and inserted["status"] == "new"
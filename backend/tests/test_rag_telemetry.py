@@ -0,0 +1,67 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from app.services.rag_telemetry import RagTelemetry, window_start
+from app.utils.sketch import DDSketch
+
+
+def test_sketch_quantiles_are_within_relative_accuracy_and_merge():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(3, 1) for _ in range(5000)]
+    left, right = DDSketch(), DDSketch()
+    for i, value in enumerate(values):
+        (left if i % 2 else right).add(value)
+    left.merge(DDSketch.from_doc(right.to_doc()))
+
+    ordered = sorted(values)
+    for q in (0.5, 0.95, 0.99):
+        exact = ordered[int(q * (len(ordered) - 1))]
+        assert abs(left.quantile(q) - exact) <= 0.02 * exact
+    assert left.count == 5000 and left.max == max(values)
+    assert DDSketch().quantile(0.5) is None
+
+
+def test_flush_writes_logs_and_merges_window_sketches(fake_db):
+    telemetry = RagTelemetry(database=fake_db)
+
+    async def scenario():
+        for ms in range(1, 101):
+            telemetry.record("retrieval", embed_ms=ms / 10, search_ms=ms, retrieval_ms=ms + 1.0, k=4, results=4,
+                             cache_hits={"embedding": ms % 4 == 0, "search": False}, ok=True)
+        telemetry.record("llm", llm_ms=500.0, ok=False)
+        first = await telemetry.flush()
+        # A second batch (or another worker) lands in the same window document
+        telemetry.record("retrieval", search_ms=1000.0, retrieval_ms=1001.0, ok=True)
+        second = await telemetry.flush()
+        return first, second, await telemetry.load_metrics(datetime.utcnow() - timedelta(hours=1))
+
+    first, second, metrics = asyncio.run(scenario())
+    assert (first, second) == (101, 1)
+    assert len(fake_db.rag_logs.docs) == 102
+    assert len(fake_db.rag_metrics.docs) == 1
+
+    counters, sketches = metrics["counters"], metrics["sketches"]
+    assert counters["retrieval.events"] == 101
+    assert counters["retrieval.cache_hits.embedding"] == 25
+    assert counters["llm.errors"] == 1
+    search = sketches["retrieval.search_ms"]
+    assert search.count == 101 and search.max == 1000.0
+    assert abs(search.quantile(0.5) - 51) <= 0.02 * 51
+    assert sketches["retrieval.embed_ms"].count == 100
+
+
+def test_full_buffer_drops_and_disabled_records_nothing(fake_db):
+    telemetry = RagTelemetry(max_buffer=2, database=fake_db)
+    for _ in range(3):
+        telemetry.record("retrieval", retrieval_ms=1.0)
+    assert telemetry.snapshot()["buffered"] == 2 and telemetry.stats["dropped"] == 1
+
+    disabled = RagTelemetry(enabled=False, database=fake_db)
+    disabled.record("retrieval", retrieval_ms=1.0)
+    assert disabled.snapshot()["buffered"] == 0
+
+
+def test_window_start_is_aligned_to_utc_epoch():
+    assert window_start(datetime(2024, 5, 1, 13, 47, 12), 3600) == datetime(2024, 5, 1, 13)
+    assert window_start(datetime(2024, 5, 1, 13, 47, 12), 900) == datetime(2024, 5, 1, 13, 45)
@@ -0,0 +1,84 @@
+import asyncio
+
+from app.services.rate_limiter import AdaptiveRateLimiter, Priority
+
+
+def test_interactive_waiters_go_before_bulk():
+    async def scenario():
+        limiter = AdaptiveRateLimiter(rpm=6000, tpm=10**6, max_concurrency=2, min_concurrency=1)
+        limiter.limit = 1
+        order = []
+        first = await limiter.acquire(Priority.INTERACTIVE)
+
+        async def worker(name, priority):
+            async with limiter.slot(priority):
+                order.append(name)
+
+        bulk = asyncio.create_task(worker("bulk", Priority.BULK))
+        await asyncio.sleep(0)
+        chat = asyncio.create_task(worker("chat", Priority.INTERACTIVE))
+        await asyncio.sleep(0)
+        limiter.release(first)
+        await asyncio.gather(bulk, chat)
+        return order
+
+    assert asyncio.run(scenario()) == ["chat", "bulk"]
+
+
+def test_rate_limited_calls_halve_concurrency():
+    async def scenario():
+        limiter = AdaptiveRateLimiter(rpm=6000, tpm=10**6, max_concurrency=16, min_concurrency=1)
+        limiter.limit = 8
+        async with limiter.slot() as permit:
+            permit.rate_limited()
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.limit == 4
+    assert limiter.stats["rate_limited"] == 1
+
+
+def test_token_budget_delays_admission():
+    async def scenario():
+        limiter = AdaptiveRateLimiter(rpm=6000, tpm=600, max_concurrency=4)
+        async with limiter.slot(tokens=600):
+            pass
+        return limiter._admission_wait(Priority.INTERACTIVE, 100)
+
+    assert asyncio.run(scenario()) > 0
+
+
+def test_mcp_tool_chat_goes_through_the_shared_limiter(monkeypatch):
+    from types import SimpleNamespace
+
+    import pytest
+
+    from app.mcp.tools import llm_tools
+    from app.services.llm_gateway import LLMGateway
+
+    async def create(**kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=" ok "))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    limiter = AdaptiveRateLimiter()
+    gateway = LLMGateway(limiter=limiter, client_factory=lambda: client)
+    monkeypatch.setattr(llm_tools, "llm_gateway", gateway)
+    priorities = []
+    acquire = limiter.acquire
+
+    async def spy(priority=Priority.INTERACTIVE, tokens=0):
+        priorities.append(priority)
+        return await acquire(priority, tokens)
+
+    monkeypatch.setattr(limiter, "acquire", spy)
+
+    async def scenario():
+        gateway.loop = asyncio.get_running_loop()
+        # Synchronous tools run in worker threads and hop onto the worker's loop
+        reply = await asyncio.to_thread(llm_tools.chat, [{"role": "user", "content": "hi"}])
+        with pytest.raises(RuntimeError):
+            llm_tools.chat([{"role": "user", "content": "hi"}])
+        return reply
+
+    assert asyncio.run(scenario()) == "ok"
+    assert priorities == [Priority.BACKGROUND] and limiter.stats["admitted"] == 1
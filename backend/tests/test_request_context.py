@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app.core.request_context import current_request_context, memoize, request_scope
+
+
+def counting_factory(calls, value, delay=0.01):
+    async def factory():
+        calls.append(value)
+        await asyncio.sleep(delay)
+        return value
+    return factory
+
+
+def test_concurrent_callers_share_one_computation():
+    calls = []
+
+    async def main():
+        with request_scope() as ctx:
+            results = await asyncio.gather(*(memoize(("embedding", "q"), counting_factory(calls, [0.1])) for _ in range(5)))
+            return results, ctx.snapshot()
+
+    results, snapshot = asyncio.run(main())
+    assert calls == [[0.1]]
+    assert all(r == [0.1] for r in results)
+    assert snapshot == {"keys": 1, "hits": 4, "misses": 1}
+
+
+def test_no_memoization_outside_a_request():
+    calls = []
+
+    async def main():
+        await memoize("k", counting_factory(calls, 1))
+        await memoize("k", counting_factory(calls, 1))
+
+    asyncio.run(main())
+    assert calls == [1, 1]
+    assert current_request_context() is None
+
+
+def test_nested_scope_reuses_active_context():
+    calls = []
+
+    async def main():
+        with request_scope() as outer:
+            await memoize("user", counting_factory(calls, "u"))
+            with request_scope() as inner:
+                assert inner is outer
+                await memoize("user", counting_factory(calls, "u"))
+
+    asyncio.run(main())
+    assert calls == ["u"]
+
+
+def test_failures_are_not_memoized():
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("timeout")
+        return "ok"
+
+    async def main():
+        with request_scope():
+            with pytest.raises(RuntimeError):
+                await memoize("retrieval", flaky)
+            return await memoize("retrieval", flaky)
+
+    assert asyncio.run(main()) == "ok"
+    assert len(attempts) == 2
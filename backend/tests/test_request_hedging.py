@@ -0,0 +1,70 @@
+import asyncio
+
+from app.services.model_router import ModelRouter
+from app.services.request_hedging import HedgingPolicy
+
+
+def make_policy(**kwargs):
+    router = ModelRouter(small_model="m", large_model="m")
+    for _ in range(100):
+        router.record("m", 50)
+    return HedgingPolicy(router, enabled=True, min_delay_ms=10, min_samples=10, **kwargs)
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    calls = []
+
+    async def call():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+            return "primary"
+        return "hedge"
+
+    policy = make_policy(budget=1.0)
+    assert asyncio.run(policy.run("m", call)) == "hedge"
+    assert policy.stats["hedged"] == 1
+    assert policy.stats["hedge_wins"] == 1
+
+
+def test_budget_caps_hedges():
+    async def call():
+        await asyncio.sleep(0.12)
+        return "ok"
+
+    async def scenario(policy):
+        for _ in range(5):
+            await policy.run("m", call)
+
+    policy = make_policy(budget=0.0)
+    asyncio.run(scenario(policy))
+    assert policy.stats["hedged"] == 1
+    assert policy.stats["budget_denied"] == 4
+
+
+def test_cancelled_hedge_loser_is_recorded_as_a_lower_bound():
+    from types import SimpleNamespace
+
+    from app.services.llm_gateway import LLMGateway
+    from app.services.rate_limiter import AdaptiveRateLimiter
+
+    delays = [5, 0]
+
+    async def create(**kwargs):
+        await asyncio.sleep(delays.pop(0))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    policy = make_policy(budget=1.0)
+    gateway = LLMGateway(limiter=AdaptiveRateLimiter(), router=policy.router, hedging=policy,
+                         client_factory=lambda: client)
+
+    async def scenario():
+        reply = await gateway.chat("chat", [{"role": "user", "content": "hi"}], model="m")
+        await asyncio.sleep(0.01)  # let the cancelled primary unwind
+        return reply
+
+    assert asyncio.run(scenario()) == "ok"
+    histogram = policy.router.histograms["m"]
+    # 100 seeded samples, the winning hedge and the cancelled primary
+    assert histogram.count == 102 and histogram.max_ms >= 50
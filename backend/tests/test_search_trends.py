@@ -0,0 +1,75 @@
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime
+
+from app.services.search_trends import SearchTrends, extract_attributes, result_ids
+from app.utils.sketch import SpaceSaving
+
+
+def test_extract_attributes_from_query_and_crm_fields():
+    assert extract_attributes("3 bedroom condo in Lake Forest under $450k") == {
+        "location": "lake forest", "property_type": "condo", "price_band": "300k-500k", "bedrooms": "3",
+    }
+    assert extract_attributes("5 bed house, budget 1.2 million") == {
+        "location": None, "property_type": "house", "price_band": "1m+", "bedrooms": "4+",
+    }
+    # CRM extraction wins when it found something
+    info = {"location_preference": "Waterfront", "budget": "$600,000", "property_type": None}
+    assert extract_attributes("studio near the park", info) == {
+        "location": "waterfront", "property_type": None, "price_band": "500k-750k", "bedrooms": "0",
+    }
+    assert result_ids([{"chunk_id": "c1"}, {"metadata": {"property_id": "p9"}}, "text"]) == ["c1", "p9"]
+
+
+def test_space_saving_finds_heavy_hitters_and_merges():
+    rng = random.Random(3)
+    stream = [f"q{min(int(rng.paretovariate(1.2)), 500)}" for _ in range(20000)]
+    exact = Counter(stream)
+    left, right = SpaceSaving(50), SpaceSaving(50)
+    for i, item in enumerate(stream):
+        (left if i % 2 else right).add(item)
+    left.merge(SpaceSaving.from_doc(right.to_doc()))
+
+    top = left.top(5)
+    assert [item for item, _, _ in top] == [item for item, _ in exact.most_common(5)]
+    for item, count, error in top:
+        assert count - error <= exact[item] <= count
+    assert left.total == 20000 and len(left.counts) == 50
+
+
+def test_record_flush_and_trends(fake_db):
+    trends = SearchTrends(capacity=20, worker_id="w1", database=fake_db)
+    other = SearchTrends(capacity=20, worker_id="w2", database=fake_db)
+
+    async def scenario():
+        for _ in range(3):
+            trends.record("chat", "Condo downtown, 2 beds", results=[{"chunk_id": "c1"}])
+        trends.record("smart_chat", "house in Austin under $400k", {"property_type": "house"}, [{"chunk_id": "c2"}])
+        other.record("properties_search", "condo downtown,  2 BEDS", results=[{"chunk_id": "c1"}])
+        await trends.flush()
+        # A second flush rewrites the same day document instead of adding to it
+        await trends.flush()
+        trends.record("chat", "condo downtown, 2 beds")
+        await trends.flush()
+        await other.flush()
+        return await trends.trends(days=1, limit=3)
+
+    result = asyncio.run(scenario())
+    assert len(fake_db.search_logs.docs) == 6
+    assert len(fake_db.search_trends.docs) == 2
+    assert result["total_searches"] == 6
+    assert result["popular_locations"] == ["downtown", "austin"]
+    assert result["popular_property_types"] == ["condo", "house"]
+    assert result["bedroom_preferences"] == {"2": 5}
+    assert result["price_ranges"] == {"300k-500k": 1}
+    assert result["top_queries"][0] == {"query": "condo downtown, 2 beds", "count": 5, "error": 0}
+    assert result["top_results"][0]["id"] == "c1"
+    assert result["sources"] == {"chat": 4, "smart_chat": 1, "properties_search": 1}
+    assert result["daily"] == [{"date": datetime.utcnow().strftime("%Y-%m-%d"), "searches": 6}]
+
+
+def test_disabled_trends_record_nothing(fake_db):
+    trends = SearchTrends(enabled=False, database=fake_db)
+    trends.record("chat", "condo downtown")
+    assert trends.snapshot()["buffered"] == 0 and trends.stats["recorded"] == 0
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from app.agents.stage_graph import StageGraph
+
+
+def sleeper(seconds, value):
+    async def stage(results):
+        await asyncio.sleep(seconds)
+        return value
+    return stage
+
+
+def test_independent_stages_run_concurrently():
+    graph = StageGraph()
+    graph.add_stage("user", sleeper(0.05, "u"))
+    graph.add_stage("retrieval", sleeper(0.1, "docs"))
+    graph.add_stage("conversation", sleeper(0.05, "c"), ["user"])
+    graph.add_stage("response", lambda r: asyncio.sleep(0, f"{r['conversation']}:{r['retrieval']}"), ["conversation", "retrieval"])
+
+    results = asyncio.run(graph.run())
+    report = graph.timing_report()
+
+    assert results["response"] == "c:docs"
+    assert report["total_ms"] < 180
+    assert report["critical_path"][-1] == "response"
+    assert set(report["stages"]) == {"user", "retrieval", "conversation", "response"}
+
+
+def test_unknown_dependency_is_rejected():
+    graph = StageGraph()
+    with pytest.raises(ValueError):
+        graph.add_stage("history", sleeper(0, None), ["conversation"])
+
+
+def test_failure_propagates_and_cancels_pending_stages():
+    async def boom(results):
+        raise RuntimeError("mongo down")
+
+    graph = StageGraph()
+    graph.add_stage("user", boom)
+    graph.add_stage("slow", sleeper(5, None))
+    with pytest.raises(RuntimeError):
+        asyncio.run(graph.run())
+    assert "slow" not in graph.results
+
+
+def test_sync_extraction_does_not_block_other_stages():
+    import time
+    from types import SimpleNamespace
+
+    from app.agents.orchestrator import OrchestratorAgent
+    from app.core.request_context import request_scope
+
+    orchestrator = OrchestratorAgent.__new__(OrchestratorAgent)
+
+    def extract_user_info(message):
+        time.sleep(0.1)  # blocking OpenAI call
+        return {"budget": "500k", "done_at": time.perf_counter()}
+
+    async def heartbeat(results):
+        await asyncio.sleep(0.01)
+        return time.perf_counter()
+
+    orchestrator.crm_agent = SimpleNamespace(extract_user_info=extract_user_info)
+    graph = StageGraph()
+    graph.add_stage("extraction", lambda r: orchestrator._extract_user_info("budget 500k"))
+    graph.add_stage("heartbeat", heartbeat)
+
+    async def scenario():
+        with request_scope():
+            return await graph.run()
+
+    results = asyncio.run(scenario())
+    assert results["extraction"]["budget"] == "500k"
+    # The event loop kept ticking while the extractor blocked its thread
+    assert results["heartbeat"] < results["extraction"]["done_at"]
@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from app.services import mongo_user_service
+from app.services.mongo_user_service import MongoUserService, user_cache
+from app.utils.cache import TTLCache
+
+
+def reads(database):
+    return len(database.users.calls_to("find_one")) + len(database.users.calls_to("find_one_and_update"))
+
+
+def test_ttl_cache_negative_entries_expire_sooner():
+    cache = TTLCache(ttl=10, negative_ttl=0.01)
+    cache.set("known", {"name": "Ana"})
+    cache.set("unknown", None)
+    assert cache.get("unknown") == (True, None)
+    time.sleep(0.02)
+    assert cache.get("unknown") == (False, None)
+    assert cache.get("known") == (True, {"name": "Ana"})
+
+
+def test_repeated_lookups_make_no_round_trips(monkeypatch, fake_db):
+    monkeypatch.setattr(mongo_user_service, "db", fake_db)
+    user_cache.clear()
+
+    async def scenario():
+        created = await MongoUserService.get_or_create_user_by_email("ana@example.com")
+        before = reads(fake_db)
+        for _ in range(5):
+            by_email = await MongoUserService.get_user_by_email("ana@example.com")
+            by_id = await MongoUserService.get_user_by_id(str(created["_id"]))
+        assert reads(fake_db) == before
+        assert by_email["_id"] == by_id["_id"] == created["_id"]
+        assert "created" not in by_email
+
+        # Callers may mutate what they get back
+        by_id["email"] = "mutated"
+        assert (await MongoUserService.get_user_by_id(str(created["_id"])))["email"] == "ana@example.com"
+
+        await MongoUserService.update_user(str(created["_id"]), {"name": "Ana"})
+        assert (await MongoUserService.get_user_by_email("ana@example.com"))["name"] == "Ana"
+        assert reads(fake_db) == before + 1
+
+    asyncio.run(scenario())
+
+
+def test_create_user_replaces_negative_entry(monkeypatch, fake_db):
+    monkeypatch.setattr(mongo_user_service, "db", fake_db)
+    user_cache.clear()
+
+    async def scenario():
+        assert await MongoUserService.get_user_by_email("bo@example.com") is None
+        assert await MongoUserService.get_user_by_email("bo@example.com") is None
+        assert reads(fake_db) == 1
+        await MongoUserService.create_user("bo@example.com", name="Bo")
+        return await MongoUserService.get_user_by_email("bo@example.com")
+
+    assert asyncio.run(scenario())["name"] == "Bo"
+    assert reads(fake_db) == 1
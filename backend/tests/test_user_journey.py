@@ -0,0 +1,67 @@
+import asyncio
+
+from bson import ObjectId
+
+from app.services import analytics_service
+from app.services.analytics_service import AnalyticsService
+from app.utils.topic_matcher import TopicMatcher, get_topic_matcher
+
+
+def test_matcher_finds_whole_word_phrases_in_one_pass():
+    matcher = TopicMatcher({
+        "Viewings": ["open house", "tour"],
+        "Property Search": ["house"],
+        "Location": ["area"],
+        "Pricing": ["price", "prices"],
+    })
+    hits = list(matcher.scan("Any OPEN  house tours? Prices in the bay area"))
+    assert [(topic, start) for topic, start, _ in hits] == [
+        ("Viewings", 4), ("Property Search", 9), ("Pricing", 22), ("Location", 40),
+    ]
+    # "tours" and "areas" are other words; "price" must not match inside "prices"
+    assert matcher.topics_in("areas with detours") == set()
+    assert matcher.topics_in("") == set()
+
+
+def test_shipped_taxonomy_keeps_the_original_topics():
+    matcher = get_topic_matcher()
+    assert {"Property Search", "Pricing", "Location", "Viewings"} <= set(matcher.topics)
+    assert matcher.topics_in("Can I schedule a viewing of that home? What's the budget area?") == {
+        "Viewings", "Property Search", "Pricing", "Location",
+    }
+
+
+def test_journey_streams_messages_and_matches_string_and_objectid_refs(monkeypatch, fake_db):
+    user = ObjectId()
+    conv_new, conv_legacy, other = ObjectId(), ObjectId(), ObjectId()
+    fake = fake_db.seed(
+        conversations=[
+            {"_id": conv_new, "user_id": user},
+            {"_id": conv_legacy, "user_id": str(user)},  # legacy string reference
+            {"_id": other, "user_id": ObjectId()},
+        ],
+        messages=[
+            {"conversation_id": conv_new, "role": "user", "content": "Looking for a house, what's the price?"},
+            {"conversation_id": conv_new, "role": "assistant", "content": "Here are some viewings"},
+            {"conversation_id": str(conv_legacy), "role": "user", "content": "Any homes under budget?"},
+            {"conversation_id": conv_legacy, "role": "user", "content": "Can we schedule a tour?"},
+            {"conversation_id": other, "role": "user", "content": "mortgage please"},
+        ],
+        leads=[
+            {"user_id": user, "status": "new"},
+            {"user_id": str(user), "status": "closed"},
+        ],
+    )
+    monkeypatch.setattr(analytics_service, "db", fake)
+    monkeypatch.setattr(analytics_service, "JOURNEY_BATCH", 1)
+
+    insights = asyncio.run(AnalyticsService().get_user_journey_insights(str(user)))
+    assert insights["total_conversations"] == 2
+    assert insights["total_messages"] == 4
+    assert (insights["user_messages"], insights["assistant_messages"]) == (3, 1)
+    assert (insights["total_leads"], insights["active_leads"]) == (2, 1)
+    assert insights["topic_counts"] == {"Property Search": 2, "Pricing": 2, "Viewings": 1}
+    assert insights["common_topics"][:2] == ["Property Search", "Pricing"]
+    # One messages query per batch of conversation ids, streamed rather than loaded whole
+    assert len(fake.messages.calls_to("find")) == 2
+    assert fake.messages.calls_to("to_list") == fake.conversations.calls_to("to_list") == []
@@ -0,0 +1,165 @@
+import asyncio
+import os
+
+from bson import json_util
+
+from app.services import write_behind
+from app.services.write_behind import WriteBehindQueue
+
+
+def test_batches_per_collection_with_read_your_writes(tmp_path, fake_db):
+    async def scenario():
+        queue = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+        await queue.start()
+        first = await queue.insert("messages", {"conversation_id": "c1", "content": "hi"})
+        await queue.insert("messages", {"conversation_id": "c1", "content": "hello"})
+        await queue.upsert("leads", {"user_id": "u1"}, {"$setOnInsert": {"status": "new"}})
+        pending = queue.pending_documents("messages", conversation_id="c1")
+        await queue.flush()
+        after = queue.pending_documents("messages", conversation_id="c1")
+        await queue.stop()
+        return first, pending, after
+
+    first, pending, after = asyncio.run(scenario())
+    assert "_id" in first
+    assert len(pending) == 2 and after == []
+    assert [len(requests) for requests in fake_db.messages.calls_to("bulk_write")] == [2]
+    assert len(fake_db.leads.calls_to("bulk_write")) == 1
+    assert fake_db.messages.docs[0]["_id"] == first["_id"] and fake_db.leads.docs[0]["status"] == "new"
+    assert os.listdir(tmp_path) == []
+
+
+def test_unflushed_ops_are_replayed_after_crash(tmp_path, fake_db):
+    async def crash():
+        queue = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+        await queue.start()
+        await queue.insert("messages", {"conversation_id": "c1", "content": "lost?"})
+        queue._task.cancel()
+        queue._journal.close()
+
+    async def restart():
+        queue = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+        await queue.start()
+        await queue.stop()
+        return queue
+
+    asyncio.run(crash())
+    queue = asyncio.run(restart())
+    assert queue.stats["replayed"] == 1
+    [requests] = fake_db.messages.calls_to("bulk_write")
+    assert requests[0]._doc["content"] == "lost?"
+
+
+def test_updates_to_queued_documents_are_journaled(tmp_path, fake_db):
+    update = {"$inc": {"message_count": 2}, "$set": {"facts.name": "Ana"}}
+
+    async def crash():
+        queue = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+        await queue.start()
+        conv = await queue.insert("conversations", {"message_count": 0})
+        await queue.update("conversations", {"_id": conv["_id"]}, update)
+        await queue.update("conversations", {"_id": conv["_id"]}, update)
+        pending = dict(queue.pending_document("conversations", conv["_id"]))
+        queue._task.cancel()
+        queue._journal.close()
+        return pending
+
+    async def restart():
+        queue = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+        await queue.start()
+        await queue.stop()
+
+    pending = asyncio.run(crash())
+    # Readers see the updates right away; the database gets them from the journal
+    assert pending["message_count"] == 4 and pending["facts"] == {"name": "Ana"}
+    asyncio.run(restart())
+    [doc] = fake_db.conversations.docs
+    assert doc["message_count"] == 4 and doc["facts"] == {"name": "Ana"}
+
+
+def test_torn_and_garbled_journal_lines_do_not_block_startup(tmp_path, fake_db):
+    good = [json_util.dumps({"c": "messages", "op": "insert", "doc": {"_id": i, "content": f"m{i}"}}) for i in range(2)]
+    segment = tmp_path / "journal-1-dead-0-1.sealed"
+    # A garbled line in the middle, and a last line cut off by a crash mid-append
+    segment.write_text(good[0] + "\n{not json\n" + good[1] + "\n" + good[1][:15])
+
+    async def scenario():
+        queue = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+        await queue.start()
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert [doc["content"] for doc in fake_db.messages.docs] == ["m0", "m1"]
+    assert queue.stats["replayed"] == 2 and queue.stats["torn"] == 1 and queue.stats["dead_lettered"] == 1
+    assert os.listdir(tmp_path) == [write_behind.DEAD_LETTER_FILE]
+    with open(tmp_path / write_behind.DEAD_LETTER_FILE) as f:
+        [entry] = [json_util.loads(line) for line in f]
+    assert entry["line"] == "{not json" and entry["journal"] == segment.name
+
+
+def test_replay_errors_are_logged_not_raised(tmp_path, fake_db):
+    (tmp_path / "journal-1-dead-0-1.sealed").write_text(
+        json_util.dumps({"c": "messages", "op": "insert", "doc": {"_id": 1}}) + "\n")
+
+    def down(requests):
+        raise ConnectionError("server selection timeout")
+
+    fake_db.messages.before["bulk_write"] = down
+
+    async def scenario():
+        queue = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+        await queue.start()
+        running = queue.running
+        del fake_db.messages.before["bulk_write"]
+        await queue.stop()
+        return running
+
+    assert asyncio.run(scenario())
+    # Kept for the next start
+    assert "journal-1-dead-0-1.sealed" in os.listdir(tmp_path)
+
+
+def test_live_sibling_journal_is_not_replayed(tmp_path, fake_db):
+    async def scenario():
+        sibling = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+        await sibling.start()
+        await sibling.insert("messages", {"content": "in flight"})
+        starting = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+        await starting.start()
+        # The sibling keeps working: seal, flush and remove its own segment
+        flushed = await sibling.flush()
+        await starting.stop()
+        await sibling.stop()
+        return starting, flushed
+
+    starting, flushed = asyncio.run(scenario())
+    assert starting.stats["replayed"] == 0
+    assert flushed == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_rejected_op_is_retried_then_dead_lettered(tmp_path, monkeypatch, fake_db):
+    monkeypatch.setattr(write_behind, "WRITE_BEHIND_MAX_ATTEMPTS", 2)
+    fake_db.messages.validator = lambda doc: "Document failed validation" if doc.get("content") == "bad" else None
+
+    async def scenario():
+        queue = WriteBehindQueue(journal_dir=str(tmp_path), flush_interval=60, database=fake_db)
+        await queue.start()
+        await queue.insert("messages", {"content": "bad"})
+        await queue.insert("messages", {"content": "good"})
+        first = await queue.flush()
+        retried = len(queue.pending_documents("messages"))
+        second = await queue.flush()
+        third = await queue.flush()
+        await queue.stop()
+        return queue, first, retried, second, third
+
+    queue, first, retried, second, third = asyncio.run(scenario())
+    assert (first, retried, second, third) == (1, 1, 0, 0)
+    assert queue.stats["dead_lettered"] == 1 and queue.pending_documents("messages") == []
+    assert [doc["content"] for doc in fake_db.messages.docs] == ["good"]
+    assert os.listdir(tmp_path) == [write_behind.DEAD_LETTER_FILE]
+    with open(tmp_path / write_behind.DEAD_LETTER_FILE) as f:
+        [entry] = [json_util.loads(line) for line in f]
+    assert entry["op"]["doc"]["content"] == "bad" and entry["op"]["attempts"] == 2
@@ -33,19 +33,18 @@ export default function Dashboard() {
       try {
         setLoading(true)
         
-        // Fetch all analytics data in parallel
-        const [userEngagement, conversationStats, ragMetrics, crmInsights] = await Promise.all([
-          fetch('http://localhost:8000/analytics/user-engagement').then(res => res.json()),
-          fetch('http://localhost:8000/analytics/conversation-stats').then(res => res.json()),
-          fetch('http://localhost:8000/analytics/rag-metrics').then(res => res.json()),
-          fetch('http://localhost:8000/analytics/crm-insights').then(res => res.json())
-        ])
+        // One request; the backend computes all sections concurrently
+        const response = await fetch('http://localhost:8000/analytics/dashboard')
+        if (!response.ok) {
+          throw new Error(`Dashboard request failed: ${response.status}`)
+        }
+        const dashboard = await response.json()
 
         setAnalyticsData({
-          userEngagement,
-          conversationStats,
-          ragMetrics,
-          crmInsights
+          userEngagement: dashboard.user_engagement ?? undefined,
+          conversationStats: dashboard.conversation_stats ?? undefined,
+          ragMetrics: dashboard.rag_metrics ?? undefined,
+          crmInsights: dashboard.crm_insights ?? undefined
         })
       } catch (err) {
         console.error('Error fetching analytics:', err)
@@ -23,13 +23,16 @@ export default function Dashboard() {
   useEffect(() => {
     const fetchAnalytics = async () => {
       try {
-        // Fetch all analytics data from correct endpoints
-        const [userEngagement, conversationStats, ragMetrics, crmInsights] = await Promise.all([
-          fetch('http://localhost:8000/analytics/user-engagement').then(res => res.json()),
-          fetch('http://localhost:8000/analytics/conversation-stats').then(res => res.json()),
-          fetch('http://localhost:8000/analytics/rag-metrics').then(res => res.json()),
-          fetch('http://localhost:8000/analytics/crm-insights').then(res => res.json())
-        ])
+        // Fetch all analytics sections in one request
+        const response = await fetch('http://localhost:8000/analytics/dashboard')
+        if (!response.ok) {
+          throw new Error(`Dashboard request failed: ${response.status}`)
+        }
+        const dashboard = await response.json()
+        const userEngagement = dashboard.user_engagement ?? {}
+        const conversationStats = dashboard.conversation_stats ?? {}
+        const ragMetrics = dashboard.rag_metrics ?? {}
+        const crmInsights = dashboard.crm_insights ?? {}
 
         // Combine all analytics data
         const combinedAnalytics = {